@@ -0,0 +1,118 @@
+"""
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import json
+import logging
+import os
+import sys
+
+import fire
+
+from .suite import get_benchmarks, get_payload_sizes
+
+BASELINE_VERSION = 1
+DEFAULT_BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+# A benchmark fails when it is slower than the baseline by this fraction
+DEFAULT_THRESHOLD = 0.25
+# Differences below this number of seconds are considered noise
+DEFAULT_MIN_DELTA = 0.01
+
+
+def run(baseline=DEFAULT_BASELINE_PATH, threshold=DEFAULT_THRESHOLD,
+        min_delta=DEFAULT_MIN_DELTA, update=False, name=None, output=None):
+    """
+    Runs the benchmarks and compares the timings with the baseline.
+    Exits with 1 when a benchmark regresses beyond the threshold.
+    With update, the timings are written as the new baseline.
+    """
+    logging.basicConfig(level=logging.WARNING)
+    timings = {}
+    for benchmark in get_benchmarks():
+        if name is not None and name not in benchmark.name:
+            continue
+        timings[benchmark.name] = benchmark.run()
+
+    baseline_timings = load_baseline(baseline)
+    regressions = compare(timings, baseline_timings, threshold, min_delta)
+    print_report(timings, baseline_timings, regressions)
+    print_payload_sizes({size_name: size
+                         for size_name, size in get_payload_sizes().items()
+                         if name is None or name in size_name})
+
+    if output is not None:
+        save_baseline(output, timings)
+    if update:
+        baseline_timings.update(timings)
+        save_baseline(baseline, baseline_timings)
+        print('Baseline {} updated'.format(baseline))
+        return
+    if len(regressions) > 0:
+        print('{} benchmarks regressed beyond {:.0%}'.format(
+            len(regressions), threshold))
+        sys.exit(1)
+
+
+def compare(timings, baseline_timings, threshold, min_delta=DEFAULT_MIN_DELTA):
+    regressions = []
+    for name, timing in timings.items():
+        baseline_timing = baseline_timings.get(name)
+        if baseline_timing is None:
+            continue
+        if timing - baseline_timing <= min_delta:
+            continue
+        if timing > baseline_timing * (1 + threshold):
+            regressions.append(name)
+    return regressions
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        baseline = json.load(file)
+    if baseline.get('version') != BASELINE_VERSION:
+        raise ValueError(
+            'Unsupported baseline version {}'.format(baseline.get('version')))
+    return baseline['benchmarks']
+
+
+def save_baseline(path, timings):
+    with open(path, 'w') as file:
+        timings = {name: round(timing, 4) for name, timing in timings.items()}
+        json.dump({'version': BASELINE_VERSION, 'benchmarks': timings},
+                  file, indent=2, sort_keys=True)
+        file.write('\n')
+
+
+def print_report(timings, baseline_timings, regressions):
+    for name, timing in timings.items():
+        baseline_timing = baseline_timings.get(name)
+        line = '{:<55} {:>10.4f}s'.format(name, timing)
+        if baseline_timing is not None:
+            line += ' baseline {:>10.4f}s {:>+8.1%}'.format(
+                baseline_timing, timing / baseline_timing - 1)
+        if name in regressions:
+            line += ' REGRESSION'
+        print(line)
+
+
+def print_payload_sizes(sizes):
+    """
+    Prints each size and the bytes saved compared to the first one.
+    """
+    if len(sizes) == 0:
+        return
+    reference = next(iter(sizes.values()))
+    for name, size in sizes.items():
+        print('{:<55} {:>10} bytes saved {:>10} bytes {:>6.1%}'.format(
+            name, size, reference - size, 1 - size / reference))
+
+
+def main():
+    fire.Fire(run)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,244 @@
+"""
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import base64
+import os
+import pickle
+import tempfile
+import time
+
+from common.api import Nutter
+from common.apiclient import AdaptivePollPolicy
+from common.apiclientresults import ExecuteNotebookResult
+from common.fakeworkspace import FakeWorkspace, FakeWorkspaceServer
+from common.httpretrier import TokenBucket
+from common.resultreports import JunitXMLReportWriter
+from common.resultsview import get_run_results_views
+from common.scheduler import get_scheduler
+from common.testresult import TestResults, TestResult, ZLIB, ZSTD, zstandard
+
+RUN_TESTS_NOTEBOOKS = (10, 100, 1000)
+RUN_TESTS_PARALLELISM = (1, 4, 15)
+TEST_CASES = 10000
+# Test cases of the fixture whose serialized payload is measured
+PAYLOAD_TEST_CASES = 5000
+SCHEDULER_FUNCTIONS = 10000
+# The client side rate limit would dominate the orchestration overhead
+FAKE_WORKSPACE_RATE = 100000
+
+
+class Benchmark(object):
+    """
+    Measures the best wall time, in seconds, of repeat executions of function.
+    setup is called before every execution and its result is passed to
+    function and then to teardown, which are not measured.
+    """
+
+    def __init__(self, name, function, setup=None, teardown=None, repeat=3):
+        self.name = name
+        self.function = function
+        self.setup = setup
+        self.teardown = teardown
+        self.repeat = repeat
+
+    def run(self):
+        timings = []
+        for _ in range(0, self.repeat):
+            args = () if self.setup is None else (self.setup(),)
+            try:
+                started = time.perf_counter()
+                self.function(*args)
+                timings.append(time.perf_counter() - started)
+            finally:
+                if self.teardown is not None:
+                    self.teardown(*args)
+        return min(timings)
+
+
+def get_benchmarks():
+    benchmarks = []
+    for notebooks in RUN_TESTS_NOTEBOOKS:
+        for parallelism in RUN_TESTS_PARALLELISM:
+            benchmarks.append(Benchmark(
+                'run_tests[notebooks={},parallelism={}]'.format(notebooks, parallelism),
+                _run_tests_function(notebooks, parallelism),
+                _start_fake_workspace(notebooks), _stop_fake_workspace,
+                repeat=1 if notebooks >= 1000 else 3))
+
+    benchmarks.append(Benchmark('testresults_serialize[cases={}]'.format(TEST_CASES),
+                                lambda test_results: test_results.serialize(),
+                                lambda: _get_test_results(TEST_CASES)))
+    benchmarks.append(Benchmark('testresults_deserialize[cases={}]'.format(TEST_CASES),
+                                lambda output: TestResults().deserialize(output),
+                                lambda: _get_test_results(TEST_CASES).serialize()))
+    for compression in _get_compressions():
+        benchmarks.append(Benchmark(
+            'testresults_serialize[cases={},compression={}]'.format(
+                PAYLOAD_TEST_CASES, compression),
+            lambda test_results, compression=compression:
+                test_results.serialize(compression),
+            lambda: _get_fixture_results(PAYLOAD_TEST_CASES)))
+        benchmarks.append(Benchmark(
+            'testresults_deserialize[cases={},compression={}]'.format(
+                PAYLOAD_TEST_CASES, compression),
+            lambda output: TestResults().deserialize(output),
+            lambda compression=compression: _get_fixture_results(
+                PAYLOAD_TEST_CASES).serialize(compression)))
+    benchmarks.append(Benchmark('testresults_equals[cases={}]'.format(TEST_CASES),
+                                lambda test_results: test_results[0] == test_results[1],
+                                lambda: (_get_test_results(TEST_CASES),
+                                         _get_test_results(TEST_CASES))))
+    benchmarks.append(Benchmark(
+        'testresults_merge[notebooks=100,cases=100]',
+        _merge_test_results,
+        lambda: [_get_test_results(100) for _ in range(0, 100)]))
+    benchmarks.append(Benchmark(
+        'run_results_view[notebooks=100,cases=100]',
+        lambda results: get_run_results_views(results).get_view(),
+        lambda: _get_execute_notebook_results(100, 100)))
+    benchmarks.append(Benchmark('junit_report_to_file[notebooks=100,cases=100]',
+                                _write_junit_report,
+                                lambda: _get_junit_writer(100, 100)))
+    benchmarks.append(Benchmark('scheduler_run_and_wait[functions={}]'.format(
+                                SCHEDULER_FUNCTIONS),
+                                lambda scheduler: scheduler.run_and_wait(),
+                                lambda: _get_scheduler(SCHEDULER_FUNCTIONS)))
+    return benchmarks
+
+
+def get_payload_sizes():
+    """
+    Returns the size, in bytes, of the serialized results of a fixture by
+    format: the base64 pickle of the previous versions, the JSON and the
+    compressed JSON.
+    """
+    test_results = _get_fixture_results(PAYLOAD_TEST_CASES)
+    name = 'payload_size[cases={},format={}]'
+    sizes = {name.format(PAYLOAD_TEST_CASES, 'pickle'): len(
+        base64.encodebytes(pickle.dumps(test_results)))}
+    sizes[name.format(PAYLOAD_TEST_CASES, 'json')] = len(test_results.serialize())
+    for compression in _get_compressions():
+        sizes[name.format(PAYLOAD_TEST_CASES, 'json+' + compression)] = len(
+            test_results.serialize(compression))
+    return sizes
+
+
+def _get_compressions():
+    if zstandard is None:
+        return [ZLIB]
+    return [ZLIB, ZSTD]
+
+
+def _run_tests_function(notebooks, parallelism):
+    def run_tests(server):
+        nutter = Nutter()
+        nutter.dbclient.rate_limiter = TokenBucket(FAKE_WORKSPACE_RATE)
+        results = nutter.run_tests(
+            '/tests/*', 'cluster', 120, parallelism, True,
+            poll_policy=AdaptivePollPolicy(min_wait=0.01, max_wait=0.05))
+        if len(results) != notebooks:
+            raise AssertionError('Expected {} results, got {}'.format(
+                notebooks, len(results)))
+    return run_tests
+
+
+def _start_fake_workspace(notebooks):
+    def start():
+        workspace = FakeWorkspace.with_test_notebooks(notebooks, folders=10)
+        server = FakeWorkspaceServer(workspace).start()
+        server.environment = {name: os.environ.get(name)
+                              for name in ('DATABRICKS_HOST', 'DATABRICKS_TOKEN')}
+        os.environ['DATABRICKS_HOST'] = server.url
+        os.environ['DATABRICKS_TOKEN'] = 'benchmark'
+        return server
+    return start
+
+
+def _stop_fake_workspace(server):
+    server.stop()
+    for name, value in server.environment.items():
+        if value is None:
+            os.environ.pop(name, None)
+            continue
+        os.environ[name] = value
+
+
+def _get_test_results(test_cases):
+    test_results = TestResults()
+    for index in range(0, test_cases):
+        passed = index % 10 != 0
+        exception = None if passed else AssertionError('failed')
+        test_results.append(TestResult('test_case_{}'.format(index), passed, 0.01,
+                                       ['tag'], exception, 'stack trace'))
+    return test_results
+
+
+def _merge_test_results(all_test_results):
+    merged = TestResults()
+    for test_results in all_test_results:
+        merged.merge(test_results)
+    test_cases = sum(len(test_results.results) for test_results in all_test_results)
+    if merged.test_cases != test_cases:
+        raise AssertionError('Expected {} test cases, got {}'.format(
+            test_cases, merged.test_cases))
+
+
+def _get_fixture_results(test_cases):
+    test_results = TestResults()
+    for index in range(0, test_cases):
+        passed = index % 10 != 0
+        exception = None if passed else AssertionError(
+            'Unexpected result for the case {}'.format(index))
+        stack_trace = '' if passed else _get_stack_trace(index)
+        test_results.append(TestResult('assertion_{}'.format(index), passed, 0.01,
+                                       ['tag'], exception, stack_trace))
+    return test_results
+
+
+def _get_stack_trace(index):
+    # Stack trace of a failed notebook assertion
+    return '\n'.join(
+        '  File "/databricks/driver/test_fixture.py", line {}, in assertion_{}\n'
+        '    assert result_{} == expected, "Unexpected result"'.format(
+            line * 10 + index, index, line)
+        for line in range(0, 15))
+
+
+def _get_execute_notebook_results(notebooks, test_cases):
+    output = _get_test_results(test_cases).serialize()
+    results = []
+    for index in range(0, notebooks):
+        notebook_path = '/tests/test_{}'.format(index)
+        job_output = {'notebook_output': {'result': output},
+                      'metadata': {'state': {'life_cycle_state': 'TERMINATED',
+                                             'result_state': 'SUCCESS'},
+                                   'task': {'notebook_task': {
+                                       'notebook_path': notebook_path}}}}
+        results.append(ExecuteNotebookResult.from_job_output(job_output))
+    return results
+
+
+def _get_junit_writer(notebooks, test_cases):
+    writer = JunitXMLReportWriter()
+    test_results = _get_test_results(test_cases)
+    for index in range(0, notebooks):
+        writer.add_result('/tests/test_{}'.format(index), test_results)
+    return writer
+
+
+def _write_junit_report(writer):
+    with tempfile.TemporaryDirectory() as directory:
+        writer.to_file(os.path.join(directory, 'report.xml'))
+
+
+def _get_scheduler(functions):
+    scheduler = get_scheduler(4)
+    for index in range(0, functions):
+        scheduler.add_function(_noop, index)
+    return scheduler
+
+
+def _noop(value):
+    return value
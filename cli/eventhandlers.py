@@ -47,21 +47,26 @@ class ConsoleEventHandler(EventHandler):
         return '--> {}\n'.format(event_output)
 
     def _get_event_ouput(self, event_instance):
-        if event_instance.event is NutterStatusEvents.TestsListing:
-            return self._handle_testlisting(event_instance)
-        if event_instance.event is NutterStatusEvents.TestsListingFiltered:
-            return self._handle_testlistingfiltered(event_instance)
-        if event_instance.event is NutterStatusEvents.TestsListingResults:
-            return self._handle_testlistingresults(event_instance)
-        if event_instance.event is NutterStatusEvents.TestScheduling:
-            return self._handle_testscheduling(event_instance)
-        if event_instance.event is NutterStatusEvents.TestExecuted:
-            return self._handle_testsexecuted(event_instance)
-        if event_instance.event is NutterStatusEvents.TestExecutionResult:
-            return self._handle_testsexecutionresult(event_instance)
-        if event_instance.event is NutterStatusEvents.TestExecutionRequest:
-            return self._handle_testsexecutionrequest(event_instance)
-        return ''
+        handlers = {
+            NutterStatusEvents.TestsListing: self._handle_testlisting,
+            NutterStatusEvents.TestsListingFiltered: self._handle_testlistingfiltered,
+            NutterStatusEvents.TestsListingResults: self._handle_testlistingresults,
+            NutterStatusEvents.TestScheduling: self._handle_testscheduling,
+            NutterStatusEvents.TestExecuted: self._handle_testsexecuted,
+            NutterStatusEvents.TestExecutionResult: self._handle_testsexecutionresult,
+            NutterStatusEvents.TestExecutionRequest: self._handle_testsexecutionrequest,
+            NutterStatusEvents.CircuitBreakerStateChanged:
+                self._handle_circuitbreakerstatechanged,
+            NutterStatusEvents.RunsCancelled: self._handle_runscancelled,
+            NutterStatusEvents.ConcurrencyChanged: self._handle_concurrencychanged,
+            NutterStatusEvents.ExecutionStopped: self._handle_executionstopped,
+            NutterStatusEvents.ClusterRemoved: self._handle_clusterremoved,
+            NutterStatusEvents.TestsSharded: self._handle_testssharded,
+        }
+        handler = handlers.get(event_instance.event)
+        if handler is None:
+            return ''
+        return handler(event_instance)
 
     def _handle_testlisting(self, event):
         return 'Looking for tests in {}'.format(event.data)
@@ -70,6 +75,12 @@ class ConsoleEventHandler(EventHandler):
         self._filtered_tests = event.data
         return '{} tests matched the pattern'.format(self._filtered_tests)
 
+    def _handle_testssharded(self, event):
+        self._filtered_tests = event.data.num_of_tests
+        return '{} of {} tests in the shard {}/{}, balanced by {}'.format(
+            event.data.num_of_tests, event.data.total_tests, event.data.index,
+            event.data.count, event.data.balance)
+
     def _handle_testlistingresults(self, event):
         return '{} tests found'.format(event.data)
 
@@ -81,6 +92,26 @@ class ConsoleEventHandler(EventHandler):
     def _handle_testsexecutionrequest(self, event):
         return 'Execution request: {}'.format(event.data)
 
+    def _handle_circuitbreakerstatechanged(self, event):
+        return 'Databricks API circuit breaker is {}'.format(event.data)
+
+    def _handle_runscancelled(self, event):
+        output = '{} outstanding runs cancelled'.format(len(event.data.cancelled))
+        if len(event.data.failed) > 0:
+            output += '. Failed to cancel the runs: {}'.format(
+                ', '.join(str(run_id) for run_id in event.data.failed))
+        return output
+
+    def _handle_concurrencychanged(self, event):
+        return 'Parallel tests limit: {}'.format(event.data)
+
+    def _handle_executionstopped(self, event):
+        return 'Execution stopped after {} failures. ' \
+            'The remaining tests are not executed'.format(event.data)
+
+    def _handle_clusterremoved(self, event):
+        return 'Cluster {} removed from the pool'.format(event.data)
+
     def _handle_testscheduling(self, event):
         num_of_tests = self._num_of_test_to_execute()
         self._scheduled_tests += 1
@@ -7,9 +7,18 @@ import fire
 import logging
 import os
 import datetime
+import signal
 
 import common.api as api
+import common.apiclient as apiclient
+import common.runhistory as runhistory
+import common.listingcache as listingcache
+import common.resultsstore as resultsstore
+import common.cassette as cassette
+import common.circuitbreaker as circuitbreaker
+import common.schedulingpolicy as schedulingpolicy
 from common.apiclient import DEFAULT_POLL_WAIT_TIME, InvalidConfigurationException
+from common.authconfig import get_auth_config
 
 import common.resultsview as view
 from .eventhandlers import ConsoleEventHandler
@@ -39,7 +48,13 @@ def get_cli_header():
 
 class NutterCLI(object):
 
-    def __init__(self, debug=False, log_to_file=False, version=False):
+    def __init__(self, debug=False, log_to_file=False, version=False, no_cache=False,
+                 record=None, replay=None, replay_speed=1.0,
+                 circuit_failure_rate=circuitbreaker.DEFAULT_FAILURE_RATE,
+                 circuit_window_size=circuitbreaker.DEFAULT_WINDOW_SIZE,
+                 circuit_open_duration=circuitbreaker.DEFAULT_OPEN_DURATION,
+                 circuit_park=False,
+                 circuit_park_timeout=circuitbreaker.DEFAULT_PARK_TIMEOUT):
         self._logger = logging.getLogger('NutterCLI')
         self._handle_show_version(version)
 
@@ -47,59 +62,202 @@ class NutterCLI(object):
         # by the logging configuration of all the other components
         self._set_debugging(debug, log_to_file)
         self._print_cli_header()
-        self._set_nutter(debug)
+        circuit_breaker = self._get_circuit_breaker(
+            circuit_failure_rate, circuit_window_size, circuit_open_duration,
+            circuit_park, circuit_park_timeout)
+        self._nutter_client = None
+        self._nutter_args = (debug, no_cache, circuit_breaker)
+        self._cassette_args = (record, replay, replay_speed)
+        self._recorder = None
+        self._record_path = record
         super().__init__()
 
+    @property
+    def _nutter(self):
+        # Created on first use, so the commands that do not call the
+        # workspace, e.g. merge_reports, do not need its configuration
+        if self._nutter_client is None:
+            self._set_nutter(*self._nutter_args)
+            self._set_cassette(*self._cassette_args)
+        return self._nutter_client
+
     def run(self, test_pattern, cluster_id,
             timeout=120, junit_report=False,
             tags_report=False, max_parallel_tests=1,
-            recursive=False, poll_wait_time=DEFAULT_POLL_WAIT_TIME, notebook_params=None):
+            recursive=False, poll_wait_time=None,
+            notebook_params=None,
+            poll_policy=None, batch_size=1,
+            listing_concurrency=api.DEFAULT_LISTING_CONCURRENCY,
+            scheduling_policy=schedulingpolicy.LONGEST_FIRST, dry_run=False,
+            fail_fast=False, shard=None, shard_history=None):
+        previous_handlers = self._handle_abort_signals()
         try:
             logging.debug(""" Running tests. test_pattern: {} cluster_id: {}  notebook_params: {} timeout: {}
                                junit_report: {} max_parallel_tests: {}
-                               tags_report: {}  recursive:{} """
-                          .format(test_pattern, cluster_id, timeout,
+                               tags_report: {}  recursive:{} batch_size:{}
+                               scheduling_policy: {} dry_run: {} fail_fast: {}
+                               shard: {} shard_history: {} """
+                          .format(test_pattern, cluster_id, notebook_params, timeout,
                                   junit_report, max_parallel_tests,
-                                  tags_report, recursive, notebook_params))
+                                  tags_report, recursive, batch_size,
+                                  scheduling_policy, dry_run, fail_fast, shard,
+                                  shard_history))
+            shard_history = self._get_shard_history(shard_history)
+
+            if dry_run:
+                schedule_plan = self._nutter.plan_tests(
+                    test_pattern, cluster_id, max_parallel_tests, recursive, batch_size,
+                    listing_concurrency, scheduling_policy, shard, shard_history)
+                self._nutter.events_processor_wait()
+                self._display_schedule_plan(schedule_plan)
+                return
 
             logging.debug("Executing test(s): {}".format(test_pattern))
+            run_poll_policy = apiclient.get_poll_policy(poll_policy, poll_wait_time)
+            if poll_wait_time is None:
+                poll_wait_time = DEFAULT_POLL_WAIT_TIME
 
             if self._is_a_test_pattern(test_pattern):
                 logging.debug('Executing pattern')
-                results = self._nutter.run_tests(
+                results = self._nutter.iter_run_tests(
                     test_pattern, cluster_id, timeout,
-                    max_parallel_tests, recursive, poll_wait_time, notebook_params)
-                self._nutter.events_processor_wait()
+                    max_parallel_tests, recursive, poll_wait_time, notebook_params,
+                    run_poll_policy, batch_size, listing_concurrency, scheduling_policy,
+                    self._get_fail_fast(fail_fast), shard, shard_history)
                 self._handle_results(results, junit_report, tags_report)
                 return
 
             logging.debug('Executing single test')
             result = self._nutter.run_test(test_pattern, cluster_id,
-                                           timeout, poll_wait_time)
+                                           timeout, poll_wait_time,
+                                           poll_policy=run_poll_policy)
 
             self._handle_results([result], junit_report, tags_report)
 
         except Exception as error:
             self._logger.fatal(error)
+            self._cancel_outstanding_runs()
             exit(1)
+        finally:
+            self._restore_signal_handlers(previous_handlers)
+            self._save_cassette()
 
-    def list(self, path, recursive=False):
+    def list(self, path, recursive=False,
+             listing_concurrency=api.DEFAULT_LISTING_CONCURRENCY):
         try:
             logging.debug("Running tests. path: {}".format(path))
-            results = self._nutter.list_tests(path, recursive)
+            results = self._nutter.list_tests(path, recursive, listing_concurrency)
             self._nutter.events_processor_wait()
             self._display_list_results(results)
         except Exception as error:
             self._logger.fatal(error)
             exit(1)
+        finally:
+            self._save_cassette()
+
+    def merge_reports(self, *report_files):
+        """
+        Merges the JUnit (.xml) and tags reports of several runs, e.g. the
+        shards of a suite, into one report of each type.
+        """
+        try:
+            logging.debug('Merging reports: {}'.format(report_files))
+            if len(report_files) == 0:
+                raise ValueError('No report files to merge')
+            report_man = reports.get_report_writer_manager(
+                ReportWriters.JUNIT + ReportWriters.TAGS)
+            for report_file in report_files:
+                report_man.add_report_file(report_file)
+            self._write_reports(report_man)
+        except Exception as error:
+            self._logger.fatal(error)
+            exit(1)
 
-    def _handle_results(self, results, junit_report, tags_report):
-        self._display_test_results(results)
+    def _handle_abort_signals(self):
+        previous_handlers = {}
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                previous_handlers[signum] = signal.signal(signum, self._on_abort_signal)
+            except ValueError:
+                # Signal handlers can only be set from the main thread
+                logging.debug('Unable to handle the signal {}'.format(signum))
+        return previous_handlers
+
+    def _restore_signal_handlers(self, previous_handlers):
+        for signum, handler in previous_handlers.items():
+            signal.signal(signum, handler)
+
+    def _on_abort_signal(self, signum, frame):
+        raise ExecutionAbortedException(
+            'Execution aborted. Signal {} received.'.format(signum))
+
+    def _cancel_outstanding_runs(self):
+        if self._nutter_client is None:
+            return
+        try:
+            self._nutter.cancel_runs()
+            self._nutter.events_processor_wait()
+        except Exception as error:
+            logging.debug('Failed to cancel the outstanding runs. {}'.format(error))
+
+    def _print_cancelled_runs(self):
+        cancelled_runs = self._nutter.cancelled_runs
+        if len(cancelled_runs) == 0:
+            return
+        print('{} runs were cancelled after a timeout or an error: {}'.format(
+            len(cancelled_runs), ', '.join(str(run_id) for run_id in cancelled_runs)))
 
+    def _handle_results(self, results, junit_report, tags_report):
+        """
+        Displays each result as it completes and adds it to a results store,
+        so the results are not kept in memory. The reports are written and
+        the results validated from the store. A failed result is raised
+        once all the results are processed.
+        """
         report_man = self._get_report_writer_manager(junit_report, tags_report)
-        self._handle_reports(report_man, results)
+        self._print_report_providers(report_man)
+        results_view = view.get_run_results_stream_view()
+        error = None
+
+        with resultsstore.get_results_store() as results_store:
+            try:
+                for result in results:
+                    self._nutter.events_processor_wait()
+                    self._display_test_result(results_view, result)
+                    self._warn_if_not_reported(report_man, result)
+                    results_store.add(result)
+            except ExecutionAbortedException:
+                raise
+            except Exception as execution_error:
+                # The results received before the error are still reported
+                error = execution_error
 
-        ExecutionResultsValidator().validate(results)
+            self._nutter.events_processor_wait()
+            view.print_results_view(results_view)
+            self._print_cancelled_runs()
+            self._add_results_to_reports(report_man, results_store)
+            self._write_reports(report_man)
+
+            if error is None:
+                error = self._validate_results(results_store)
+
+        if error is not None:
+            raise error
+
+    def _get_fail_fast(self, fail_fast):
+        # --fail_fast stops on the first failure, --fail_fast=N on the Nth
+        if fail_fast is True:
+            return 1
+        if not fail_fast:
+            return None
+        return int(fail_fast)
+
+    def _validate_results(self, results_store):
+        try:
+            ExecutionResultsValidator().validate(results_store)
+        except Exception as error:
+            return error
+        return None
 
     def _get_report_writer_manager(self, junit_report, tags_report):
         writers = 0
@@ -110,33 +268,42 @@ class NutterCLI(object):
 
         return reports.get_report_writer_manager(writers)
 
-    def _handle_reports(self, report_manager, exec_results):
+    def _print_report_providers(self, report_manager):
         if not report_manager.has_providers():
             logging.debug('No providers were registered.')
             return
         for provider in report_manager.providers_names():
             print('Writing {} report.'.format(provider))
 
-        for exec_result in exec_results:
-            t_result = api.to_testresults(
-                exec_result.notebook_result.exit_output)
-            if t_result is None:
-                print('Warning:')
-                print('\tThe output of {} is missing or the format is invalid.'.format(
-                    exec_result.notebook_path))
-                continue
-            report_manager.add_result(exec_result.notebook_path, t_result)
+    def _warn_if_not_reported(self, report_manager, exec_result):
+        if not report_manager.has_providers():
+            return
+        if exec_result.test_results is None:
+            print('Warning:')
+            print('\tThe output of {} is missing or the format is invalid.'.format(
+                exec_result.notebook_path))
+
+    def _add_results_to_reports(self, report_manager, results_store):
+        if not report_manager.has_providers():
+            return
+        report_manager.add_results(results_store)
 
+    def _write_reports(self, report_manager):
+        if not report_manager.has_providers():
+            return
         for file_name in report_manager.write():
             print('File {} written'.format(file_name))
 
+    def _display_schedule_plan(self, schedule_plan):
+        schedule_plan_view = view.get_schedule_plan_view(schedule_plan)
+        view.print_results_view(schedule_plan_view)
+
     def _display_list_results(self, results):
         list_results_view = view.get_list_results_view(results)
         view.print_results_view(list_results_view)
 
-    def _display_test_results(self, results):
-        results_view = view.get_run_results_views(results)
-        view.print_results_view(results_view)
+    def _display_test_result(self, results_view, result):
+        results_view.add_exec_result(result)
 
     def _is_a_test_pattern(self, pattern):
         segments = pattern.split('/')
@@ -152,14 +319,63 @@ class NutterCLI(object):
     def _print_cli_header(self):
         print(get_cli_header())
 
-    def _set_nutter(self, debug):
+    def _set_nutter(self, debug, no_cache=False, circuit_breaker=None):
         try:
             event_handler = ConsoleEventHandler(debug)
-            self._nutter = api.get_nutter(event_handler)
+            listing_cache = None
+            if not no_cache:
+                listing_cache = self._get_listing_cache()
+            self._nutter_client = api.get_nutter(
+                event_handler, self._get_run_history(), listing_cache, circuit_breaker)
         except InvalidConfigurationException as ex:
             logging.debug(ex)
             self._print_config_error_and_exit()
 
+    def _get_circuit_breaker(self, failure_rate, window_size, open_duration,
+                             park, park_timeout):
+        try:
+            return circuitbreaker.CircuitBreaker(
+                failure_rate=float(failure_rate), window_size=int(window_size),
+                open_duration=float(open_duration), park=bool(park),
+                park_timeout=float(park_timeout))
+        except ValueError as ex:
+            self._logger.fatal(ex)
+            exit(1)
+
+    def _get_run_history(self):
+        config = get_auth_config()
+        if config is None:
+            return None
+        return runhistory.get_run_history(config.host)
+
+    def _get_shard_history(self, shard_history):
+        if shard_history is None:
+            return None
+        config = get_auth_config()
+        scope = None if config is None else config.host
+        return runhistory.get_shard_history(shard_history, scope)
+
+    def _set_cassette(self, record, replay, replay_speed):
+        http_client = self._nutter_client.dbclient.inner_dbclient
+        if replay is not None:
+            logging.debug('Replaying {} at {}x'.format(replay, replay_speed))
+            cassette.replay(http_client, replay, replay_speed)
+            return
+        if record is not None:
+            self._recorder = cassette.record(http_client)
+
+    def _save_cassette(self):
+        if self._recorder is None:
+            return
+        self._recorder.save(self._record_path)
+        print('Databricks API traffic recorded in {}'.format(self._record_path))
+
+    def _get_listing_cache(self):
+        config = get_auth_config()
+        if config is None:
+            return None
+        return listingcache.get_listing_cache(config.host)
+
     def _handle_show_version(self, version):
         if not version:
             return
@@ -188,6 +404,10 @@ class NutterCLI(object):
                 level=logging.DEBUG)
 
 
+class ExecutionAbortedException(Exception):
+    pass
+
+
 def main():
     fire.Fire(NutterCLI)
 
@@ -40,6 +40,28 @@ class ReportWriterManager(object):
             logging.debug('Adding a test result to {} providers.'.format(key))
             provider.add_result(notebook_path, testresult)
 
+    def add_results(self, exec_results):
+        """
+        Adds the test results of the execution results, e.g. a results
+        store. The providers read them one at a time when the reports are
+        written. Results without valid test results are skipped.
+        """
+        for key, provider in self._providers.items():
+            logging.debug('Adding the execution results to {} providers.'.format(key))
+            provider.add_results(exec_results)
+
+    def add_report_file(self, path):
+        """
+        Adds the results of a report written by a provider, e.g. by another
+        shard. The provider is chosen by the extension of the file.
+        """
+        key = ReportWritersTypes.JUNIT if path.lower().endswith('.xml') \
+            else ReportWritersTypes.TAGS
+        if key not in self._providers:
+            raise ValueError('No {} provider for the report {}'.format(key.value, path))
+        logging.debug('Adding the report {} to {} provider.'.format(path, key))
+        self._providers[key].add_report_file(path)
+
     def write(self):
         file_names = []
         for key, provider in self._providers.items():
@@ -4,13 +4,16 @@ Licensed under the MIT license.
 """
 
 from common.apiclientresults import ExecuteNotebookResult
-from common.testresult import TestResults
+from common.resultsstore import ResultsStore
 import logging
 
 
 class ExecutionResultsValidator(object):
     def validate(self, results):
-        if not isinstance(results, list):
+        if isinstance(results, ResultsStore):
+            # Only the results with errors can fail the validation
+            results = results.iter_failed()
+        elif not isinstance(results, list):
             raise ValueError("Invalid results. Expected a list")
 
         for result in results:
@@ -28,16 +31,15 @@ class ExecutionResultsValidator(object):
                 result.notebook_result.result_state)
             raise NotebookExecutionFailureException(message=msg)
 
-        self._validate_test_results(result.notebook_result.exit_output)
+        self._validate_test_results(result)
 
-    def _validate_test_results(self, exit_output):
-        test_results = None
-        try:
-            test_results = TestResults().deserialize(exit_output)
-        except Exception as ex:
-            logging.debug(ex)
+    def _validate_test_results(self, result):
+        test_results = result.test_results
+        if test_results is None:
+            parse_error = result.notebook_result.parse_error
+            logging.debug(parse_error)
             msg = """ The Notebook exit output value is invalid or missing.
-                       Additional info: {} """.format(str(ex))
+                       Additional info: {} """.format(parse_error)
             raise InvalidNotebookOutputException(msg)
 
         for test_result in test_results.results:
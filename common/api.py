@@ -9,6 +9,10 @@ from . import utils
 from .testresult import TestResults
 from . import scheduler
 from . import apiclient
+from . import concurrency
+from . import schedulingpolicy
+from . import clusterpool
+from . import sharding
 from .resultreports import JunitXMLReportWriter, TestResultsReportWriter
 from .statuseventhandler import StatusEventsHandler
 
@@ -17,10 +21,16 @@ import logging
 
 import re
 import importlib
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
 
+DEFAULT_LISTING_CONCURRENCY = 8
+# Threads checking the clusters of the failed runs and submitting them again
+DEFAULT_FAILOVER_CONCURRENCY = 2
 
-def get_nutter(event_handler=None):
-    return Nutter(event_handler)
+
+def get_nutter(event_handler=None, run_history=None, listing_cache=None,
+               circuit_breaker=None):
+    return Nutter(event_handler, run_history, listing_cache, circuit_breaker)
 
 
 def get_junit_writer():
@@ -72,73 +82,249 @@ class Nutter(NutterApi):
     """
     """
 
-    def __init__(self, event_handler=None):
-        self.dbclient = apiclient.databricks_client()
+    def __init__(self, event_handler=None, run_history=None, listing_cache=None,
+                 circuit_breaker=None):
+        # The circuit breaker, see circuitbreaker.CircuitBreaker, sets when
+        # the API calls fail fast or are parked while the API is failing
+        self.dbclient = apiclient.databricks_client(circuit_breaker=circuit_breaker)
+        self.dbclient.listing_cache = listing_cache
         self._events_processor = self._get_status_events_handler(event_handler)
+        self._run_history = run_history
+        self.dbclient.circuit_breaker.add_listener(self._on_circuit_state_changed)
+        # Runs completed by the poller fail over on these threads
+        self._failover_executor = ThreadPoolExecutor(
+            max_workers=DEFAULT_FAILOVER_CONCURRENCY,
+            thread_name_prefix='ClusterFailover')
         super().__init__()
 
-    def list_tests(self, path, recursive=False):
-        tests = []
-        for test in self._list_tests(path, recursive):
-            tests.append(test)
+    def list_tests(self, path, recursive=False,
+                   listing_concurrency=DEFAULT_LISTING_CONCURRENCY):
+        listed_tests = list(self._list_tests(path, recursive, listing_concurrency))
+        # Same order as a sequential depth-first walk of the workspace
+        listed_tests.sort(key=lambda listed_test: listed_test[0])
+        tests = [test for _, test in listed_tests]
 
         self._add_status_event(
             NutterStatusEvents.TestsListingResults, len(tests))
 
         return tests
 
+    def iter_tests(self, path, recursive=False,
+                   listing_concurrency=DEFAULT_LISTING_CONCURRENCY):
+        """
+        Yields the test notebooks as the listing of each directory returns.
+        """
+        for _, test in self._list_tests(path, recursive, listing_concurrency):
+            yield test
+
     def run_test(self, testpath, cluster_id,
-                 timeout=120, pull_wait_time=DEFAULT_POLL_WAIT_TIME, notebook_params=None):
+                 timeout=120, pull_wait_time=DEFAULT_POLL_WAIT_TIME,
+                 notebook_params=None, poll_policy=None):
         self._add_status_event(NutterStatusEvents.TestExecutionRequest, testpath)
         test_notebook = TestNotebook.from_path(testpath)
         if test_notebook is None:
             raise InvalidTestException
-
-        result = self.dbclient.execute_notebook(
-            test_notebook.path, cluster_id,
-            timeout=timeout, pull_wait_time=pull_wait_time, notebook_params=notebook_params)
+        self.dbclient.resume_submissions()
+
+        expected_duration = self._get_expected_duration(test_notebook.path)
+        result = self._execute_on_cluster_pool(
+            clusterpool.get_cluster_pool(cluster_id),
+            lambda cluster_id: self.dbclient.execute_notebook(
+                test_notebook.path, cluster_id,
+                timeout=timeout, pull_wait_time=pull_wait_time,
+                notebook_params=notebook_params, poll_policy=poll_policy,
+                expected_duration=expected_duration)).result()
+        self._record_duration(test_notebook.path, result)
+        self._save_run_history()
 
         return result
 
     def run_tests(self, pattern, cluster_id,
                   timeout=120, max_parallel_tests=1, recursive=False,
-                  poll_wait_time=DEFAULT_POLL_WAIT_TIME, notebook_params=None):
+                  poll_wait_time=DEFAULT_POLL_WAIT_TIME, notebook_params=None,
+                  poll_policy=None, batch_size=1,
+                  listing_concurrency=DEFAULT_LISTING_CONCURRENCY, on_result=None,
+                  scheduling_policy=schedulingpolicy.LISTING_ORDER, fail_fast=None,
+                  shard=None, results_store=None, shard_history=None):
+        """
+        Returns the results of the tests once all of them are executed.
+        on_result is called with each result as it completes.
+        With a results_store, see resultsstore.ResultsStore, each result is
+        added to the store as it completes and the store is returned, so
+        the results are not kept in memory.
+        """
+        results = []
+        if results_store is not None:
+            results = results_store
+        for result in self.iter_run_tests(
+                pattern, cluster_id, timeout, max_parallel_tests, recursive,
+                poll_wait_time, notebook_params, poll_policy, batch_size,
+                listing_concurrency, scheduling_policy, fail_fast, shard,
+                shard_history):
+            if on_result is not None:
+                on_result(result)
+            if results_store is not None:
+                results_store.add(result)
+            else:
+                results.append(result)
 
-        self._add_status_event(NutterStatusEvents.TestExecutionRequest, pattern)
-        root, pattern_to_match = self._get_root_and_pattern(pattern)
+        return results
 
-        tests = self.list_tests(root, recursive)
+    def iter_run_tests(self, pattern, cluster_id,
+                       timeout=120, max_parallel_tests=1, recursive=False,
+                       poll_wait_time=DEFAULT_POLL_WAIT_TIME, notebook_params=None,
+                       poll_policy=None, batch_size=1,
+                       listing_concurrency=DEFAULT_LISTING_CONCURRENCY,
+                       scheduling_policy=schedulingpolicy.LISTING_ORDER, fail_fast=None,
+                       shard=None, shard_history=None):
+        """
+        Yields the result of each test as it completes. If a test cannot
+        be executed, the exception is raised after the other results.
+        With fail_fast, the execution stops after that number of failed
+        notebooks or test cases: the queued tests are not executed and the
+        running tests are cancelled.
+        The cluster_id can be a pool of clusters, see get_cluster_pool: each
+        test runs on the least loaded cluster and a cluster that goes down
+        is removed from the pool.
+        With a shard i/n, only the tests of that shard are executed, see
+        sharding.shard_notebooks. The shards are balanced by the durations of
+        the shard_history, a runhistory.RunHistory shared by all the agents,
+        and by a hash of the notebook paths without it. The local run
+        history is never used to shard, as it differs between agents.
+        A batch of batch_size tests is one multi-task run and takes a single
+        slot of max_parallel_tests: up to max_parallel_tests * batch_size
+        tests can execute at the same time.
+        """
+        if batch_size < 1:
+            raise ValueError('The batch size must be greater than 0')
+        if fail_fast is not None and fail_fast < 1:
+            raise ValueError('The number of failures to stop must be greater than 0')
+        schedulingpolicy.validate_scheduling_policy(scheduling_policy)
+        cluster_pool = clusterpool.get_cluster_pool(cluster_id)
+        if shard is not None:
+            shard = sharding.parse_shard(shard)
+
+        test_notebooks = self._get_tests_to_run(pattern, recursive, listing_concurrency)
+        test_notebooks = self._get_shard_test_notebooks(
+            test_notebooks, shard, shard_history)
+        if len(test_notebooks) == 0:
+            return
 
-        results = []
-        if len(tests) == 0:
-            return results
+        self.dbclient.resume_submissions()
 
-        pattern_matcher = TestNamePatternMatcher(pattern_to_match)
-        filtered_notebooks = pattern_matcher.filter_by_pattern(tests)
-        self._add_status_event(
-            NutterStatusEvents.TestsListingFiltered, len(filtered_notebooks))
+        test_notebooks = self._order_test_notebooks(test_notebooks, scheduling_policy)
+        try:
+            yield from self._schedule_and_run(
+                test_notebooks, cluster_pool, max_parallel_tests, timeout,
+                poll_wait_time, notebook_params, poll_policy, batch_size, fail_fast)
+        finally:
+            self._save_run_history()
+
+    def plan_tests(self, pattern, cluster_id, max_parallel_tests=1, recursive=False,
+                   batch_size=1, listing_concurrency=DEFAULT_LISTING_CONCURRENCY,
+                   scheduling_policy=schedulingpolicy.LISTING_ORDER, shard=None,
+                   shard_history=None):
+        """
+        Returns the predicted schedule of the tests, based on the expected
+        durations from the run history, without executing them.
+        """
+        if batch_size < 1:
+            raise ValueError('The batch size must be greater than 0')
+        schedulingpolicy.validate_scheduling_policy(scheduling_policy)
+        cluster_pool = clusterpool.get_cluster_pool(cluster_id)
+        if shard is not None:
+            shard = sharding.parse_shard(shard)
+
+        test_notebooks = self._get_tests_to_run(pattern, recursive, listing_concurrency)
+        test_notebooks = self._get_shard_test_notebooks(
+            test_notebooks, shard, shard_history)
+        notebook_paths = [test_notebook.path for test_notebook in test_notebooks]
+        durations, unknown = schedulingpolicy.get_expected_durations(
+            self._run_history, notebook_paths)
+        notebook_paths = schedulingpolicy.order_notebooks(
+            notebook_paths, durations, scheduling_policy)
+
+        schedule_plan = schedulingpolicy.plan(
+            schedulingpolicy.to_batches(notebook_paths, batch_size), durations,
+            self._get_planned_parallelism(max_parallel_tests, cluster_pool))
+        schedule_plan.unknown = unknown
+        return schedule_plan
+
+    def cancel_runs(self, timeout=apiclient.DEFAULT_CANCEL_TIMEOUT):
+        """
+        Cancels the runs that are still executing, so the capacity of the
+        cluster is released when the execution is aborted. The runs that
+        are still being submitted are cancelled once submitted.
+        """
+        self.dbclient.stop_submissions()
+        result = self.dbclient.cancel_runs(timeout=timeout)
+        if result.total > 0:
+            self._add_status_event(NutterStatusEvents.RunsCancelled, result)
+        return result
 
-        return self._schedule_and_run(
-            filtered_notebooks, cluster_id, max_parallel_tests, timeout, poll_wait_time, notebook_params)
+    @property
+    def cancelled_runs(self):
+        return self.dbclient.cancelled_runs
 
     def events_processor_wait(self):
         if self._events_processor is None:
             return
         self._events_processor.wait()
 
-    def _list_tests(self, path, recursive):
-        self._add_status_event(NutterStatusEvents.TestsListing, path)
-        workspace_objects = self.dbclient.list_objects(path)
+    def _list_tests(self, path, recursive, listing_concurrency):
+        """
+        Breadth-first listing of the workspace. The directories are listed
+        concurrently and the test notebooks yielded with their sort key:
+        the position of the directory in the tree followed by (0, notebook
+        index) for notebooks and (1, directory index) for directories.
+        """
+        if listing_concurrency < 1:
+            raise ValueError('The listing concurrency must be greater than 0')
+        self.dbclient.set_pool_size(listing_concurrency)
+
+        with ThreadPoolExecutor(max_workers=listing_concurrency) as executor:
+            pending = {self._submit_listing(executor, path, None): ()}
+            try:
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        dir_key = pending.pop(future)
+                        workspace_objects = future.result()
+
+                        notebooks = workspace_objects.test_notebooks
+                        for index, notebook in enumerate(notebooks):
+                            yield dir_key + (0, index), TestNotebook(
+                                notebook.name, notebook.path)
+
+                        if not recursive:
+                            continue
+                        directories = workspace_objects.directories
+                        for index, directory in enumerate(directories):
+                            listing = self._submit_listing(
+                                executor, directory.path,
+                                self._get_modified_at(workspace_objects, directory))
+                            pending[listing] = dir_key + (1, index)
+            finally:
+                for future in pending:
+                    future.cancel()
+        self._save_listing_cache()
+
+    def _get_modified_at(self, workspace_objects, directory):
+        # The modification time of a directory does not change when a
+        # directory below it changes, so only a fresh listing can tell
+        # whether the listings of its directories are still valid
+        if workspace_objects.from_cache:
+            return None
+        return directory.modified_at
 
-        for notebook in workspace_objects.test_notebooks:
-            yield TestNotebook(notebook.name, notebook.path)
+    def _submit_listing(self, executor, path, modified_at):
+        self._add_status_event(NutterStatusEvents.TestsListing, path)
+        return executor.submit(self.dbclient.list_objects, path, modified_at)
 
-        if not recursive:
+    def _save_listing_cache(self):
+        if self.dbclient.listing_cache is None:
             return
-
-        for directory in workspace_objects.directories:
-            for test in self._list_tests(directory.path, True):
-                yield test
+        self.dbclient.listing_cache.save()
 
     def _get_status_events_handler(self, events_handler):
         if events_handler is None:
@@ -167,47 +353,399 @@ class Nutter(NutterApi):
 
         return root, valid_pattern
 
-    def _schedule_and_run(self, test_notebooks, cluster_id,
-                          max_parallel_tests, timeout, pull_wait_time, notebook_params=None):
-        func_scheduler = scheduler.get_scheduler(max_parallel_tests)
-        for test_notebook in test_notebooks:
-            self._add_status_event(
-                NutterStatusEvents.TestScheduling, test_notebook.path)
-            logging.debug(
-                'Scheduling execution of: {}'.format(test_notebook.path))
-            func_scheduler.add_function(self._execute_notebook,
-                                        test_notebook.path, cluster_id, timeout, pull_wait_time, notebook_params)
-        return self._run_and_await(func_scheduler)
-
-    def _execute_notebook(self, test_notebook_path, cluster_id, timeout, pull_wait_time, notebook_params=None):
-        result = self.dbclient.execute_notebook(test_notebook_path,
-                                                cluster_id, timeout, pull_wait_time, notebook_params)
-        self._add_status_event(NutterStatusEvents.TestExecuted,
-                               ExecutionResultEventData.from_execution_results(result))
+    def _get_tests_to_run(self, pattern, recursive, listing_concurrency):
+        self._add_status_event(NutterStatusEvents.TestExecutionRequest, pattern)
+        root, pattern_to_match = self._get_root_and_pattern(pattern)
+
+        tests = self.list_tests(root, recursive, listing_concurrency)
+
+        if len(tests) == 0:
+            return tests
+
+        pattern_matcher = TestNamePatternMatcher(pattern_to_match)
+        filtered_notebooks = pattern_matcher.filter_by_pattern(tests)
+        self._add_status_event(
+            NutterStatusEvents.TestsListingFiltered, len(filtered_notebooks))
+        return filtered_notebooks
+
+    def _get_shard_test_notebooks(self, test_notebooks, shard, shard_history=None):
+        if shard is None:
+            return test_notebooks
+        index, count = shard
+        shard_paths, balance = sharding.shard_notebooks(
+            [test_notebook.path for test_notebook in test_notebooks], index, count,
+            shard_history)
+        shard_paths = set(shard_paths)
+        shard_notebooks = [test_notebook for test_notebook in test_notebooks
+                           if test_notebook.path in shard_paths]
+        self._add_status_event(NutterStatusEvents.TestsSharded, ShardEventData(
+            index, count, len(shard_notebooks), len(test_notebooks), balance))
+        return shard_notebooks
+
+    def _order_test_notebooks(self, test_notebooks, scheduling_policy):
+        if scheduling_policy == schedulingpolicy.LISTING_ORDER:
+            return test_notebooks
+        notebook_paths = [test_notebook.path for test_notebook in test_notebooks]
+        durations, _ = schedulingpolicy.get_expected_durations(
+            self._run_history, notebook_paths)
+        ordered_paths = schedulingpolicy.order_notebooks(
+            notebook_paths, durations, scheduling_policy)
+        order = {notebook_path: index
+                 for index, notebook_path in enumerate(ordered_paths)}
+        return sorted(test_notebooks,
+                      key=lambda test_notebook: order[test_notebook.path])
+
+    def _get_planned_parallelism(self, max_parallel_tests, cluster_pool):
+        if max_parallel_tests != concurrency.AUTO_PARALLELISM:
+            return max_parallel_tests
+        # The auto parallelism is at most the number of cores of the clusters
+        cores = self._get_cluster_pool_cores(cluster_pool)
+        if cores is None:
+            return concurrency.DEFAULT_MAX_LIMIT
+        return max(1, min(cores, scheduler.MAX_NUM_IN_FLIGHT))
+
+    def _get_cluster_pool_cores(self, cluster_pool):
+        # None when the cores of any cluster are unknown
+        total_cores = 0
+        for cluster_id in cluster_pool.cluster_ids:
+            cores = self.dbclient.get_cluster_cores(cluster_id)
+            if cores is None:
+                return None
+            total_cores += cores
+        return total_cores
+
+    def _schedule_and_run(self, test_notebooks, cluster_pool,
+                          max_parallel_tests, timeout, pull_wait_time,
+                          notebook_params=None, poll_policy=None, batch_size=1,
+                          fail_fast=None):
+        controller = None
+        if max_parallel_tests == concurrency.AUTO_PARALLELISM:
+            controller = self._get_concurrency_controller(cluster_pool)
+            func_scheduler = self._get_scheduler(controller.limit, asynchronous=True)
+            controller.add_listener(
+                lambda limit, reason: func_scheduler.set_max_in_flight(limit))
+        else:
+            func_scheduler = self._get_scheduler(max_parallel_tests)
+
+        if controller is not None:
+            self.dbclient.add_call_listener(controller.on_api_call)
+        try:
+            if batch_size > 1:
+                yield from self._schedule_and_run_batches(
+                    func_scheduler, controller, test_notebooks, cluster_pool, timeout,
+                    pull_wait_time, notebook_params, poll_policy, batch_size, fail_fast)
+                return
+
+            function = self._execute_notebook
+            if isinstance(func_scheduler, scheduler.EventScheduler):
+                function = self._execute_notebook_async
+            for test_notebook in test_notebooks:
+                self._add_status_event(
+                    NutterStatusEvents.TestScheduling, test_notebook.path)
+                logging.debug(
+                    'Scheduling execution of: {}'.format(test_notebook.path))
+                self._add_function(func_scheduler, controller, function,
+                                   test_notebook.path, cluster_pool, timeout,
+                                   pull_wait_time, notebook_params, poll_policy)
+            yield from self._run_iter(func_scheduler, fail_fast)
+        finally:
+            if controller is not None:
+                self.dbclient.remove_call_listener(controller.on_api_call)
+
+    def _get_scheduler(self, max_parallel_tests, asynchronous=False):
+        """
+        Runs with more parallel tests than scheduler workers are kept in
+        flight by the event scheduler, without a thread per test.
+        """
+        if not asynchronous and max_parallel_tests <= scheduler.MAX_NUM_OF_WORKERS:
+            self.dbclient.set_pool_size(max_parallel_tests)
+            return scheduler.get_scheduler(max_parallel_tests)
+        self.dbclient.set_pool_size(
+            scheduler.DEFAULT_NUM_OF_DISPATCHERS + apiclient.DEFAULT_POLL_CONCURRENCY)
+        return scheduler.get_event_scheduler(max_parallel_tests)
+
+    def _schedule_and_run_batches(self, func_scheduler, controller, test_notebooks,
+                                  cluster_pool, timeout, pull_wait_time,
+                                  notebook_params, poll_policy, batch_size,
+                                  fail_fast=None):
+        function = self._execute_notebooks
+        if isinstance(func_scheduler, scheduler.EventScheduler):
+            function = self._execute_notebooks_async
+        for index in range(0, len(test_notebooks), batch_size):
+            batch = [test_notebook.path for test_notebook
+                     in test_notebooks[index:index + batch_size]]
+            for test_notebook_path in batch:
+                self._add_status_event(
+                    NutterStatusEvents.TestScheduling, test_notebook_path)
+            logging.debug('Scheduling execution of batch: {}'.format(batch))
+            self._add_function(func_scheduler, controller, function,
+                               batch, cluster_pool, timeout, pull_wait_time,
+                               notebook_params, poll_policy)
+        yield from self._run_iter(func_scheduler, fail_fast)
+
+    def _add_function(self, func_scheduler, controller, function, *args):
+        if controller is None:
+            func_scheduler.add_function(function, *args)
+            return
+        # The function waits for a slot of the controller before executing
+        func_scheduler.add_function(
+            concurrency.run_with_slot, controller, function, *args)
+
+    def _get_concurrency_controller(self, cluster_pool):
+        controller = concurrency.ConcurrencyController(
+            max_limit=scheduler.MAX_NUM_IN_FLIGHT)
+        controller.add_listener(self._on_concurrency_changed)
+        self._on_concurrency_changed(controller.limit, 'initial')
+        cores = self._get_cluster_pool_cores(cluster_pool)
+        if cores is not None:
+            controller.set_max_limit(min(cores, controller.max_limit), 'cluster cores')
+        return controller
+
+    def _on_concurrency_changed(self, limit, reason):
+        self._add_status_event(NutterStatusEvents.ConcurrencyChanged,
+                               '{} ({})'.format(limit, reason))
+
+    def _execute_notebook(self, test_notebook_path, cluster_pool, timeout,
+                          pull_wait_time, notebook_params=None, poll_policy=None):
+        expected_duration = self._get_expected_duration(test_notebook_path)
+        result = self._execute_on_cluster_pool(
+            cluster_pool, lambda cluster_id: self.dbclient.execute_notebook(
+                test_notebook_path, cluster_id, timeout, pull_wait_time,
+                notebook_params, poll_policy, expected_duration)).result()
+        return self._on_notebook_executed(test_notebook_path, result)
+
+    def _execute_notebook_async(self, test_notebook_path, cluster_pool, timeout,
+                                pull_wait_time, notebook_params=None, poll_policy=None):
+        expected_duration = self._get_expected_duration(test_notebook_path)
+        future = self._execute_on_cluster_pool(
+            cluster_pool, lambda cluster_id: self.dbclient.execute_notebook_async(
+                test_notebook_path, cluster_id, timeout, pull_wait_time,
+                notebook_params, poll_policy, expected_duration),
+            self._failover_executor)
+        return apiclient.chain_future(
+            future,
+            lambda result: self._on_notebook_executed(test_notebook_path, result))
+
+    def _on_notebook_executed(self, test_notebook_path, result):
+        self._record_duration(test_notebook_path, result)
+        self._add_status_event(
+            NutterStatusEvents.TestExecuted,
+            ExecutionResultEventData.from_execution_results(result))
         logging.debug('Executed: {}'.format(test_notebook_path))
         return result
 
-    def _run_and_await(self, func_scheduler):
-        logging.debug('Scheduler run and wait.')
-        func_results = func_scheduler.run_and_wait()
-        return self.__process_func_results(func_results)
-
-    def __process_func_results(self, func_results):
-        results = []
-        for func_result in func_results:
-            self._inspect_result(func_result)
-            results.append(func_result.func_result)
+    def _execute_notebooks(self, test_notebook_paths, cluster_pool, timeout,
+                           pull_wait_time, notebook_params=None, poll_policy=None):
+        expected_duration = self._get_batch_expected_duration(test_notebook_paths)
+        results = self._execute_on_cluster_pool(
+            cluster_pool, lambda cluster_id: self.dbclient.execute_notebooks(
+                test_notebook_paths, cluster_id, timeout, pull_wait_time,
+                notebook_params, poll_policy, expected_duration)).result()
+        return self._on_notebooks_executed(test_notebook_paths, results)
+
+    def _execute_notebooks_async(self, test_notebook_paths, cluster_pool, timeout,
+                                 pull_wait_time, notebook_params=None,
+                                 poll_policy=None):
+        expected_duration = self._get_batch_expected_duration(test_notebook_paths)
+        future = self._execute_on_cluster_pool(
+            cluster_pool, lambda cluster_id: self.dbclient.execute_notebooks_async(
+                test_notebook_paths, cluster_id, timeout, pull_wait_time,
+                notebook_params, poll_policy, expected_duration),
+            self._failover_executor)
+        return apiclient.chain_future(
+            future,
+            lambda results: self._on_notebooks_executed(test_notebook_paths, results))
+
+    def _on_notebooks_executed(self, test_notebook_paths, results):
+        for result in results:
+            self._record_duration(result.notebook_path, result)
+            self._add_status_event(
+                NutterStatusEvents.TestExecuted,
+                ExecutionResultEventData.from_execution_results(result))
+        logging.debug('Executed: {}'.format(test_notebook_paths))
         return results
 
+    def _execute_on_cluster_pool(self, cluster_pool, execute, executor=None):
+        """
+        Executes on the least loaded cluster of the pool. execute is called
+        with the cluster id and returns the result or a future of the result.
+        When the execution fails and its cluster is down, the cluster is
+        removed from the pool and the execution is submitted again to
+        another cluster. Returns a future of the result.
+        The state of the cluster is retrieved and the execution submitted
+        again on the executor when one is given, otherwise on the thread
+        that completes the execution, e.g. the poller for a future.
+        """
+        execution = _ClusterPoolExecution(
+            cluster_pool, execute, self._is_cluster_error,
+            self._remove_cluster_if_down, executor)
+        execution.submit()
+        return execution.future
+
+    def _is_cluster_error(self, execution):
+        if execution.exception() is not None:
+            return True
+        results = execution.result()
+        if not isinstance(results, list):
+            results = [results]
+        return any(result.is_error for result in results)
+
+    def _remove_cluster_if_down(self, cluster_pool, cluster_id):
+        if cluster_id not in cluster_pool:
+            # Removed after another execution failed on it
+            return True
+        if len(cluster_pool) == 1:
+            return False
+        state = self.dbclient.get_cluster_state(cluster_id)
+        if clusterpool.is_available_state(state):
+            return False
+        if not cluster_pool.remove(cluster_id):
+            return cluster_id not in cluster_pool
+        self._add_status_event(NutterStatusEvents.ClusterRemoved,
+                               '{} ({})'.format(cluster_id, state or 'unavailable'))
+        return True
+
+    def _on_circuit_state_changed(self, state):
+        self._add_status_event(
+            NutterStatusEvents.CircuitBreakerStateChanged, state.name)
+
+    def _get_expected_duration(self, test_notebook_path):
+        if self._run_history is None:
+            return None
+        return self._run_history.expected_duration(test_notebook_path)
+
+    def _get_batch_expected_duration(self, test_notebook_paths):
+        # The notebooks of a batch run in parallel
+        durations = [self._get_expected_duration(test_notebook_path)
+                     for test_notebook_path in test_notebook_paths]
+        if None in durations:
+            return None
+        return max(durations)
+
+    def _record_duration(self, test_notebook_path, result):
+        if self._run_history is None or result.is_error:
+            return
+        self._run_history.record(test_notebook_path, result.duration)
+
+    def _save_run_history(self):
+        if self._run_history is None:
+            return
+        self._run_history.save()
+
+    def _run_iter(self, func_scheduler, fail_fast=None):
+        logging.debug('Scheduler run.')
+        exception = None
+        failures = 0
+        stopped = False
+        func_results = func_scheduler.run_iter()
+        try:
+            for func_result in func_results:
+                self._inspect_result(func_result)
+                if func_result.exception is not None:
+                    exception = exception or func_result.exception
+                    failures += 1
+                else:
+                    for result in self._to_results(func_result):
+                        failures += result.failures
+                        yield result
+                if fail_fast is not None and failures >= fail_fast:
+                    stopped = True
+                    break
+        finally:
+            # The functions not started are discarded and the functions
+            # being executed have returned, so no run is submitted after
+            # the runs are cancelled
+            func_results.close()
+
+        if stopped:
+            self._stop_on_failures(failures)
+        if exception is not None:
+            raise exception
+
+    def _to_results(self, func_result):
+        # Batches return one result per notebook
+        if isinstance(func_result.func_result, list):
+            return func_result.func_result
+        return [func_result.func_result]
+
+    def _stop_on_failures(self, failures):
+        logging.debug('Execution stopped after {} failures'.format(failures))
+        self._add_status_event(NutterStatusEvents.ExecutionStopped, failures)
+        self.cancel_runs()
+
     def _inspect_result(self, func_result):
         logging.debug('Processing function results.')
 
-        self._add_status_event(NutterStatusEvents.TestExecutionResult, '{}'.format(
-            func_result.exception is not None))
+        executions = 1
+        if isinstance(func_result.func_result, list):
+            executions = len(func_result.func_result)
+        for _ in range(executions):
+            self._add_status_event(NutterStatusEvents.TestExecutionResult, '{}'.format(
+                func_result.exception is not None))
 
         if func_result.exception is not None:
             logging.debug('Exception:{}'.format(func_result.exception))
-            raise func_result.exception
+
+
+class _ClusterPoolExecution(object):
+    """
+    An execution on a cluster pool that is submitted again to another cluster
+    when its cluster is down. The future is completed with the result.
+    """
+
+    def __init__(self, cluster_pool, execute, is_cluster_error,
+                 remove_cluster_if_down, executor=None):
+        self.future = Future()
+        self._cluster_pool = cluster_pool
+        self._execute = execute
+        self._is_cluster_error = is_cluster_error
+        self._remove_cluster_if_down = remove_cluster_if_down
+        self._executor = executor
+
+    def submit(self):
+        cluster_id = self._cluster_pool.acquire()
+        execution = self._start(cluster_id)
+        execution.add_done_callback(
+            lambda execution: self._on_executed(cluster_id, execution))
+
+    def _start(self, cluster_id):
+        execution = Future()
+        try:
+            result = self._execute(cluster_id)
+        except Exception as ex:
+            execution.set_exception(ex)
+            return execution
+        if isinstance(result, Future):
+            return result
+        execution.set_result(result)
+        return execution
+
+    def _on_executed(self, cluster_id, execution):
+        self._cluster_pool.release(cluster_id)
+        if not self._is_cluster_error(execution):
+            self.future.set_result(execution.result())
+            return
+        if self._executor is None:
+            self._fail_over(cluster_id, execution)
+            return
+        try:
+            self._executor.submit(self._fail_over, cluster_id, execution)
+        except RuntimeError as ex:
+            # The executor is shut down
+            self.future.set_exception(ex)
+
+    def _fail_over(self, cluster_id, execution):
+        try:
+            if self._remove_cluster_if_down(self._cluster_pool, cluster_id):
+                self.submit()
+                return
+        except Exception as ex:
+            self.future.set_exception(ex)
+            return
+        if execution.exception() is not None:
+            self.future.set_exception(execution.exception())
+            return
+        self.future.set_result(execution.result())
 
 
 class TestNotebook(object):
@@ -296,6 +834,15 @@ class ExecutionResultEventData():
             return cls(notebook_path, success, notebook_run_page_url)
 
 
+class ShardEventData():
+    def __init__(self, index, count, num_of_tests, total_tests, balance):
+        self.index = index
+        self.count = count
+        self.num_of_tests = num_of_tests
+        self.total_tests = total_tests
+        self.balance = balance
+
+
 class NutterStatusEvents(enum.Enum):
     TestExecutionRequest = 1
     TestsListing = 2
@@ -304,6 +851,12 @@ class NutterStatusEvents(enum.Enum):
     TestScheduling = 5
     TestExecuted = 6
     TestExecutionResult = 7
+    CircuitBreakerStateChanged = 8
+    RunsCancelled = 9
+    ConcurrencyChanged = 10
+    ExecutionStopped = 11
+    ClusterRemoved = 12
+    TestsSharded = 13
 
 
 class InvalidTestException(Exception):
@@ -5,72 +5,268 @@ Licensed under the MIT license.
 
 import uuid
 import time
-from databricks_api import DatabricksAPI
-from . import authconfig as cfg, utils
-from .apiclientresults import ExecuteNotebookResult, WorkspacePath
-from .httpretrier import HTTPRetrier
+import random
+import threading
+from abc import abstractmethod, ABCMeta
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from . import authconfig as cfg, utils, httpclient
+from .apiclientresults import ExecuteNotebookResult, WorkspacePath, CancelRunsResult
+from .httpretrier import HTTPRetrier, RetryPolicy
+from .circuitbreaker import CircuitBreaker
 import logging
 
 DEFAULT_POLL_WAIT_TIME = 5
+DEFAULT_MIN_POLL_WAIT_TIME = 1
+DEFAULT_MAX_POLL_WAIT_TIME = 60
+DEFAULT_POLL_CONCURRENCY = 4
+# Threads downloading the outputs of the runs, out of the poller thread
+DEFAULT_OUTPUT_CONCURRENCY = 4
+SUBMIT_MAX_RETRIES = 5
+CANCEL_MAX_RETRIES = 2
+DEFAULT_CANCEL_TIMEOUT = 30
+DEFAULT_CANCEL_CONCURRENCY = 8
 MIN_TIMEOUT = 10
 
-def databricks_client():
+# As per:
+# https://docs.azuredatabricks.net/api/latest/jobs.html#jobsrunlifecyclestate
+# All these are terminal states
+TERMINAL_STATES = ('TERMINATED', 'SKIPPED', 'INTERNAL_ERROR')
 
-    db = DatabricksAPIClient()
+def databricks_client(pool_size=httpclient.DEFAULT_POOL_SIZE, circuit_breaker=None):
+
+    db = DatabricksAPIClient(pool_size, circuit_breaker)
 
     return db
 
 
+def get_poll_policy(name=None, pull_wait_time=None):
+    if name is None:
+        # An explicit wait time asks for a fixed polling interval
+        name = 'adaptive' if pull_wait_time is None else 'fixed'
+    if pull_wait_time is None:
+        pull_wait_time = DEFAULT_POLL_WAIT_TIME
+    if name == 'adaptive':
+        return AdaptivePollPolicy()
+    if name == 'fixed':
+        return FixedPollPolicy(pull_wait_time)
+    raise ValueError(
+        'Invalid poll policy {}. Valid values are adaptive and fixed'.format(name))
+
+
+class PollPolicy(object):
+    """
+    Decides how long to wait before polling the state of a run again.
+    """
+
+    __metaclass__ = ABCMeta
+
+    @abstractmethod
+    def next_wait(self, tracked_run):
+        pass
+
+
+class FixedPollPolicy(PollPolicy):
+    def __init__(self, pull_wait_time=DEFAULT_POLL_WAIT_TIME):
+        if pull_wait_time <= 1:
+            pull_wait_time = DEFAULT_POLL_WAIT_TIME
+        self.pull_wait_time = pull_wait_time
+
+    def next_wait(self, tracked_run):
+        return self.pull_wait_time
+
+
+class AdaptivePollPolicy(PollPolicy):
+    """
+    Polls quickly after submit and after every life cycle state change, and
+    backs off exponentially with jitter while the state stays the same.
+    When the expected duration of the run is known, it sleeps until shortly
+    before the expected finish.
+    """
+
+    def __init__(self, min_wait=DEFAULT_MIN_POLL_WAIT_TIME,
+                 max_wait=DEFAULT_MAX_POLL_WAIT_TIME,
+                 backoff=2, jitter=0.2, lead_time=0.1):
+        if min_wait <= 0 or max_wait < min_wait:
+            raise ValueError('Invalid wait times. min:{} max:{}'.format(
+                min_wait, max_wait))
+        self.min_wait = min_wait
+        self.max_wait = max_wait
+        self.backoff = backoff
+        self.jitter = jitter
+        # Fraction of the expected duration to wake up before the expected finish
+        self.lead_time = lead_time
+
+    def next_wait(self, tracked_run):
+        if tracked_run.life_cycle_state == 'RUNNING' and \
+                tracked_run.expected_duration is not None:
+            wake_up_at = tracked_run.expected_duration * (1 - self.lead_time)
+            until_wake_up = wake_up_at - tracked_run.elapsed
+            if until_wake_up > self.min_wait:
+                return until_wake_up
+
+        wait = self.min_wait * (self.backoff ** tracked_run.polls_in_state)
+        wait = min(wait, self.max_wait)
+        return wait * random.uniform(1 - self.jitter, 1)
+
+
 class DatabricksAPIClient(object):
     """
     """
 
-    def __init__(self):
+    def __init__(self, pool_size=httpclient.DEFAULT_POOL_SIZE, circuit_breaker=None):
         config = cfg.get_auth_config()
         self.min_timeout = MIN_TIMEOUT
 
         if config is None:
             raise InvalidConfigurationException
 
-        # TODO: remove the dependency with this API, an instead use httpclient/requests
-        db = DatabricksAPI(host=config.host,
-                           token=config.token)
+        db = httpclient.get_http_client(
+            config.host, config.token,
+            pool_size + DEFAULT_POLL_CONCURRENCY + DEFAULT_OUTPUT_CONCURRENCY)
         self.inner_dbclient = db
 
-        # The retrier uses the recommended defaults
+        # A single circuit breaker is shared by all the threads using this client
+        if circuit_breaker is None:
+            circuit_breaker = CircuitBreaker()
+        self.circuit_breaker = circuit_breaker
+
+        # Submits are retried fewer times than polls, the idempotency token
+        # of the submit guarantees that a retry does not launch a second run.
         # https://docs.microsoft.com/en-us/azure/databricks/dev-tools/api/latest/jobs
-        self._retrier = HTTPRetrier()
+        self._retrier = HTTPRetrier(policies={
+            'submit_run': RetryPolicy(max_retries=SUBMIT_MAX_RETRIES),
+            'submit_multi_task_run': RetryPolicy(max_retries=SUBMIT_MAX_RETRIES),
+            'cancel_run': RetryPolicy(max_retries=CANCEL_MAX_RETRIES)},
+            circuit_breaker=circuit_breaker)
+
+        # A single poller tracks the state of all the runs submitted by this client
+        self._poller = RunStatusPoller(self._get_run)
+        self._bytes_received = {}
+        self._bytes_lock = threading.Lock()
+
+        self.listing_cache = None
+
+        # Runs submitted by this client that have not been seen in a terminal state
+        self._submitted_runs = set()
+        self._cancelled_runs = []
+        self._submissions_stopped = False
+        self._runs_lock = threading.Lock()
+        self._canceller = ThreadPoolExecutor(max_workers=DEFAULT_CANCEL_CONCURRENCY)
+        # The outputs are downloaded and parsed on these threads, so a large
+        # output does not delay the polls and timeouts of the other runs
+        self._output_fetcher = ThreadPoolExecutor(
+            max_workers=DEFAULT_OUTPUT_CONCURRENCY, thread_name_prefix='RunOutput')
+
+    def add_call_listener(self, listener):
+        """
+        The listener is called after every API call with the name of the
+        called function, its latency and whether it was throttled or failed.
+        """
+        self._retrier.add_listener(listener)
+
+    def remove_call_listener(self, listener):
+        self._retrier.remove_listener(listener)
+
+    def get_cluster_cores(self, cluster_id):
+        try:
+            cluster = self._retrier.execute(
+                self.inner_dbclient.clusters.get, cluster_id)
+        except Exception as ex:
+            logging.debug('Failed to get the cluster {}. {}'.format(cluster_id, ex))
+            return None
+        cores = cluster.get('cluster_cores')
+        if cores is None:
+            return None
+        return int(cores)
+
+    def get_cluster_state(self, cluster_id):
+        """
+        Returns the state of the cluster, e.g. RUNNING or TERMINATED, or
+        None if the cluster cannot be retrieved.
+        """
+        try:
+            cluster = self._retrier.execute(
+                self.inner_dbclient.clusters.get, cluster_id)
+        except Exception as ex:
+            logging.debug('Failed to get the cluster {}. {}'.format(cluster_id, ex))
+            return None
+        return cluster.get('state')
+
+    @property
+    def rate_limiter(self):
+        return self._retrier.rate_limiter
+
+    @rate_limiter.setter
+    def rate_limiter(self, rate_limiter):
+        self._retrier.rate_limiter = rate_limiter
+
+    @property
+    def outstanding_runs(self):
+        with self._runs_lock:
+            return sorted(self._submitted_runs)
+
+    @property
+    def cancelled_runs(self):
+        with self._runs_lock:
+            return list(self._cancelled_runs)
+
+    def set_pool_size(self, pool_size):
+        # The poller and output threads share the same pool as the submitting threads
+        self.inner_dbclient.set_pool_size(
+            pool_size + DEFAULT_POLL_CONCURRENCY + DEFAULT_OUTPUT_CONCURRENCY)
 
     def list_notebooks(self, path):
         workspace_objects = self.list_objects(path)
         notebooks = workspace_objects.notebooks
         return notebooks
 
-    def list_objects(self, path):
-        objects = self.inner_dbclient.workspace.list(path)
+    def list_objects(self, path, modified_at=None):
+        """
+        Lists the directory. When a listing cache is set and the modification
+        time of the directory is known, the listing is served from the cache
+        while the directory is unchanged.
+        """
+        objects = None
+        if self.listing_cache is not None:
+            objects = self.listing_cache.get(path, modified_at)
+        from_cache = objects is not None
+        if objects is None:
+            objects = self.inner_dbclient.workspace.list(path)
+            if self.listing_cache is not None:
+                self.listing_cache.put(path, modified_at, objects)
         logging.debug('Creating WorkspacePath for path {}'.format(path))
         logging.debug('List response: \n\t{}'.format(objects))
 
         workspace_path_obj = WorkspacePath.from_api_response(objects)
+        workspace_path_obj.from_cache = from_cache
         logging.debug('WorkspacePath created')
 
         return workspace_path_obj
 
     def execute_notebook(self, notebook_path, cluster_id, timeout=120,
                          pull_wait_time=DEFAULT_POLL_WAIT_TIME,
-                         notebook_params=None):
+                         notebook_params=None, poll_policy=None,
+                         expected_duration=None):
+        future = self.execute_notebook_async(
+            notebook_path, cluster_id, timeout, pull_wait_time, notebook_params,
+            poll_policy, expected_duration)
+
+        return future.result()
+
+    def execute_notebook_async(self, notebook_path, cluster_id, timeout=120,
+                               pull_wait_time=DEFAULT_POLL_WAIT_TIME,
+                               notebook_params=None, poll_policy=None,
+                               expected_duration=None):
+        """
+        Submits the notebook and returns a future that completes with
+        the ExecuteNotebookResult once the run reaches a terminal state.
+        If no poll policy is provided, the run is polled every pull_wait_time.
+        """
         if not notebook_path:
             raise ValueError("empty path")
-        if not cluster_id:
-            raise ValueError("empty cluster id")
-        if timeout < self.min_timeout:
-            raise ValueError(
-                "Timeout must be greater than {}".format(self.min_timeout))
-        if notebook_params is not None:
-            if not isinstance(notebook_params, dict):
-                raise ValueError("Parameters must be in the form of a dictionary (See #run-single-test-notebook section in README)")
-        if pull_wait_time <= 1:
-            pull_wait_time = DEFAULT_POLL_WAIT_TIME
+        self._validate_execution(cluster_id, timeout, notebook_params)
+        if poll_policy is None:
+            poll_policy = FixedPollPolicy(pull_wait_time)
 
         name = str(uuid.uuid1())
         ntask = self.__get_notebook_task(notebook_path, notebook_params)
@@ -79,45 +275,241 @@ class DatabricksAPIClient(object):
                                       run_name=name,
                                       existing_cluster_id=cluster_id,
                                       notebook_task=ntask,
+                                      idempotency_token=name,
                                       )
 
         if 'run_id' not in runid:
             raise NotebookTaskRunIDMissingException
 
-        life_cycle_state, output = self.__pull_for_output(
-            runid['run_id'], timeout, pull_wait_time)
-
-        return ExecuteNotebookResult.from_job_output(output)
-
-    def __pull_for_output(self, run_id, timeout, pull_wait_time):
-        timedout = time.time() + timeout
-        output = {}
-        while time.time() < timedout:
-            output = self._retrier.execute(
-                self.inner_dbclient.jobs.get_run_output, run_id)
-            logging.debug(output)
-
-            lcs = utils.recursive_find(
-                output, ['metadata', 'state', 'life_cycle_state'])
-
-            # As per:
-            # https://docs.azuredatabricks.net/api/latest/jobs.html#jobsrunlifecyclestate
-            # All these are terminal states
-            if lcs == 'TERMINATED' or lcs == 'SKIPPED' or lcs == 'INTERNAL_ERROR':
-                logging.debug('Terminal state returned. {}'.format(lcs))
-                return lcs, output
-            logging.debug('Not terminal state returned. Sleeping {}s'.format(pull_wait_time))
-            time.sleep(pull_wait_time)
-
-        self._raise_timeout(output)
-
-    def _raise_timeout(self, output):
-        run_page_url = utils.recursive_find(
-            output, ['metadata', 'run_page_url'])
-        raise TimeOutException(
-            """ Timeout while waiting for the result of a test.\n
-                Check the status of the execution\n
-                Run page URL: {} """.format(run_page_url))
+        self._register_run(runid['run_id'])
+        tracked_run = self._poller.track(
+            runid['run_id'], timeout, poll_policy, expected_duration)
+        self._cancel_if_not_terminated(tracked_run)
+
+        return chain_future(tracked_run.future,
+                            lambda output: self._to_execute_result(output, tracked_run),
+                            self._output_fetcher)
+
+    def execute_notebooks(self, notebook_paths, cluster_id, timeout=120,
+                          pull_wait_time=DEFAULT_POLL_WAIT_TIME,
+                          notebook_params=None, poll_policy=None,
+                          expected_duration=None):
+        future = self.execute_notebooks_async(
+            notebook_paths, cluster_id, timeout, pull_wait_time, notebook_params,
+            poll_policy, expected_duration)
+
+        return future.result()
+
+    def execute_notebooks_async(self, notebook_paths, cluster_id, timeout=120,
+                                pull_wait_time=DEFAULT_POLL_WAIT_TIME,
+                                notebook_params=None, poll_policy=None,
+                                expected_duration=None):
+        """
+        Submits the notebooks as a single multi-task run, with one task
+        per notebook on the same cluster. Returns a future that completes
+        with a list of ExecuteNotebookResult, in the order of the paths.
+        The tasks of the run execute at the same time on the cluster.
+        """
+        if not notebook_paths or not all(notebook_paths):
+            raise ValueError("empty path")
+        self._validate_execution(cluster_id, timeout, notebook_params)
+        if poll_policy is None:
+            poll_policy = FixedPollPolicy(pull_wait_time)
+
+        name = str(uuid.uuid1())
+        tasks = []
+        notebook_paths_by_key = {}
+        for index, notebook_path in enumerate(notebook_paths):
+            task_key = 'nutter_{}'.format(index)
+            notebook_paths_by_key[task_key] = notebook_path
+            tasks.append({
+                'task_key': task_key,
+                'existing_cluster_id': cluster_id,
+                'notebook_task': self.__get_notebook_task(
+                    notebook_path, notebook_params)})
+
+        runid = self._retrier.execute(self.inner_dbclient.jobs.submit_multi_task_run,
+                                      run_name=name,
+                                      tasks=tasks,
+                                      idempotency_token=name)
+
+        if 'run_id' not in runid:
+            raise NotebookTaskRunIDMissingException
+
+        self._register_run(runid['run_id'])
+        tracked_run = self._poller.track(
+            runid['run_id'], timeout, poll_policy, expected_duration,
+            self._get_multi_task_run)
+        self._cancel_if_not_terminated(tracked_run)
+
+        return chain_future(tracked_run.future,
+                            lambda run: self._to_execute_results(
+                                run, tracked_run, notebook_paths_by_key))
+
+    def cancel_runs(self, run_ids=None, timeout=DEFAULT_CANCEL_TIMEOUT):
+        """
+        Cancels the given runs or, by default, all the outstanding runs
+        submitted by this client. The cancellations are sent concurrently
+        and the call returns after at most timeout seconds.
+        """
+        if run_ids is None:
+            run_ids = self.outstanding_runs
+        if len(run_ids) == 0:
+            return CancelRunsResult([], [])
+
+        logging.debug('Cancelling runs {}'.format(run_ids))
+        futures = {self._canceller.submit(self._cancel_run, run_id): run_id
+                   for run_id in run_ids}
+        done, _ = wait(futures, timeout)
+        cancelled = []
+        failed = []
+        for future, run_id in futures.items():
+            if future in done and future.exception() is None:
+                cancelled.append(run_id)
+                continue
+            failed.append(run_id)
+        return CancelRunsResult(cancelled, failed)
+
+    def stop_submissions(self):
+        """
+        Cancels the runs submitted from now on as soon as they are
+        registered, e.g. by a submit in progress when the execution is
+        stopped, until resume_submissions is called.
+        """
+        with self._runs_lock:
+            self._submissions_stopped = True
+
+    def resume_submissions(self):
+        with self._runs_lock:
+            self._submissions_stopped = False
+
+    def _register_run(self, run_id):
+        with self._runs_lock:
+            self._submitted_runs.add(run_id)
+            stopped = self._submissions_stopped
+        if stopped:
+            logging.debug('Cancelling run {} submitted after the stop'.format(run_id))
+            self._canceller.submit(self._cancel_run, run_id)
+
+    def _cancel_if_not_terminated(self, tracked_run):
+        def on_done(future):
+            if future.exception() is None:
+                with self._runs_lock:
+                    self._submitted_runs.discard(tracked_run.run_id)
+                return
+            # Timed out or failed while polling, the run may still be
+            # using the cluster. The cancellation is not awaited.
+            logging.debug('Cancelling run {}. {}'.format(
+                tracked_run.run_id, future.exception()))
+            self._canceller.submit(self._cancel_run, tracked_run.run_id)
+
+        tracked_run.future.add_done_callback(on_done)
+
+    def _cancel_run(self, run_id):
+        try:
+            self._retrier.execute(self.inner_dbclient.jobs.cancel_run, run_id)
+        except Exception as ex:
+            logging.debug('Failed to cancel run {}. {}'.format(run_id, ex))
+            raise
+        with self._runs_lock:
+            if run_id in self._submitted_runs:
+                self._submitted_runs.discard(run_id)
+                self._cancelled_runs.append(run_id)
+        logging.debug('Run {} cancelled'.format(run_id))
+
+    def _validate_execution(self, cluster_id, timeout, notebook_params):
+        if not cluster_id:
+            raise ValueError("empty cluster id")
+        if timeout < self.min_timeout:
+            raise ValueError(
+                "Timeout must be greater than {}".format(self.min_timeout))
+        if notebook_params is not None:
+            if not isinstance(notebook_params, dict):
+                raise ValueError(
+                    "Parameters must be in the form of a dictionary "
+                    "(See #run-single-test-notebook section in README)")
+
+    def _to_execute_results(self, run, tracked_run, notebook_paths_by_key):
+        # The outputs of the tasks are downloaded concurrently
+        tasks = {task.get('task_key'): task for task in run.get('tasks', [])}
+        futures = [
+            self._output_fetcher.submit(
+                self._to_task_result, tasks.get(task_key, {}), notebook_path,
+                tracked_run)
+            for task_key, notebook_path in notebook_paths_by_key.items()]
+        return chain_future(
+            gather_futures(futures),
+            lambda results: self._on_tasks_completed(results, tracked_run))
+
+    def _to_task_result(self, task, notebook_path, tracked_run):
+        output = {'metadata': task}
+        if 'run_id' in task:
+            output = self._execute_for_run(
+                tracked_run.run_id, self.inner_dbclient.jobs.get_run_output,
+                task['run_id'])
+        result = ExecuteNotebookResult.from_job_output(output)
+        result.notebook_path = notebook_path
+        result.poll_calls = tracked_run.poll_count
+        result.duration = self._get_task_duration(task, tracked_run)
+        return result
+
+    def _on_tasks_completed(self, results, tracked_run):
+        bytes_received = self._pop_bytes_received(tracked_run.run_id)
+        for result in results:
+            result.bytes_received = bytes_received // len(results)
+        logging.debug(
+            'Multi-task run {} with {} tasks completed in {:.1f}s after {} poll '
+            'calls. {} bytes received'.format(
+                tracked_run.run_id, len(results), tracked_run.elapsed,
+                tracked_run.poll_count, bytes_received))
+        return results
+
+    def _get_task_duration(self, task, tracked_run):
+        start_time = task.get('start_time')
+        end_time = task.get('end_time')
+        if start_time and end_time:
+            return (end_time - start_time) / 1000
+        return tracked_run.elapsed
+
+    def _to_execute_result(self, run, tracked_run):
+        # The output, which includes the notebook exit value, is only
+        # downloaded once the run is in a terminal state
+        output = self._get_run_output(tracked_run.run_id)
+        result = ExecuteNotebookResult.from_job_output(output)
+        result.poll_calls = tracked_run.poll_count
+        result.duration = tracked_run.elapsed
+        result.bytes_received = self._pop_bytes_received(tracked_run.run_id)
+        logging.debug(
+            'Run {} completed in {:.1f}s after {} poll calls. {} bytes received'
+            .format(tracked_run.run_id, tracked_run.elapsed,
+                    tracked_run.poll_count, result.bytes_received))
+        return result
+
+    def _get_run(self, run_id):
+        return self._execute_for_run(
+            run_id, self.inner_dbclient.jobs.get_run, run_id)
+
+    def _get_multi_task_run(self, run_id):
+        return self._execute_for_run(
+            run_id, self.inner_dbclient.jobs.get_multi_task_run, run_id)
+
+    def _get_run_output(self, run_id):
+        return self._execute_for_run(
+            run_id, self.inner_dbclient.jobs.get_run_output, run_id)
+
+    def _execute_for_run(self, tracked_run_id, function, *args):
+        received_before = self.inner_dbclient.bytes_received()
+        try:
+            return self._retrier.execute(function, *args)
+        finally:
+            received = self.inner_dbclient.bytes_received() - received_before
+            with self._bytes_lock:
+                self._bytes_received[tracked_run_id] = \
+                    self._bytes_received.get(tracked_run_id, 0) + received
+
+    def _pop_bytes_received(self, run_id):
+        with self._bytes_lock:
+            return self._bytes_received.pop(run_id, 0)
 
     def __get_notebook_task(self, path, params):
         ntask = {}
@@ -134,6 +526,224 @@ class DatabricksAPIClient(object):
         return ntask
 
 
+class RunStatusPoller(object):
+    """
+    Tracks every active run and polls their state from a single timer thread.
+    The poll function returns the run as in the runs/get endpoint.
+    Each tracked run gets a future that completes with the run when
+    it reaches a terminal state, or fails with a TimeOutException.
+    """
+
+    def __init__(self, poll_function, poll_concurrency=DEFAULT_POLL_CONCURRENCY):
+        self._poll_function = poll_function
+        self._poll_concurrency = poll_concurrency
+        self._runs = {}
+        self._condition = threading.Condition()
+        self._thread = None
+
+    @property
+    def active_runs(self):
+        with self._condition:
+            return len(self._runs)
+
+    def track(self, run_id, timeout, poll_policy=None, expected_duration=None,
+              poll_function=None):
+        if poll_policy is None:
+            poll_policy = FixedPollPolicy()
+        if poll_function is None:
+            poll_function = self._poll_function
+        tracked_run = TrackedRun(run_id, timeout, poll_policy, expected_duration,
+                                 poll_function)
+        with self._condition:
+            self._runs[run_id] = tracked_run
+            self._ensure_started()
+            self._condition.notify()
+        logging.debug('Tracking run {}. Active runs: {}'.format(
+            run_id, len(self._runs)))
+        return tracked_run
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='RunStatusPoller')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        logging.debug('Run status poller started')
+        with ThreadPoolExecutor(max_workers=self._poll_concurrency) as executor:
+            while True:
+                due_runs = self._wait_for_due_runs()
+                if due_runs is None:
+                    break
+                list(executor.map(self._poll, due_runs))
+        logging.debug('Run status poller stopped')
+
+    def _wait_for_due_runs(self):
+        with self._condition:
+            while True:
+                if len(self._runs) == 0:
+                    self._thread = None
+                    return None
+                now = time.time()
+                due_runs = [run for run in self._runs.values()
+                            if run.next_event <= now]
+                if len(due_runs) > 0:
+                    return due_runs
+                next_event = min(run.next_event for run in self._runs.values())
+                self._condition.wait(next_event - now)
+
+    def _poll(self, tracked_run):
+        if tracked_run.is_timed_out:
+            self._complete(tracked_run,
+                           exception=_timeout_exception(tracked_run.last_run))
+            return
+        try:
+            run = tracked_run.poll_function(tracked_run.run_id)
+        except Exception as ex:
+            self._complete(tracked_run, exception=ex)
+            return
+
+        logging.debug(run)
+        lcs = utils.recursive_find(run, ['state', 'life_cycle_state'])
+        tracked_run.set_last_run(run, lcs)
+
+        if lcs in TERMINAL_STATES:
+            logging.debug('Terminal state returned. {}'.format(lcs))
+            self._complete(tracked_run, result=run)
+            return
+        wait = tracked_run.schedule_next_poll()
+        logging.debug('Not terminal state returned for run {}. Next poll in {:.1f}s'
+                      .format(tracked_run.run_id, wait))
+
+    def _complete(self, tracked_run, result=None, exception=None):
+        with self._condition:
+            self._runs.pop(tracked_run.run_id, None)
+        if exception is not None:
+            tracked_run.future.set_exception(exception)
+            return
+        tracked_run.future.set_result(result)
+
+
+class TrackedRun(object):
+    def __init__(self, run_id, timeout, poll_policy, expected_duration=None,
+                 poll_function=None):
+        self.run_id = run_id
+        self.poll_policy = poll_policy
+        self.poll_function = poll_function
+        self.expected_duration = expected_duration
+        self.submitted_at = time.time()
+        self.timeout_at = self.submitted_at + timeout
+        self.next_poll = self.submitted_at
+        self.last_run = {}
+        self.life_cycle_state = None
+        self.poll_count = 0
+        self.polls_in_state = 0
+        self.future = Future()
+
+    @property
+    def next_event(self):
+        return min(self.next_poll, self.timeout_at)
+
+    @property
+    def is_timed_out(self):
+        return time.time() >= self.timeout_at
+
+    @property
+    def elapsed(self):
+        return time.time() - self.submitted_at
+
+    def set_last_run(self, run, life_cycle_state):
+        self.last_run = run
+        self.poll_count += 1
+        if life_cycle_state != self.life_cycle_state:
+            self.life_cycle_state = life_cycle_state
+            self.polls_in_state = 0
+
+    def schedule_next_poll(self):
+        wait = self.poll_policy.next_wait(self)
+        self.polls_in_state += 1
+        self.next_poll = time.time() + wait
+        return wait
+
+
+def _timeout_exception(run):
+    run_page_url = utils.recursive_find(run, ['run_page_url'])
+    return TimeOutException(
+        """ Timeout while waiting for the result of a test.\n
+            Check the status of the execution\n
+            Run page URL: {} """.format(run_page_url))
+
+
+def chain_future(future, result_func, executor=None):
+    """
+    Returns a future that completes with result_func of the result of the
+    future. result_func runs on the executor when one is given, otherwise
+    on the thread that completes the future. When result_func returns a
+    future, the chained future completes with the result of that future.
+    """
+    chained = Future()
+
+    def set_result(completed):
+        try:
+            result = result_func(completed.result())
+        except Exception as ex:
+            chained.set_exception(ex)
+            return
+        if isinstance(result, Future):
+            result.add_done_callback(lambda inner: _copy_future(inner, chained))
+            return
+        chained.set_result(result)
+
+    def on_done(completed):
+        if executor is None:
+            set_result(completed)
+            return
+        try:
+            executor.submit(set_result, completed)
+        except RuntimeError as ex:
+            # The executor is shut down
+            chained.set_exception(ex)
+
+    future.add_done_callback(on_done)
+    return chained
+
+
+def gather_futures(futures):
+    """
+    Returns a future that completes with the list of the results of the
+    futures, in order, once all of them complete, or with the first
+    exception of the list.
+    """
+    gathered = Future()
+    if len(futures) == 0:
+        gathered.set_result([])
+        return gathered
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def on_done(completed):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0] > 0:
+                return
+        try:
+            gathered.set_result([future.result() for future in futures])
+        except Exception as ex:
+            gathered.set_exception(ex)
+
+    for future in futures:
+        future.add_done_callback(on_done)
+    return gathered
+
+
+def _copy_future(source, destination):
+    if source.exception() is not None:
+        destination.set_exception(source.exception())
+        return
+    destination.set_result(source.result())
+
+
 class NotebookTaskRunIDMissingException(Exception):
     pass
 
@@ -7,15 +7,24 @@ from . import utils
 from abc import ABCMeta
 from .testresult import TestResults
 import logging
+import threading
+
+# The exit output is parsed the first time the test results are used
+_NOT_PARSED = object()
 
 
 class ExecuteNotebookResult(object):
     def __init__(self, life_cycle_state, notebook_path,
-                 notebook_result, notebook_run_page_url):
+                 notebook_result, notebook_run_page_url,
+                 poll_calls=0, duration=None, bytes_received=0, cluster_id=None):
         self.task_result_state = life_cycle_state
         self.notebook_path = notebook_path
         self.notebook_result = notebook_result
         self.notebook_run_page_url = notebook_run_page_url
+        self.poll_calls = poll_calls
+        self.duration = duration
+        self.bytes_received = bytes_received
+        self.cluster_id = cluster_id
 
     @classmethod
     def from_job_output(cls, job_output):
@@ -28,7 +37,27 @@ class ExecuteNotebookResult(object):
         notebook_result = NotebookOutputResult.from_job_output(job_output)
 
         return cls(life_cycle_state, notebook_path,
-                   notebook_result, notebook_run_page_url)
+                   notebook_result, notebook_run_page_url,
+                   cluster_id=cls._get_cluster_id(job_output))
+
+    @classmethod
+    def _get_cluster_id(cls, job_output):
+        # The cluster instance is only set once the run started
+        for keys in (['metadata', 'cluster_instance', 'cluster_id'],
+                     ['metadata', 'cluster_spec', 'existing_cluster_id'],
+                     ['metadata', 'existing_cluster_id']):
+            cluster_id = utils.recursive_find(job_output, keys)
+            if cluster_id is not None:
+                return cluster_id
+        return None
+
+    @property
+    def test_results(self):
+        """
+        Test results of the notebook, or None when the output is missing
+        or invalid. The exit output is parsed once and shared.
+        """
+        return self.notebook_result.nutter_test_results
 
     @property
     def is_error(self):
@@ -42,24 +71,50 @@ class ExecuteNotebookResult(object):
             return True
         if self.notebook_result.is_error:
             return True
-        if self.notebook_result.nutter_test_results is None:
+        if self.test_results is None:
             return True
 
-        for test_case in self.notebook_result.nutter_test_results.results:
-            if not test_case.passed:
-                return True
-        return False
+        return not self.test_results.passed()
+
+    @property
+    def failures(self):
+        """
+        Number of failed test cases, or 1 when the run, the notebook or
+        its output failed.
+        """
+        if self.is_error or self.notebook_result.is_error or \
+                self.test_results is None:
+            return 1
+        return self.test_results.num_failures
+
+
+class CancelRunsResult(object):
+    def __init__(self, cancelled, failed):
+        self.cancelled = cancelled
+        self.failed = failed
+
+    @property
+    def total(self):
+        return len(self.cancelled) + len(self.failed)
+
 
 class NotebookOutputResult(object):
-    def __init__(self, result_state, exit_output, nutter_test_results):
+    """
+    Result state and exit output of a notebook. When the test results are
+    not given, the exit output is parsed the first time they are used and
+    released once parsed.
+    """
+
+    def __init__(self, result_state, exit_output, nutter_test_results=_NOT_PARSED):
         self.result_state = result_state
-        self.exit_output = exit_output
-        self.nutter_test_results = nutter_test_results
+        self._exit_output = exit_output
+        self._nutter_test_results = nutter_test_results
+        self.parse_error = None
+        self._lock = threading.Lock()
 
     @classmethod
     def from_job_output(cls, job_output):
         exit_output = ''
-        nutter_test_results = ''
         notebook_result_state = ''
         if 'error' in job_output:
             exit_output = job_output['error']
@@ -70,9 +125,22 @@ class NotebookOutputResult(object):
 
             if 'result' in job_output['notebook_output']:
                 exit_output = job_output['notebook_output']['result']
-                nutter_test_results = cls._get_nutter_test_results(exit_output)
+                return cls(notebook_result_state, exit_output)
+
+        return cls(notebook_result_state, exit_output, None)
 
-        return cls(notebook_result_state, exit_output, nutter_test_results)
+    @property
+    def exit_output(self):
+        # None once the test results are parsed
+        return self._exit_output
+
+    @property
+    def nutter_test_results(self):
+        if self._nutter_test_results is _NOT_PARSED:
+            with self._lock:
+                if self._nutter_test_results is _NOT_PARSED:
+                    self._parse()
+        return self._nutter_test_results
 
     @property
     def is_error(self):
@@ -84,24 +152,20 @@ class NotebookOutputResult(object):
         # https://docs.azuredatabricks.net/dev-tools/api/latest/jobs.html#jobsrunresultstate
         return self.result_state == 'N/A'
 
-    @classmethod
-    def _get_nutter_test_results(cls, exit_output):
-        nutter_test_results = cls._to_nutter_test_results(exit_output)
-        if nutter_test_results is None:
-            return None
-        return nutter_test_results
-
-    @classmethod
-    def _to_nutter_test_results(cls, exit_output):
-        if not exit_output:
-            return None
-        try:
-            return TestResults().deserialize(exit_output)
-        except Exception as ex:
-            error = 'error while creating result from {}. Error: {}'.format(
-                ex, exit_output)
-            logging.debug(error)
-            return None
+    def _parse(self):
+        nutter_test_results = None
+        if not self._exit_output:
+            self.parse_error = 'The exit output is missing'
+        else:
+            try:
+                nutter_test_results = TestResults().deserialize(self._exit_output)
+            except Exception as ex:
+                self.parse_error = str(ex)
+                logging.debug('error while creating result from {}. Error: {}'.format(
+                    ex, self._exit_output))
+        if nutter_test_results is not None:
+            self._exit_output = None
+        self._nutter_test_results = nutter_test_results
 
 
 class WorkspacePath(object):
@@ -109,6 +173,9 @@ class WorkspacePath(object):
         self.notebooks = notebooks
         self.directories = directories
         self.test_notebooks = self._set_test_notebooks()
+        # The modification times of the directories of a cached listing
+        # can be stale
+        self.from_cache = False
 
     @classmethod
     def from_api_response(cls, objects):
@@ -127,7 +194,8 @@ class WorkspacePath(object):
     def _set_directories(cls, objects):
         if 'objects' not in objects:
             return []
-        return [Directory(object['path']) for object in objects['objects']
+        return [Directory(object['path'], object.get('modified_at'))
+                for object in objects['objects']
                 if object['object_type'] == 'DIRECTORY']
 
     def _set_test_notebooks(self):
@@ -160,5 +228,6 @@ class NotebookObject(WorkspaceObject):
 
 
 class Directory(WorkspaceObject):
-    def __init__(self, path):
+    def __init__(self, path, modified_at=None):
+        self.modified_at = modified_at
         super().__init__(path)
@@ -0,0 +1,272 @@
+"""
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import json
+import logging
+import threading
+import time
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+CASSETTE_VERSION = 1
+RECORDED_HEADERS = ('Retry-After',)
+RETRIABLE_STATUS = 429
+
+
+def record(http_client):
+    """
+    Records the traffic of the DatabricksHttpClient until the recorder is saved.
+    """
+    recorder = CassetteRecorder(http_client.url)
+    recorder.install(http_client.session)
+    return recorder
+
+
+def replay(http_client, path, speed=1.0):
+    """
+    Serves the requests of the DatabricksHttpClient from the cassette at path.
+    """
+    player = CassettePlayer(load_cassette(path), http_client.url, speed)
+    player.install(http_client.session)
+    return player
+
+
+def load_cassette(path):
+    with open(path) as file:
+        cassette = json.load(file)
+    if cassette.get('version') != CASSETTE_VERSION:
+        raise CassetteException(
+            'Unsupported cassette version {}'.format(cassette.get('version')))
+    return cassette['interactions']
+
+
+class CassetteRecorder(object):
+    """
+    Records every request and response with the time it was sent, relative
+    to the first request, and the latency of the response.
+    """
+
+    def __init__(self, api_url):
+        self.api_url = api_url
+        self.interactions = []
+        self._started_at = None
+        self._lock = threading.Lock()
+
+    def install(self, session):
+        send = session.request
+
+        def request(method, url, **kwargs):
+            sent_at = time.time()
+            with self._lock:
+                if self._started_at is None:
+                    self._started_at = sent_at
+            response = send(method, url, **kwargs)
+            self._add(method, url, kwargs, response, sent_at)
+            return response
+
+        session.request = request
+
+    def save(self, path):
+        with self._lock:
+            interactions = sorted(self.interactions, key=lambda item: item['time'])
+        with open(path, 'w') as file:
+            json.dump({'version': CASSETTE_VERSION, 'interactions': interactions}, file)
+        logging.debug('{} interactions recorded in {}'.format(len(interactions), path))
+
+    def _add(self, method, url, kwargs, response, sent_at):
+        interaction = {
+            'time': sent_at - self._started_at,
+            'latency': time.time() - sent_at,
+            'method': method,
+            'path': _get_path(self.api_url, url),
+            'params': kwargs.get('params') or {},
+            'body': json.loads(kwargs['data']) if kwargs.get('data') else {},
+            'status': response.status_code,
+            'headers': {name: response.headers[name] for name in RECORDED_HEADERS
+                        if name in response.headers},
+            'response': response.text}
+        with self._lock:
+            self.interactions.append(interaction)
+
+
+class CassettePlayer(object):
+    """
+    Replays a cassette. Submits are matched by notebook paths in the recorded
+    order and get the recorded run id. The state of a run follows the time
+    elapsed since its submit: runs/get returns the last response recorded at
+    the same offset from the recorded submit, regardless of the number of
+    polls. Throttling and server errors are returned at the time they were
+    recorded. speed accelerates the replay, e.g. 10 replays a 10 minute
+    session in 1 minute.
+    """
+
+    def __init__(self, interactions, api_url, speed=1.0):
+        if speed <= 0:
+            raise ValueError('The replay speed must be greater than 0')
+        self.api_url = api_url
+        self.speed = speed
+        self.requests = 0
+        self._submits = []
+        self._run_gets = {}
+        self._run_outputs = {}
+        self._run_submitted_at = {}
+        self._replay_submitted_at = {}
+        self._errors = {}
+        self._others = {}
+        self._started_at = None
+        self._lock = threading.Lock()
+        self._load(interactions)
+
+    def install(self, session):
+        session.request = self.request
+
+    def request(self, method, url, params=None, data=None, **kwargs):
+        path = _get_path(self.api_url, url)
+        body = json.loads(data) if data else {}
+        params = params or {}
+        with self._lock:
+            now = time.time()
+            if self._started_at is None:
+                self._started_at = now
+            self.requests += 1
+            elapsed = (now - self._started_at) * self.speed
+            interaction = self._get_error(method, path, elapsed)
+            if interaction is None:
+                interaction = self._match(method, path, params, body, now)
+        time.sleep(interaction['latency'] / self.speed)
+        return _to_response(interaction, url)
+
+    def _load(self, interactions):
+        for interaction in interactions:
+            key = _get_key(interaction['method'], interaction['path'])
+            status = interaction['status']
+            if status == RETRIABLE_STATUS or status >= 500:
+                self._errors.setdefault(key, []).append(interaction)
+                continue
+            if status != 200:
+                self._add_other(interaction)
+                continue
+            if key[1] == 'jobs/runs/submit':
+                self._add_submit(interaction)
+                continue
+            run_id = _get_run_id(interaction['params'])
+            if key[1] == 'jobs/runs/get':
+                self._run_gets.setdefault(run_id, []).append(interaction)
+                continue
+            if key[1] == 'jobs/runs/get-output':
+                self._run_outputs[run_id] = interaction
+                continue
+            self._add_other(interaction)
+
+    def _add_other(self, interaction):
+        self._others.setdefault(_get_request_key(interaction), []).append(interaction)
+
+    def _add_submit(self, interaction):
+        run_id = json.loads(interaction['response']).get('run_id')
+        self._run_submitted_at[run_id] = interaction['time']
+        self._submits.append(interaction)
+
+    def _get_error(self, method, path, elapsed):
+        errors = self._errors.get(_get_key(method, path))
+        if not errors or errors[0]['time'] > elapsed:
+            return None
+        return errors.pop(0)
+
+    def _match(self, method, path, params, body, now):
+        key = _get_key(method, path)
+        if key[1] == 'jobs/runs/submit':
+            return self._match_submit(body, now)
+        if key[1] == 'jobs/runs/get':
+            return self._match_run_get(_get_run_id(params), now)
+        if key[1] == 'jobs/runs/get-output':
+            return self._get_recorded(self._run_outputs.get(_get_run_id(params)),
+                                      method, path)
+
+        request_key = _get_request_key({'method': method, 'path': path,
+                                        'params': params, 'body': body})
+        recorded = self._others.get(request_key)
+        if not recorded:
+            return self._get_recorded(None, method, path)
+        # The last response is replayed for repeated requests
+        if len(recorded) > 1:
+            return recorded.pop(0)
+        return recorded[0]
+
+    def _match_submit(self, body, now):
+        notebook_paths = _get_notebook_paths(body)
+        for index, interaction in enumerate(self._submits):
+            if _get_notebook_paths(interaction['body']) == notebook_paths:
+                self._submits.pop(index)
+                run_id = json.loads(interaction['response']).get('run_id')
+                self._replay_submitted_at[run_id] = now
+                return interaction
+        raise CassetteException(
+            'No recorded submit for the notebooks {}'.format(notebook_paths))
+
+    def _match_run_get(self, run_id, now):
+        recorded = self._run_gets.get(run_id)
+        submitted_at = self._replay_submitted_at.get(run_id)
+        if not recorded or submitted_at is None:
+            return self._get_recorded(None, 'GET', 'jobs/runs/get')
+        elapsed = (now - submitted_at) * self.speed
+        recorded_submitted_at = self._run_submitted_at.get(run_id, 0)
+        match = recorded[0]
+        for interaction in recorded:
+            if interaction['time'] - recorded_submitted_at > elapsed:
+                break
+            match = interaction
+        return match
+
+    def _get_recorded(self, interaction, method, path):
+        if interaction is None:
+            raise CassetteException(
+                'No recorded response for {} {}'.format(method, path))
+        return interaction
+
+
+class CassetteException(Exception):
+    pass
+
+
+def _to_response(interaction, url):
+    response = requests.models.Response()
+    response.status_code = interaction['status']
+    response.headers = CaseInsensitiveDict(interaction['headers'])
+    response._content = interaction['response'].encode('utf-8')
+    response.url = url
+    response.reason = ''
+    return response
+
+
+def _get_path(api_url, url):
+    if url.startswith(api_url):
+        url = url[len(api_url):]
+    return url.strip('/')
+
+
+def _get_key(method, path):
+    # Version independent, 2.0 and 2.1 share the same runs
+    return method, '/'.join(path.split('/')[1:])
+
+
+def _get_request_key(interaction):
+    return (_get_key(interaction['method'], interaction['path']),
+            json.dumps(interaction['params'], sort_keys=True),
+            json.dumps(interaction['body'], sort_keys=True))
+
+
+def _get_run_id(params):
+    run_id = params.get('run_id')
+    if run_id is None:
+        return None
+    return int(run_id)
+
+
+def _get_notebook_paths(body):
+    if 'tasks' in body:
+        return [task.get('notebook_task', {}).get('notebook_path')
+                for task in body['tasks']]
+    return [body.get('notebook_task', {}).get('notebook_path')]
@@ -0,0 +1,139 @@
+"""
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import enum
+import logging
+import threading
+import time
+from collections import deque
+
+DEFAULT_FAILURE_RATE = 0.5
+DEFAULT_WINDOW_SIZE = 20
+DEFAULT_MIN_CALLS = 10
+DEFAULT_OPEN_DURATION = 30
+DEFAULT_PARK_TIMEOUT = 600
+
+
+class CircuitState(enum.Enum):
+    CLOSED = 1
+    OPEN = 2
+    HALF_OPEN = 3
+
+
+class CircuitBreaker(object):
+    """
+    Opens when the failure rate of the last window_size calls reaches
+    failure_rate. While open, calls fail fast with CircuitOpenException or,
+    when park is set, wait until a half-open probe call succeeds.
+    Listeners are called with the new CircuitState on every transition,
+    in order and after the lock of the state is released.
+    """
+
+    def __init__(self, failure_rate=DEFAULT_FAILURE_RATE,
+                 window_size=DEFAULT_WINDOW_SIZE, min_calls=DEFAULT_MIN_CALLS,
+                 open_duration=DEFAULT_OPEN_DURATION, park=False,
+                 park_timeout=DEFAULT_PARK_TIMEOUT):
+        if failure_rate <= 0 or failure_rate > 1:
+            raise ValueError('The failure rate must be a value between 0 and 1')
+        if window_size < 1:
+            raise ValueError('The window size must be greater than 0')
+        self.failure_rate = failure_rate
+        self.min_calls = min(min_calls, window_size)
+        self.open_duration = open_duration
+        self.park = park
+        self.park_timeout = park_timeout
+        self.state = CircuitState.CLOSED
+        self._calls = deque(maxlen=window_size)
+        self._opened_at = 0
+        self._probe_in_flight = False
+        self._listeners = []
+        self._transitions = []
+        self._condition = threading.Condition()
+        self._listeners_lock = threading.RLock()
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def before_call(self):
+        try:
+            self._wait_for_call()
+        finally:
+            self._notify_listeners()
+
+    def _wait_for_call(self):
+        park_until = time.time() + self.park_timeout
+        with self._condition:
+            while True:
+                if self.state == CircuitState.CLOSED:
+                    return
+                now = time.time()
+                if self.state == CircuitState.OPEN and \
+                        now >= self._opened_at + self.open_duration:
+                    self._transition(CircuitState.HALF_OPEN)
+                if self.state == CircuitState.HALF_OPEN and not self._probe_in_flight:
+                    self._probe_in_flight = True
+                    logging.debug('Circuit half open. Probing the service.')
+                    return
+                if not self.park or now >= park_until:
+                    raise CircuitOpenException(
+                        'The Databricks API is failing. The circuit breaker is open.')
+                wait = min(park_until, self._opened_at + self.open_duration) - now
+                self._condition.wait(max(wait, 0.1))
+
+    def record_success(self):
+        with self._condition:
+            self._calls.append(True)
+            if self.state != CircuitState.CLOSED:
+                self._calls.clear()
+                self._probe_in_flight = False
+                self._transition(CircuitState.CLOSED)
+        self._notify_listeners()
+
+    def record_failure(self):
+        with self._condition:
+            self._calls.append(False)
+            if self.state == CircuitState.HALF_OPEN:
+                self._open()
+            elif self.state == CircuitState.CLOSED and self._is_failure_rate_exceeded():
+                self._open()
+        self._notify_listeners()
+
+    def _is_failure_rate_exceeded(self):
+        if len(self._calls) < self.min_calls:
+            return False
+        failures = len([call for call in self._calls if not call])
+        return failures / len(self._calls) >= self.failure_rate
+
+    def _open(self):
+        self._opened_at = time.time()
+        self._probe_in_flight = False
+        self._transition(CircuitState.OPEN)
+
+    def _transition(self, state):
+        if self.state == state:
+            return
+        logging.debug('Circuit breaker state change {} -> {}'.format(
+            self.state.name, state.name))
+        self.state = state
+        self._condition.notify_all()
+        self._transitions.append(state)
+
+    def _notify_listeners(self):
+        # A listener can call the circuit breaker, so it is called without
+        # the lock of the state. The transitions are delivered in order.
+        with self._listeners_lock:
+            with self._condition:
+                transitions = self._transitions
+                self._transitions = []
+            for state in transitions:
+                for listener in self._listeners:
+                    try:
+                        listener(state)
+                    except Exception as ex:
+                        logging.debug('Circuit breaker listener error. {}'.format(ex))
+
+
+class CircuitOpenException(Exception):
+    pass
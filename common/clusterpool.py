@@ -0,0 +1,120 @@
+"""
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import logging
+import threading
+
+DEFAULT_WEIGHT = 1
+# States of a cluster that can run notebooks
+AVAILABLE_CLUSTER_STATES = ('RUNNING', 'RESIZING')
+
+
+def get_cluster_pool(cluster_id):
+    """
+    Returns the pool of the clusters defined by cluster_id: a cluster id,
+    comma separated cluster ids, a list of cluster ids or a dictionary of
+    weights by cluster id. The weight of a cluster follows its id after
+    a colon, e.g. 0123-456789-abc:2,0123-456789-def.
+    """
+    if isinstance(cluster_id, ClusterPool):
+        return cluster_id
+    if isinstance(cluster_id, dict):
+        return ClusterPool(list(cluster_id.items()))
+    if isinstance(cluster_id, str):
+        cluster_id = cluster_id.split(',')
+    if not isinstance(cluster_id, (list, tuple)):
+        cluster_id = [cluster_id]
+
+    clusters = [_parse_cluster(item) for item in cluster_id]
+    non_empty_clusters = [cluster for cluster in clusters if cluster[0]]
+    # An empty cluster id is reported when the notebooks are submitted
+    return ClusterPool(non_empty_clusters or clusters[:1])
+
+
+def is_available_state(state):
+    return state in AVAILABLE_CLUSTER_STATES
+
+
+def _parse_cluster(value):
+    if not isinstance(value, str):
+        return value, DEFAULT_WEIGHT
+    cluster_id, separator, weight = value.strip().partition(':')
+    if not separator:
+        return cluster_id, DEFAULT_WEIGHT
+    try:
+        return cluster_id, float(weight)
+    except ValueError:
+        raise ValueError(
+            'Invalid weight {} for the cluster {}'.format(weight, cluster_id))
+
+
+class ClusterPool(object):
+    """
+    Clusters that execute the test notebooks. Each run is placed on the
+    cluster with the fewest runs in flight relative to its weight; ties
+    go to the first cluster of the pool. A cluster can be removed, e.g.
+    when it terminates, as long as it is not the last one of the pool.
+    """
+
+    def __init__(self, clusters):
+        if len(clusters) == 0:
+            raise ValueError('The cluster pool is empty')
+        self._weights = {}
+        self._in_flight = {}
+        for cluster_id, weight in clusters:
+            if weight <= 0:
+                raise ValueError(
+                    'The weight of the cluster {} must be greater than 0'.format(
+                        cluster_id))
+            self._weights[cluster_id] = weight
+            self._in_flight[cluster_id] = 0
+        self._lock = threading.Lock()
+
+    @property
+    def cluster_ids(self):
+        with self._lock:
+            return list(self._weights)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._weights)
+
+    def __contains__(self, cluster_id):
+        with self._lock:
+            return cluster_id in self._weights
+
+    def in_flight(self, cluster_id):
+        with self._lock:
+            return self._in_flight.get(cluster_id, 0)
+
+    def acquire(self):
+        """
+        Returns the least loaded cluster and counts a run in flight on it.
+        """
+        with self._lock:
+            cluster_id = min(
+                self._weights,
+                key=lambda cluster_id:
+                    self._in_flight[cluster_id] / self._weights[cluster_id])
+            self._in_flight[cluster_id] += 1
+            return cluster_id
+
+    def release(self, cluster_id):
+        with self._lock:
+            if cluster_id in self._in_flight:
+                self._in_flight[cluster_id] -= 1
+
+    def remove(self, cluster_id):
+        """
+        Removes the cluster, unless it is the last one. Returns False if the
+        cluster is not removed by this call.
+        """
+        with self._lock:
+            if cluster_id not in self._weights or len(self._weights) == 1:
+                return False
+            del self._weights[cluster_id]
+            del self._in_flight[cluster_id]
+        logging.debug('Cluster {} removed from the pool'.format(cluster_id))
+        return True
@@ -0,0 +1,157 @@
+"""
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import logging
+import threading
+from concurrent.futures import Future
+
+AUTO_PARALLELISM = 'auto'
+DEFAULT_MIN_LIMIT = 1
+DEFAULT_INITIAL_LIMIT = 2
+DEFAULT_MAX_LIMIT = 15
+# The limit is reduced when the latency grows beyond this multiple of the best latency
+DEFAULT_LATENCY_TOLERANCE = 3
+DEFAULT_DECREASE_FACTOR = 0.5
+# Weight of the latest latency in the moving average
+LATENCY_SMOOTHING_FACTOR = 0.2
+# The calls that submit and poll the runs. The latency of the other calls,
+# such as the downloads of large outputs, does not reflect the load of the runs
+RUN_CALLS = frozenset(
+    ['submit_run', 'submit_multi_task_run', 'get_run', 'get_multi_task_run'])
+
+
+class ConcurrencyController(object):
+    """
+    AIMD limit of the number of tests in flight. The limit grows by one
+    after a limit's worth of healthy API calls and is multiplied by the
+    decrease factor when the service throttles, fails or its latency
+    degrades. After a decrease, the limit is not reduced again until the
+    calls in flight at the time of the decrease have completed.
+    Listeners are called with the new limit and the reason of the change.
+    """
+
+    def __init__(self, min_limit=DEFAULT_MIN_LIMIT, max_limit=DEFAULT_MAX_LIMIT,
+                 initial_limit=DEFAULT_INITIAL_LIMIT,
+                 latency_tolerance=DEFAULT_LATENCY_TOLERANCE,
+                 decrease_factor=DEFAULT_DECREASE_FACTOR):
+        if min_limit < 1 or max_limit < min_limit:
+            raise ValueError(
+                'Invalid limits. min:{} max:{}'.format(min_limit, max_limit))
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = max(min_limit, min(initial_limit, max_limit))
+        self.latency_tolerance = latency_tolerance
+        self.decrease_factor = decrease_factor
+        self.in_flight = 0
+        self._healthy_calls = 0
+        self._latency = None
+        self._best_latency = None
+        self._calls = 0
+        self._recover_after = 0
+        self._listeners = []
+        self._condition = threading.Condition()
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def set_max_limit(self, max_limit, reason):
+        with self._condition:
+            self.max_limit = max(self.min_limit, max_limit)
+            if self.limit > self.max_limit:
+                self._set_limit(self.max_limit, reason)
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= self.limit:
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify()
+
+    def on_api_call(self, function_name, latency, throttled=False, failed=False):
+        """
+        Records the outcome of an API call when it submits or polls a run.
+        """
+        if function_name not in RUN_CALLS:
+            return
+        self.on_call(latency, throttled, failed)
+
+    def on_call(self, latency, throttled=False, failed=False):
+        """
+        Records the outcome of an API call.
+        """
+        with self._condition:
+            self._calls += 1
+            if throttled or failed:
+                self._decrease('throttled' if throttled else 'API errors')
+                return
+            self._add_latency(latency)
+            if self._is_latency_degraded():
+                self._decrease('latency {:.2f}s'.format(self._latency))
+                return
+            self._healthy_calls += 1
+            if self._healthy_calls >= self.limit and self.limit < self.max_limit:
+                self._set_limit(self.limit + 1, 'healthy')
+
+    def _add_latency(self, latency):
+        if self._latency is None:
+            self._latency = latency
+        else:
+            self._latency = LATENCY_SMOOTHING_FACTOR * latency + \
+                (1 - LATENCY_SMOOTHING_FACTOR) * self._latency
+        if self._best_latency is None or self._latency < self._best_latency:
+            self._best_latency = self._latency
+
+    def _is_latency_degraded(self):
+        if self._best_latency is None or self._best_latency <= 0:
+            return False
+        return self._latency > self._best_latency * self.latency_tolerance
+
+    def _decrease(self, reason):
+        self._healthy_calls = 0
+        if self._calls < self._recover_after:
+            return
+        # Calls sent before the decrease may still report the same condition
+        self._recover_after = self._calls + self.in_flight + 1
+        limit = max(self.min_limit, int(self.limit * self.decrease_factor))
+        if self._latency is not None:
+            # The latency of the new limit becomes the reference
+            self._best_latency = self._latency
+        self._set_limit(limit, reason)
+
+    def _set_limit(self, limit, reason):
+        self._healthy_calls = 0
+        if limit == self.limit:
+            return
+        logging.debug(
+            'Concurrency limit {} -> {}. {}'.format(self.limit, limit, reason))
+        self.limit = limit
+        self._condition.notify_all()
+        for listener in self._listeners:
+            try:
+                listener(limit, reason)
+            except Exception as ex:
+                logging.debug('Concurrency listener error. {}'.format(ex))
+
+
+def run_with_slot(controller, function, *args):
+    """
+    Executes the function in a slot of the controller. When the function
+    returns a Future, the slot is released once the future completes.
+    """
+    controller.acquire()
+    try:
+        result = function(*args)
+    except Exception:
+        controller.release()
+        raise
+    if isinstance(result, Future):
+        result.add_done_callback(lambda future: controller.release())
+    else:
+        controller.release()
+    return result
@@ -0,0 +1,420 @@
+"""
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import json
+import logging
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from .testresult import TestResults, TestResult
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_RETRY_AFTER = 1
+DEFAULT_MODIFIED_AT = 1600000000000
+DEFAULT_CLUSTER_CORES = 8
+
+
+class FakeWorkspace(object):
+    """
+    In-memory stand-in of the workspace and jobs endpoints used by Nutter.
+    Runs go through PENDING and RUNNING based on the wall clock and return
+    serialized TestResults as exit value, like a Nutter fixture does.
+
+    run_duration and pending_duration are seconds, or functions of the
+    notebook path returning seconds. failure_rate is the fraction of
+    notebooks with a failed test case, run_failure_rate the fraction of runs
+    that fail without output. throttle_rate and error_rate are the
+    fractions of requests answered with a 429 or a 503.
+    A terminated cluster fails its active runs and the runs submitted to it
+    with an INTERNAL_ERROR.
+    """
+
+    def __init__(self, notebooks=None, run_duration=0, pending_duration=0,
+                 failure_rate=0, run_failure_rate=0, throttle_rate=0,
+                 error_rate=0, test_cases=1, retry_after=DEFAULT_RETRY_AFTER,
+                 cluster_cores=DEFAULT_CLUSTER_CORES, seed=None):
+        self.notebooks = list(notebooks or [])
+        self.run_duration = run_duration
+        self.pending_duration = pending_duration
+        self.failure_rate = failure_rate
+        self.run_failure_rate = run_failure_rate
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.test_cases = test_cases
+        self.retry_after = retry_after
+        self.cluster_cores = cluster_cores
+        self.runs = {}
+        self.terminated_clusters = set()
+        self.requests = {}
+        self.throttled = 0
+        self.errors = 0
+        self._idempotency_tokens = {}
+        self._next_run_id = 1
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def with_test_notebooks(cls, count, folders=1, **kwargs):
+        notebooks = ['/tests/folder_{}/test_{}'.format(index % folders, index)
+                     for index in range(0, count)]
+        return cls(notebooks, **kwargs)
+
+    @property
+    def active_runs(self):
+        now = time.time()
+        with self._lock:
+            return len([run for run in self.runs.values()
+                        if run.life_cycle_state(now) != 'TERMINATED'])
+
+    def terminate_cluster(self, cluster_id):
+        now = time.time()
+        with self._lock:
+            self.terminated_clusters.add(cluster_id)
+            for run in self.runs.values():
+                if run.cluster_id == cluster_id:
+                    run.terminate(now)
+
+    def handle(self, method, path, query, body):
+        """
+        Returns the status code, the headers and the body of the response.
+        """
+        with self._lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+            draw = self._random.random()
+        if draw < self.throttle_rate:
+            with self._lock:
+                self.throttled += 1
+            return 429, {'Retry-After': str(self.retry_after)}, \
+                {'error_code': 'REQUEST_LIMIT_EXCEEDED'}
+        if draw < self.throttle_rate + self.error_rate:
+            with self._lock:
+                self.errors += 1
+            return 503, {}, {'error_code': 'TEMPORARILY_UNAVAILABLE'}
+
+        endpoint = '/'.join(path.strip('/').split('/')[2:])
+        if method == 'GET' and endpoint == 'workspace/list':
+            return self._list(query.get('path', '/'))
+        if method == 'POST' and endpoint == 'jobs/runs/submit':
+            return self._submit(body)
+        if method == 'GET' and endpoint == 'jobs/runs/get':
+            return self._get_run(query.get('run_id'), lambda run: run.to_run())
+        if method == 'GET' and endpoint == 'jobs/runs/get-output':
+            return self._get_run(query.get('run_id'), lambda run: run.to_output())
+        if method == 'POST' and endpoint == 'jobs/runs/cancel':
+            return self._get_run(body.get('run_id'), lambda run: run.cancel())
+        if method == 'GET' and endpoint == 'clusters/get':
+            return self._get_cluster(query.get('cluster_id'))
+        return 404, {}, {'error_code': 'ENDPOINT_NOT_FOUND'}
+
+    def _list(self, path):
+        prefix = path.rstrip('/') + '/'
+        objects = {}
+        for notebook in self.notebooks:
+            if not notebook.startswith(prefix):
+                continue
+            name = notebook[len(prefix):].split('/')[0]
+            child = prefix + name
+            if child == notebook:
+                objects[child] = {'object_type': 'NOTEBOOK', 'path': child,
+                                  'language': 'PYTHON'}
+                continue
+            objects[child] = {'object_type': 'DIRECTORY', 'path': child,
+                              'modified_at': DEFAULT_MODIFIED_AT}
+        if len(objects) == 0 and path != '/':
+            return 404, {}, {'error_code': 'RESOURCE_DOES_NOT_EXIST'}
+        return 200, {}, {'objects': [objects[key] for key in sorted(objects)]}
+
+    def _get_cluster(self, cluster_id):
+        with self._lock:
+            state = 'TERMINATED' \
+                if cluster_id in self.terminated_clusters else 'RUNNING'
+        return 200, {}, {'cluster_id': cluster_id, 'state': state,
+                         'cluster_cores': self.cluster_cores}
+
+    def _submit(self, body):
+        token = body.get('idempotency_token')
+        tasks = body.get('tasks')
+        with self._lock:
+            if token is not None and token in self._idempotency_tokens:
+                return 200, {}, {'run_id': self._idempotency_tokens[token]}
+            run_id = self._new_run_id()
+            if tasks is None:
+                run = self._new_run(run_id, body['notebook_task'],
+                                    body.get('existing_cluster_id'))
+            else:
+                run = FakeMultiTaskRun(run_id, [
+                    self._new_run(self._new_run_id(), task['notebook_task'],
+                                  task.get('existing_cluster_id'), task['task_key'])
+                    for task in tasks])
+                for task_run in run.tasks:
+                    self.runs[task_run.run_id] = task_run
+            self.runs[run_id] = run
+            if token is not None:
+                self._idempotency_tokens[token] = run_id
+        return 200, {}, {'run_id': run_id}
+
+    def _get_run(self, run_id, response_function):
+        with self._lock:
+            run = self.runs.get(int(run_id or 0))
+        if run is None:
+            return 400, {}, {'error_code': 'INVALID_PARAMETER_VALUE',
+                             'message': 'Run {} does not exist.'.format(run_id)}
+        return 200, {}, response_function(run)
+
+    def _new_run_id(self):
+        run_id = self._next_run_id
+        self._next_run_id += 1
+        return run_id
+
+    def _new_run(self, run_id, notebook_task, cluster_id=None, task_key=None):
+        notebook_path = notebook_task['notebook_path']
+        run = FakeRun(run_id, notebook_path,
+                      _get_value(self.pending_duration, notebook_path),
+                      _get_value(self.run_duration, notebook_path),
+                      self._random.random() < self.failure_rate,
+                      self._random.random() < self.run_failure_rate,
+                      self.test_cases, task_key, cluster_id)
+        if cluster_id in self.terminated_clusters:
+            run.terminate(run.submitted_at)
+        return run
+
+
+class FakeRun(object):
+    def __init__(self, run_id, notebook_path, pending_duration, run_duration,
+                 test_failed=False, run_failed=False, test_cases=1, task_key=None,
+                 cluster_id=None):
+        self.run_id = run_id
+        self.notebook_path = notebook_path
+        self.task_key = task_key
+        self.cluster_id = cluster_id
+        self.submitted_at = time.time()
+        self.started_at = self.submitted_at + pending_duration
+        self.finishes_at = self.started_at + run_duration
+        self.test_failed = test_failed
+        self.run_failed = run_failed
+        self.test_cases = test_cases
+        self.cancelled_at = None
+        self.terminated_at = None
+
+    def life_cycle_state(self, now=None):
+        now = now or time.time()
+        if self.terminated_at is not None:
+            return 'INTERNAL_ERROR'
+        if self.cancelled_at is not None or now >= self.finishes_at:
+            return 'TERMINATED'
+        if now >= self.started_at:
+            return 'RUNNING'
+        return 'PENDING'
+
+    def result_state(self):
+        life_cycle_state = self.life_cycle_state()
+        if life_cycle_state == 'INTERNAL_ERROR':
+            return 'FAILED'
+        if life_cycle_state != 'TERMINATED':
+            return None
+        if self.cancelled_at is not None:
+            return 'CANCELED'
+        if self.run_failed:
+            return 'FAILED'
+        return 'SUCCESS'
+
+    def cancel(self):
+        if self.life_cycle_state() not in ('TERMINATED', 'INTERNAL_ERROR'):
+            self.cancelled_at = time.time()
+        return {}
+
+    def terminate(self, now):
+        # The cluster of the run terminated
+        if self.life_cycle_state(now) != 'TERMINATED':
+            self.terminated_at = now
+
+    def to_run(self):
+        state = {'life_cycle_state': self.life_cycle_state(), 'state_message': ''}
+        result_state = self.result_state()
+        if result_state is not None:
+            state['result_state'] = result_state
+        run = {'run_id': self.run_id,
+               'run_name': 'nutter',
+               'state': state,
+               'task': {'notebook_task': {'notebook_path': self.notebook_path}},
+               'start_time': int(self.submitted_at * 1000),
+               'run_page_url': 'http://localhost/#job/1/run/{}'.format(self.run_id)}
+        if self.cluster_id is not None:
+            run['cluster_spec'] = {'existing_cluster_id': self.cluster_id}
+            run['cluster_instance'] = {'cluster_id': self.cluster_id}
+        if self.task_key is not None:
+            run['task_key'] = self.task_key
+            run['notebook_task'] = run['task']['notebook_task']
+        if result_state is not None:
+            end_time = min(self.finishes_at, self.cancelled_at or self.finishes_at,
+                           self.terminated_at or self.finishes_at)
+            run['end_time'] = int(end_time * 1000)
+        return run
+
+    def to_output(self):
+        output = {'metadata': self.to_run()}
+        result_state = self.result_state()
+        if result_state == 'SUCCESS':
+            output['notebook_output'] = {'result': self._get_test_results().serialize(),
+                                         'truncated': False}
+        elif result_state is not None:
+            output['error'] = 'Run {}'.format(result_state.lower())
+        return output
+
+    def _get_test_results(self):
+        test_results = TestResults()
+        for index in range(0, self.test_cases):
+            passed = not (self.test_failed and index == 0)
+            exception = None if passed else AssertionError('Expected failure')
+            test_results.append(TestResult('test_case_{}'.format(index), passed,
+                                           0.01, [], exception))
+        return test_results
+
+
+class FakeMultiTaskRun(object):
+    def __init__(self, run_id, tasks):
+        self.run_id = run_id
+        self.tasks = tasks
+
+    def life_cycle_state(self, now=None):
+        states = [task.life_cycle_state(now) for task in self.tasks]
+        if all(state in ('TERMINATED', 'INTERNAL_ERROR') for state in states):
+            return 'INTERNAL_ERROR' if 'INTERNAL_ERROR' in states else 'TERMINATED'
+        if 'RUNNING' in states:
+            return 'RUNNING'
+        return 'PENDING'
+
+    def cancel(self):
+        for task in self.tasks:
+            task.cancel()
+        return {}
+
+    def to_run(self):
+        state = {'life_cycle_state': self.life_cycle_state(), 'state_message': ''}
+        if state['life_cycle_state'] in ('TERMINATED', 'INTERNAL_ERROR'):
+            results = [task.result_state() for task in self.tasks]
+            state['result_state'] = 'SUCCESS' if all(
+                result == 'SUCCESS' for result in results) else 'FAILED'
+        return {'run_id': self.run_id,
+                'run_name': 'nutter',
+                'state': state,
+                'tasks': [task.to_run() for task in self.tasks],
+                'run_page_url': 'http://localhost/#job/1/run/{}'.format(self.run_id)}
+
+    def to_output(self):
+        return {'metadata': self.to_run(),
+                'error': 'Retrieving the output of a multi-task run is not supported'}
+
+
+class FakeWorkspaceServer(object):
+    """
+    Serves a FakeWorkspace on localhost. The url of the server can be used
+    as DATABRICKS_HOST.
+    """
+
+    def __init__(self, workspace, host=DEFAULT_HOST, port=0):
+        self.workspace = workspace
+        self._server = ThreadingHTTPServer((host, port), _get_handler(workspace))
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name='FakeWorkspaceServer')
+        self._thread.daemon = True
+        self._thread.start()
+        logging.debug('Fake workspace listening on {}'.format(self.url))
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+def _get_handler(workspace):
+    class FakeWorkspaceHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # Headers and body are written separately, Nagle would delay every response
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            self._handle('GET')
+
+        def do_POST(self):
+            self._handle('POST')
+
+        def log_message(self, format, *args):
+            logging.debug('Fake workspace: ' + format % args)
+
+        def _handle(self, method):
+            url = urlparse(self.path)
+            query = {key: values[0] for key, values in parse_qs(url.query).items()}
+            body = {}
+            length = int(self.headers.get('Content-Length') or 0)
+            if length > 0:
+                body = json.loads(self.rfile.read(length))
+            status, headers, response = workspace.handle(method, url.path, query, body)
+            content = json.dumps(response).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(content)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(content)
+
+    return FakeWorkspaceHandler
+
+
+def _get_value(value, notebook_path):
+    if callable(value):
+        return value(notebook_path)
+    return value
+
+
+def serve(notebooks=100, folders=1, port=8080, run_duration=0, pending_duration=0,
+          failure_rate=0, run_failure_rate=0, throttle_rate=0, error_rate=0,
+          test_cases=1, seed=None):
+    """
+    Serves a fake workspace with the given number of test notebooks on localhost.
+    """
+    workspace = FakeWorkspace.with_test_notebooks(
+        notebooks, folders, run_duration=run_duration,
+        pending_duration=pending_duration, failure_rate=failure_rate,
+        run_failure_rate=run_failure_rate, throttle_rate=throttle_rate,
+        error_rate=error_rate, test_cases=test_cases, seed=seed)
+    server = FakeWorkspaceServer(workspace, port=port)
+    print('Fake workspace listening on {}'.format(server.url))
+    server.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+def main():
+    import fire
+    fire.Fire(serve)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import json
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+API_VERSION = '2.0'
+# Multi-task runs are only available in the Jobs API 2.1
+MULTI_TASK_API_VERSION = '2.1'
+DEFAULT_POOL_SIZE = 10
+
+
+def get_http_client(host, token, pool_size=DEFAULT_POOL_SIZE):
+    return DatabricksHttpClient(host, token, pool_size)
+
+
+def loads(content):
+    if not content:
+        return {}
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+class DatabricksHttpClient(object):
+    """
+    Thin REST client for the Databricks endpoints used by Nutter.
+    All the services share a single keep-alive session.
+    """
+
+    def __init__(self, host, token, pool_size=DEFAULT_POOL_SIZE):
+        if not host:
+            raise ValueError('empty host')
+        self.url = self._get_api_url(host)
+        self.session = requests.Session()
+        self.session.headers.update({
+            'Authorization': 'Bearer {}'.format(token),
+            'Content-Type': 'application/json',
+            'User-Agent': 'nutter'})
+        self.pool_size = 0
+        self.set_pool_size(pool_size)
+        self._transfer = threading.local()
+
+        self.workspace = WorkspaceService(self)
+        self.jobs = JobsService(self)
+        self.clusters = ClustersService(self)
+
+    def set_pool_size(self, pool_size):
+        if pool_size <= self.pool_size:
+            return
+        logging.debug('HTTP connection pool size: {}'.format(pool_size))
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.pool_size = pool_size
+
+    def perform_query(self, method, path, data=None, version=API_VERSION):
+        url = '{}/{}/{}'.format(self.url, version, path)
+        if method == 'GET':
+            response = self.session.request(method, url, params=data)
+        else:
+            response = self.session.request(method, url, data=json.dumps(data))
+
+        received = len(response.content or b'')
+        self._transfer.bytes_received = self.bytes_received() + received
+        response.raise_for_status()
+        return loads(response.content)
+
+    def bytes_received(self):
+        """
+        Number of response bytes received by the calling thread.
+        """
+        return getattr(self._transfer, 'bytes_received', 0)
+
+    def close(self):
+        self.session.close()
+
+    def _get_api_url(self, host):
+        host = host.rstrip('/')
+        if not host.startswith('https://') and not host.startswith('http://'):
+            host = 'https://' + host
+        return host + '/api'
+
+
+class WorkspaceService(object):
+    def __init__(self, client):
+        self.client = client
+
+    def list(self, path):
+        return self.client.perform_query('GET', 'workspace/list', {'path': path})
+
+
+class ClustersService(object):
+    def __init__(self, client):
+        self.client = client
+
+    def get(self, cluster_id):
+        return self.client.perform_query(
+            'GET', 'clusters/get', {'cluster_id': cluster_id})
+
+
+class JobsService(object):
+    def __init__(self, client):
+        self.client = client
+
+    def submit_run(self, run_name=None, existing_cluster_id=None,
+                   notebook_task=None, idempotency_token=None):
+        data = {}
+        if run_name is not None:
+            data['run_name'] = run_name
+        if existing_cluster_id is not None:
+            data['existing_cluster_id'] = existing_cluster_id
+        if notebook_task is not None:
+            data['notebook_task'] = notebook_task
+        if idempotency_token is not None:
+            data['idempotency_token'] = idempotency_token
+        return self.client.perform_query('POST', 'jobs/runs/submit', data)
+
+    def submit_multi_task_run(self, run_name=None, tasks=None, idempotency_token=None):
+        data = {'tasks': tasks or []}
+        if run_name is not None:
+            data['run_name'] = run_name
+        if idempotency_token is not None:
+            data['idempotency_token'] = idempotency_token
+        return self.client.perform_query('POST', 'jobs/runs/submit', data,
+                                         version=MULTI_TASK_API_VERSION)
+
+    def get_multi_task_run(self, run_id):
+        return self.client.perform_query('GET', 'jobs/runs/get', {'run_id': run_id},
+                                         version=MULTI_TASK_API_VERSION)
+
+    def get_run(self, run_id):
+        return self.client.perform_query('GET', 'jobs/runs/get', {'run_id': run_id})
+
+    def get_run_output(self, run_id):
+        return self.client.perform_query(
+            'GET', 'jobs/runs/get-output', {'run_id': run_id})
+
+    def cancel_run(self, run_id):
+        return self.client.perform_query(
+            'POST', 'jobs/runs/cancel', {'run_id': run_id})
@@ -4,44 +4,236 @@ Licensed under the MIT license.
 """
 
 import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
 from time import sleep
-from requests.exceptions import HTTPError
+from requests.exceptions import HTTPError, ConnectionError
+
+DEFAULT_MAX_RETRIES = 20
+DEFAULT_DELAY = 2
+DEFAULT_MAX_DELAY = 60
+DEFAULT_RATE = 20
+DEFAULT_MIN_RATE = 1
+TOO_MANY_REQUESTS = 429
+
+
+class RetryPolicy(object):
+    def __init__(self, max_retries=DEFAULT_MAX_RETRIES, delay=DEFAULT_DELAY,
+                 max_delay=DEFAULT_MAX_DELAY):
+        if max_retries < 0:
+            raise ValueError('max_retries must be a positive value')
+        self.max_retries = max_retries
+        self.delay = delay
+        self.max_delay = max(max_delay, delay)
+
+    def backoff(self, attempt):
+        # Full jitter: a random wait between 0 and the capped exponential delay
+        exp_delay = min(self.max_delay, self.delay * (2 ** attempt))
+        return random.uniform(0, exp_delay)
 
 
 class HTTPRetrier(object):
-    def __init__(self, max_retries=20, delay=30):
-        self._max_retries = max_retries
-        self._delay = delay
-        self._tries = 0
+    """
+    Retries throttled (429), server (5xx), INVALID_STATE and connection errors
+    with full-jitter exponential backoff. The state of every call is local
+    to the call, so a single retrier can be shared by multiple threads.
+    The policy can be overridden per endpoint, using the name of the
+    function executed as the key, e.g. {'submit_run': RetryPolicy(3)}.
+    All calls go through a shared token bucket that slows down
+    every caller when the service throttles, and through the circuit
+    breaker, if provided, that stops all callers when the service is down.
+    Only the server errors and the connection errors are failures of the
+    circuit breaker: a throttled or INVALID_STATE response shows that the
+    service is reachable, and is slowed down by the token bucket instead.
+    Listeners are called after every attempt with the latency of the call
+    and whether it was throttled or failed.
+    """
+
+    def __init__(self, max_retries=DEFAULT_MAX_RETRIES, delay=DEFAULT_DELAY,
+                 max_delay=DEFAULT_MAX_DELAY, policies=None, rate_limiter=None,
+                 circuit_breaker=None):
+        self._default_policy = RetryPolicy(max_retries, delay, max_delay)
+        self._policies = policies or {}
+        if rate_limiter is None:
+            rate_limiter = TokenBucket()
+        self.rate_limiter = rate_limiter
+        self.circuit_breaker = circuit_breaker
+        self._listeners = []
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self._listeners.remove(listener)
+
+    def get_policy(self, function):
+        name = getattr(function, '__name__', None)
+        return self._policies.get(name, self._default_policy)
 
     def execute(self, function, *args, **kwargs):
-        waitfor = self._delay
-        retry = True
-        self._tries = 0
-        while retry:
+        policy = self.get_policy(function)
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire()
+            self._before_call()
+            started = time.time()
             try:
-                retry = self._tries < self._max_retries
                 logging.debug(
                     'Executing function with HTTP retry policy. Max tries:{}  delay:{}'
-                    .format(self._max_retries, self._delay))
+                    .format(policy.max_retries, policy.delay))
 
-                return function(*args, **kwargs)
+                result = function(*args, **kwargs)
+                self.rate_limiter.on_success()
+                self._record_call(True)
+                self._notify(function, started)
+                return result
             except HTTPError as exc:
                 logging.debug("Error: {0}".format(str(exc)))
-                if not retry:
+                if not self._is_retriable(exc.response):
+                    # The service is reachable, the request is invalid
+                    self._record_call(True)
                     raise
-                if isinstance(exc.response.status_code, int):
-                    if exc.response.status_code < 500:
-                        if not self._is_invalid_state_response(exc.response):
-                            raise
-            if retry:
-                logging.debug(
-                    'Retrying in {0}s, {1} of {2} retries'
-                    .format(str(waitfor), str(self._tries+1), str(self._max_retries)))
-                sleep(waitfor)
-            self._tries = self._tries + 1
+                retry_after = self._on_retriable_error(function, started, exc.response)
+                if attempt >= policy.max_retries:
+                    raise
+                waitfor = policy.backoff(attempt)
+                if retry_after is not None:
+                    waitfor = max(waitfor, retry_after)
+            except ConnectionError as exc:
+                logging.debug("Error: {0}".format(str(exc)))
+                self._record_call(False)
+                self._notify(function, started, failed=True)
+                if attempt >= policy.max_retries:
+                    raise
+                waitfor = policy.backoff(attempt)
+            except Exception:
+                self._record_call(True)
+                raise
+
+            logging.debug(
+                'Retrying in {0:.2f}s, {1} of {2} retries'
+                .format(waitfor, attempt + 1, policy.max_retries))
+            sleep(waitfor)
+            attempt = attempt + 1
+
+    def _on_retriable_error(self, function, started, response):
+        """
+        Records the error and returns the delay requested by the service.
+        """
+        throttled = self._is_throttled(response)
+        self._record_call(throttled)
+        self._notify(function, started, throttled=throttled, failed=not throttled)
+        if response.status_code != TOO_MANY_REQUESTS:
+            return None
+        retry_after = self._get_retry_after(response)
+        self.rate_limiter.on_throttle(retry_after)
+        return retry_after
+
+    def _before_call(self):
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.before_call()
+
+    def _record_call(self, success):
+        if self.circuit_breaker is None:
+            return
+        if success:
+            self.circuit_breaker.record_success()
+            return
+        self.circuit_breaker.record_failure()
+
+    def _notify(self, function, started, throttled=False, failed=False):
+        latency = time.time() - started
+        name = getattr(function, '__name__', None)
+        for listener in self._listeners:
+            try:
+                listener(name, latency, throttled, failed)
+            except Exception as ex:
+                logging.debug('Retrier listener error. {}'.format(ex))
+
+    def _is_throttled(self, response):
+        # INVALID_STATE is returned when too many runs are active
+        if response is None or not isinstance(response.status_code, int):
+            return False
+        if response.status_code == TOO_MANY_REQUESTS:
+            return True
+        return self._is_invalid_state_response(response)
+
+    def _is_retriable(self, response):
+        if response is None or not isinstance(response.status_code, int):
+            return True
+        if response.status_code >= 500:
+            return True
+        if response.status_code == TOO_MANY_REQUESTS:
+            return True
+        return self._is_invalid_state_response(response)
 
     def _is_invalid_state_response(self, response):
         if response.status_code == 400:
             return 'INVALID_STATE' in response.text
         return False
+
+    def _get_retry_after(self, response):
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+        try:
+            return max(0, float(value))
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(value)
+            return max(0, retry_at.timestamp() - time.time())
+        except (TypeError, ValueError):
+            logging.debug('Invalid Retry-After header {}'.format(value))
+            return None
+
+
+class TokenBucket(object):
+    """
+    Client-wide rate limiter. The refill rate is halved every time the
+    service throttles and recovers additively after successful calls.
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, min_rate=DEFAULT_MIN_RATE):
+        if rate < min_rate or min_rate <= 0:
+            raise ValueError('Invalid rate. rate:{} min rate:{}'.format(rate, min_rate))
+        self.max_rate = rate
+        self.min_rate = min_rate
+        self.rate = rate
+        self._capacity = rate
+        self._tokens = rate
+        self._last_refill = time.time()
+        self._paused_until = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.time()
+                self._refill(now)
+                wait = self._paused_until - now
+                if wait <= 0:
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            sleep(wait)
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + 0.1)
+
+    def on_throttle(self, retry_after=None):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = min(self._tokens, 0)
+            if retry_after is not None:
+                self._paused_until = max(self._paused_until, time.time() + retry_after)
+            logging.debug('Throttled. Rate reduced to {:.2f} calls/s'.format(self.rate))
+
+    def _refill(self, now):
+        elapsed = now - self._last_refill
+        self._tokens = min(self._capacity, self._tokens + elapsed * self.rate)
+        self._last_refill = now
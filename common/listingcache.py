@@ -0,0 +1,111 @@
+"""
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+from .runhistory import get_cache_dir
+
+LISTING_CACHE_FILE_NAME = 'listing.sqlite'
+
+
+def get_listing_cache(scope):
+    path = os.path.join(get_cache_dir(), LISTING_CACHE_FILE_NAME)
+    return ListingCache(path, scope)
+
+
+class ListingCache(object):
+    """
+    Local cache of workspace directory listings, scoped by workspace host.
+    An entry is only valid while the modification time of the directory,
+    as returned by the listing of its parent, is unchanged.
+    When path is None the cache is kept in memory only.
+    """
+
+    def __init__(self, path=None, scope=''):
+        self.path = path
+        self.scope = scope or ''
+        self.hits = 0
+        self.misses = 0
+        self._pending = []
+        self._connection = None
+        self._disabled = False
+        self._lock = threading.Lock()
+
+    def get(self, directory_path, modified_at):
+        """
+        Returns the cached list response of the directory or None.
+        """
+        if modified_at is None:
+            return None
+        with self._lock:
+            row = self._execute(
+                'SELECT objects FROM listings '
+                'WHERE scope = ? AND path = ? AND modified_at = ?',
+                (self.scope, directory_path, modified_at))
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, directory_path, modified_at, objects):
+        if modified_at is None:
+            return
+        with self._lock:
+            self._pending.append(
+                (self.scope, directory_path, modified_at, json.dumps(objects)))
+
+    def save(self):
+        with self._lock:
+            if len(self._pending) == 0:
+                return
+            connection = self._get_connection()
+            if connection is None:
+                return
+            try:
+                with connection:
+                    connection.executemany(
+                        'INSERT OR REPLACE INTO listings '
+                        '(scope, path, modified_at, objects) VALUES (?, ?, ?, ?)',
+                        self._pending)
+            except sqlite3.Error as ex:
+                logging.debug('Listing cache could not be saved. {}'.format(ex))
+            self._pending = []
+        logging.debug('Listing cache hits:{} misses:{}'.format(self.hits, self.misses))
+
+    def _execute(self, query, parameters):
+        connection = self._get_connection()
+        if connection is None:
+            return None
+        try:
+            return connection.execute(query, parameters).fetchone()
+        except sqlite3.Error as ex:
+            logging.debug('Listing cache query failed. {}'.format(ex))
+            return None
+
+    def _get_connection(self):
+        if self._connection is not None or self._disabled:
+            return self._connection
+        try:
+            database = ':memory:'
+            if self.path is not None:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                database = self.path
+            # Listings run on multiple threads, access is serialized by the lock
+            connection = sqlite3.connect(database, check_same_thread=False)
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS listings (scope TEXT, path TEXT, '
+                'modified_at INTEGER, objects TEXT, PRIMARY KEY (scope, path))')
+            self._connection = connection
+        except (OSError, sqlite3.Error) as ex:
+            logging.debug('Listing cache is disabled. {}'.format(ex))
+            self._disabled = True
+        return self._connection
@@ -6,6 +6,7 @@ Licensed under the MIT license.
 from abc import abstractmethod, ABCMeta
 from .testresult import TestResults
 from junit_xml import TestSuite, TestCase
+from xml.etree import ElementTree
 import datetime
 import logging
 
@@ -20,6 +21,18 @@ class TestResultsReportWriter(object):
     def add_result(self, notebook_path, test_result):
         pass
 
+    @abstractmethod
+    def add_report_file(self, path):
+        pass
+
+    def add_results(self, exec_results):
+        """
+        Adds the execution results, e.g. a results store. They are read one
+        at a time each time the report is written, instead of being kept
+        in the writer, so exec_results must be iterable more than once.
+        """
+        self._results_sources.append(exec_results)
+
     @abstractmethod
     def to_file(self, path):
         pass
@@ -32,6 +45,15 @@ class TestResultsReportWriter(object):
     def write(self):
         pass
 
+    def _iter_added_results(self):
+        for exec_results in self._results_sources:
+            for exec_result in exec_results:
+                if exec_result.test_results is None:
+                    logging.debug(
+                        'No test results for {}.'.format(exec_result.notebook_path))
+                    continue
+                yield exec_result.notebook_path, exec_result.test_results
+
     def _validate_add_results(self, notebook_path, test_result):
         if not isinstance(test_result, TestResults):
             raise ValueError('Expected an instance of TestResults')
@@ -39,16 +61,30 @@ class TestResultsReportWriter(object):
             raise ValueError("Invalid notebook path")
 
 class TagsReportRow(object):
-    def __init__(self, notebook_name, test_result):
+    def __init__(self, notebook_name, test_name, passed_str, duration, tags):
         self.notebook_name = notebook_name
-        self.test_name = test_result.test_name
-        self.passed_str = 'PASSED'
+        self.test_name = test_name
+        self.passed_str = passed_str
+        self.duration = duration
+        self.tags = tags
+
+    @classmethod
+    def from_test_result(cls, notebook_name, test_result):
+        passed_str = 'PASSED'
         if not test_result.passed:
-            self.passed_str = 'FAILED'
-        self.duration = test_result.execution_time
-        self.tags = self._to_tag_string(test_result.tags)
-
-    def _to_tag_string(self, tags):
+            passed_str = 'FAILED'
+        return cls(notebook_name, test_result.test_name, passed_str,
+                   test_result.execution_time, cls._to_tag_string(test_result.tags))
+
+    @classmethod
+    def from_string(cls, line):
+        # The notebook path can contain commas, the other columns cannot
+        tags, rest = line.rstrip('\n').split(',', 1)
+        notebook_name, test_name, passed_str, duration = rest.rsplit(',', 3)
+        return cls(notebook_name, test_name, passed_str, duration, tags)
+
+    @classmethod
+    def _to_tag_string(cls, tags):
         logging.debug(tags)
         if tags is None:
             return ''
@@ -67,16 +103,22 @@ class TagsReportWriter(TestResultsReportWriter):
     def __init__(self):
         super().__init__()
         self._rows = []
+        self._results_sources = []
 
     def add_result(self, notebook_path, test_result):
         self._validate_add_results(notebook_path, test_result)
 
-        new_rows = [TagsReportRow(notebook_path, test_result)
+        new_rows = [TagsReportRow.from_test_result(notebook_path, test_result)
                     for test_result in test_result.results]
         self._rows.extend(new_rows)
 
+    def add_report_file(self, path):
+        with open(path, 'r') as file:
+            self._rows.extend(TagsReportRow.from_string(line)
+                              for line in file if line.strip())
+
     def has_data(self):
-        return len(self._rows) > 0
+        return next(self._iter_rows(), None) is not None
 
     def write(self):
         report_name = 'test-nutter-tags.{0:%Y.%m.%d.%H%M%S%f}.txt'.format(
@@ -88,16 +130,23 @@ class TagsReportWriter(TestResultsReportWriter):
     def to_file(self, path):
         file = open(path, 'w')
         try:
-            for row in self._rows:
+            for row in self._iter_rows():
                 file.write(row.to_string())
         finally:
             file.close()
 
+    def _iter_rows(self):
+        yield from self._rows
+        for notebook_path, test_result in self._iter_added_results():
+            for t_result in test_result.results:
+                yield TagsReportRow.from_test_result(notebook_path, t_result)
+
 
 class JunitXMLReportWriter(TestResultsReportWriter):
     def __init__(self):
         super().__init__()
         self.all_test_suites = []
+        self._results_sources = []
 
     def add_result(self, notebook_path, test_result):
         self._validate_add_results(notebook_path, test_result)
@@ -105,6 +154,38 @@ class JunitXMLReportWriter(TestResultsReportWriter):
         t_suite = self._to_junitxml(notebook_path, test_result)
         self.all_test_suites.append(t_suite)
 
+    def add_report_file(self, path):
+        root = ElementTree.parse(path).getroot()
+        suites = [root] if root.tag == 'testsuite' else root.findall('testsuite')
+        for suite in suites:
+            t_suite = TestSuite(suite.get('name', 'nutter'))
+            for case in suite.findall('testcase'):
+                t_suite.test_cases.append(self._from_junitxml(case))
+            self.all_test_suites.append(t_suite)
+
+    def _from_junitxml(self, case):
+        t_case = TestCase(case.get('name'),
+                          classname=case.get('classname'),
+                          elapsed_sec=float(case.get('time') or 0),
+                          stdout=self._get_text(case, 'system-out'),
+                          stderr=self._get_text(case, 'system-err'))
+        failure = case.find('failure')
+        if failure is not None:
+            t_case.add_failure_info(failure.get('message'), failure.text)
+        error = case.find('error')
+        if error is not None:
+            t_case.add_error_info(error.get('message'), error.text)
+        skipped = case.find('skipped')
+        if skipped is not None:
+            t_case.add_skipped_info(skipped.get('message'), skipped.text)
+        return t_case
+
+    def _get_text(self, case, tag):
+        element = case.find(tag)
+        if element is None:
+            return None
+        return element.text
+
     def _to_junitxml(self, notebook_path, test_result):
         tsuite = TestSuite("nutter")
         for t_result in test_result.results:
@@ -128,7 +209,7 @@ class JunitXMLReportWriter(TestResultsReportWriter):
         return tsuite
 
     def has_data(self):
-        return len(self.all_test_suites) > 0
+        return next(self._iter_test_suites(), None) is not None
 
     def write(self):
         report_name = 'test-nutter-result.{0:%Y.%m.%d.%H%M%S%f}.xml'.format(
@@ -140,6 +221,32 @@ class JunitXMLReportWriter(TestResultsReportWriter):
     def to_file(self, path):
         file = open(path, 'w')
         try:
-            file.write(TestSuite.to_xml_string(self.all_test_suites))
+            self._write_xml(file)
         finally:
             file.close()
+
+    def _write_xml(self, file):
+        # Same document as TestSuite.to_xml_string, written one test suite
+        # at a time. The totals come first, so the suites are read twice.
+        totals = {'disabled': 0, 'errors': 0, 'failures': 0, 'tests': 0, 'time': 0.0}
+        for t_suite in self._iter_test_suites():
+            ts_xml = t_suite.build_xml_doc()
+            for key in totals:
+                totals[key] += type(totals[key])(ts_xml.get(key, 0))
+        attributes = ' '.join('{}="{}"'.format(key, value)
+                              for key, value in totals.items())
+        file.write('<?xml version="1.0" ?>\n<testsuites {}>\n'.format(attributes))
+        for t_suite in self._iter_test_suites():
+            file.write(self._to_xml_string(t_suite))
+        file.write('</testsuites>\n')
+
+    def _to_xml_string(self, t_suite):
+        # The pretty printed suite, without the testsuites element around it
+        xml_string = TestSuite.to_xml_string([t_suite])
+        start = xml_string.index('\n', xml_string.index('<testsuites')) + 1
+        return xml_string[start:xml_string.rindex('</testsuites>')]
+
+    def _iter_test_suites(self):
+        yield from self.all_test_suites
+        for notebook_path, test_result in self._iter_added_results():
+            yield self._to_junitxml(notebook_path, test_result)
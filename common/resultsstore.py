@@ -0,0 +1,141 @@
+"""
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import json
+import logging
+import os
+import tempfile
+import threading
+
+from .apiclientresults import ExecuteNotebookResult, NotebookOutputResult
+
+
+def get_results_store(path=None):
+    return ResultsStore(path)
+
+
+class ResultsStore(object):
+    """
+    Append-only store of the results of the executed notebooks. Each result
+    is written to a local file when it is added and only a compact index
+    of the results is kept in memory. Iterating the store reads the results
+    back one at a time, in the order they were added. When path is None,
+    the file is a temporary file deleted when the store is closed.
+    """
+
+    def __init__(self, path=None):
+        self._delete_on_close = path is None
+        if path is None:
+            handle, path = tempfile.mkstemp(prefix='nutter-results-', suffix='.jsonl')
+            os.close(handle)
+        self.path = path
+        self.index = []
+        self._lock = threading.Lock()
+        self._file = open(path, 'w+b')
+
+    def add(self, result):
+        if not isinstance(result, ExecuteNotebookResult):
+            raise ValueError('Expected ExecuteNotebookResult')
+        line = json.dumps(self._to_record(result), separators=(',', ':')) + '\n'
+        line = line.encode('utf-8')
+        with self._lock:
+            self._file.seek(0, os.SEEK_END)
+            entry = ResultIndexEntry.from_execution_result(
+                result, self._file.tell(), len(line))
+            self._file.write(line)
+            self.index.append(entry)
+        return entry
+
+    def read(self, entry):
+        with self._lock:
+            self._file.seek(entry.offset)
+            line = self._file.read(entry.length)
+        return self._from_record(json.loads(line.decode('utf-8')))
+
+    def iter_failed(self):
+        """
+        Yields the results with any error, without reading the others.
+        """
+        for entry in list(self.index):
+            if not entry.success:
+                yield self.read(entry)
+
+    def __iter__(self):
+        for entry in list(self.index):
+            yield self.read(entry)
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def failures(self):
+        return sum(entry.failed for entry in self.index)
+
+    def close(self):
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.close()
+        if self._delete_on_close:
+            try:
+                os.remove(self.path)
+            except OSError as ex:
+                logging.debug('The results file could not be deleted. {}'.format(ex))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _to_record(self, result):
+        notebook_result = result.notebook_result
+        exit_output = notebook_result.exit_output
+        if result.test_results is not None:
+            # The raw output is released once parsed
+            exit_output = result.test_results.serialize()
+        return {'life_cycle_state': result.task_result_state,
+                'notebook_path': result.notebook_path,
+                'result_state': notebook_result.result_state,
+                'exit_output': exit_output,
+                'run_page_url': result.notebook_run_page_url,
+                'poll_calls': result.poll_calls,
+                'duration': result.duration,
+                'bytes_received': result.bytes_received,
+                'cluster_id': result.cluster_id}
+
+    def _from_record(self, record):
+        # The test results are parsed when they are used
+        notebook_result = NotebookOutputResult(
+            record['result_state'], record['exit_output'])
+        return ExecuteNotebookResult(
+            record['life_cycle_state'], record['notebook_path'],
+            notebook_result, record['run_page_url'],
+            poll_calls=record['poll_calls'], duration=record['duration'],
+            bytes_received=record['bytes_received'], cluster_id=record['cluster_id'])
+
+
+class ResultIndexEntry(object):
+    """
+    Summary of a stored result and the position of the result in the file.
+    """
+
+    def __init__(self, notebook_path, success, passed, failed, duration, offset,
+                 length):
+        self.notebook_path = notebook_path
+        self.success = success
+        self.passed = passed
+        self.failed = failed
+        self.duration = duration
+        self.offset = offset
+        self.length = length
+
+    @classmethod
+    def from_execution_result(cls, result, offset, length):
+        passed = 0
+        if result.test_results is not None:
+            passed = result.test_results.test_cases - result.test_results.num_failures
+        return cls(result.notebook_path, not result.is_any_error, passed,
+                   result.failures, result.duration, offset, length)
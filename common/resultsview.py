@@ -2,15 +2,17 @@
 Copyright (c) Microsoft Corporation.
 Licensed under the MIT license.
 """
-import logging
 from abc import abstractmethod, ABCMeta
 from .apiclientresults import ExecuteNotebookResult
-from .testresult import TestResults, TestResult
+from .testresult import TestResult
 from .stringwriter import StringWriter
 from .api import TestNotebook
+from .resultsstore import ResultsStore
 
 
 def get_run_results_views(exec_results):
+    if isinstance(exec_results, ResultsStore):
+        return RunCommandResultsStoreView(exec_results)
     if not isinstance(exec_results, list):
         raise ValueError("Expected a List")
 
@@ -21,10 +23,18 @@ def get_run_results_views(exec_results):
     return results_view
 
 
+def get_run_results_stream_view():
+    return RunCommandResultsStreamView()
+
+
 def get_list_results_view(list_results):
     return ListCommandResultsView(list_results)
 
 
+def get_schedule_plan_view(schedule_plan):
+    return SchedulePlanView(schedule_plan)
+
+
 def print_results_view(results_view):
     if not isinstance(results_view, ResultsView):
         raise ValueError("Expected ResultsView")
@@ -94,6 +104,39 @@ class ListCommandResultView(ResultsView):
         return 1
 
 
+class SchedulePlanView(ResultsView):
+    def __init__(self, schedule_plan):
+        self.schedule_plan = schedule_plan
+        super().__init__()
+
+    def get_view(self):
+        writer = StringWriter()
+        writer.write_line('{}'.format('\nSchedule Plan'))
+        writer.write_line('-' * 55)
+        for planned_run in self.schedule_plan.planned_runs:
+            writer.write_line(
+                'Slot: {}\tStart: {:.1f}s\tExpected duration: {:.1f}s'.format(
+                    planned_run.slot, planned_run.start, planned_run.duration))
+            for notebook_path in planned_run.notebook_paths:
+                writer.write_line('Path:\t{}'.format(notebook_path))
+            writer.write_line('')
+
+        writer.write_line('-' * 55)
+        writer.write_line('Parallelism: {}'.format(self.schedule_plan.parallelism))
+        writer.write_line(
+            'Predicted makespan: {:.1f}s'.format(self.schedule_plan.makespan))
+        if len(self.schedule_plan.unknown) > 0:
+            writer.write_line('Notebooks without run history: {}'.format(
+                len(self.schedule_plan.unknown)))
+
+        return writer.to_string()
+
+    @property
+    def total(self):
+        return sum(len(planned_run.notebook_paths)
+                   for planned_run in self.schedule_plan.planned_runs)
+
+
 class RunCommandResultsView(ResultsView):
     def __init__(self):
         self.run_results = []
@@ -118,6 +161,69 @@ class RunCommandResultsView(ResultsView):
         return len(self.run_results)
 
 
+class RunCommandResultsStoreView(ResultsView):
+    """
+    View of the results of a results store. The results are read from the
+    store one at a time when the view is printed, instead of being kept.
+    """
+
+    def __init__(self, results_store):
+        self.results_store = results_store
+        super().__init__()
+
+    def print(self):
+        # Same output as print(self.get_view())
+        print()
+        for result in self.results_store:
+            print(self._get_result_view(result), end='')
+        print()
+
+    def get_view(self):
+        writer = StringWriter()
+        writer.write('\n')
+        for result in self.results_store:
+            writer.write(self._get_result_view(result))
+
+        return writer.to_string()
+
+    def _get_result_view(self, result):
+        writer = StringWriter()
+        writer.write(RunCommandResultView(result).get_view())
+        writer.write_line('=' * 60)
+        return writer.to_string()
+
+    @property
+    def total(self):
+        return len(self.results_store)
+
+
+class RunCommandResultsStreamView(ResultsView):
+    """
+    Prints the result of each notebook as it is added, so the results
+    are not kept until the end of the execution.
+    """
+
+    def __init__(self):
+        self.total_results = 0
+        super().__init__()
+
+    def add_exec_result(self, result):
+        run_result = RunCommandResultView(result)
+        self.total_results += 1
+        writer = StringWriter()
+        writer.write('\n')
+        writer.write(run_result.get_view())
+        writer.write_line('=' * 60)
+        print(writer.to_string())
+
+    def get_view(self):
+        return ''
+
+    @property
+    def total(self):
+        return self.total_results
+
+
 class RunCommandResultView(ResultsView):
     def __init__(self, result):
 
@@ -129,8 +235,9 @@ class RunCommandResultView(ResultsView):
         self.notebook_result_state = result.notebook_result.result_state
         self.notebook_run_page_url = result.notebook_run_page_url
 
+        t_results = result.test_results
+        # Only kept when the output can not be parsed
         self.raw_notebook_output = result.notebook_result.exit_output
-        t_results = self._get_test_results(result)
         self.test_cases_views = []
         if t_results is not None:
             for t_result in t_results.results:
@@ -138,12 +245,6 @@ class RunCommandResultView(ResultsView):
 
         super().__init__()
 
-    def _get_test_results(self, result):
-        if result.notebook_result.is_run_from_notebook:
-            return result.notebook_result.nutter_test_results
-
-        return self.__to_testresults(result.notebook_result.exit_output)
-
     def get_view(self):
         sw = StringWriter()
         sw.write_line("Notebook: {} - Lifecycle State: {}, Result: {}".format(
@@ -154,8 +255,13 @@ class RunCommandResultView(ResultsView):
 
         if len(self.test_cases_views) == 0:
             sw.write_line("No test cases were returned.")
-            sw.write_line("Notebook output: {}".format(
-                self.raw_notebook_output))
+            if self.raw_notebook_output is None:
+                # The raw output is released once the test results are parsed
+                sw.write_line(
+                    "Notebook output: released after parsing the test results")
+            else:
+                sw.write_line("Notebook output: {}".format(
+                    self.raw_notebook_output))
             sw.write_line("=" * 60)
             return sw.to_string()
 
@@ -181,17 +287,6 @@ class RunCommandResultView(ResultsView):
 
         return sw.to_string()
 
-    def __to_testresults(self, exit_output):
-        if not exit_output:
-            return None
-        try:
-            return TestResults().deserialize(exit_output)
-        except Exception as ex:
-            error = 'error while creating result from {}. Error: {}'.format(
-                ex, exit_output)
-            logging.debug(error)
-            return None
-
     @property
     def total(self):
         return len(self.test_cases_views)
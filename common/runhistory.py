@@ -0,0 +1,103 @@
+"""
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import json
+import logging
+import os
+import threading
+
+CACHE_DIR_ENV_VAR = 'NUTTER_CACHE_DIR'
+HISTORY_FILE_NAME = 'history.json'
+# Weight of the latest duration in the moving average
+SMOOTHING_FACTOR = 0.5
+
+
+def get_cache_dir():
+    cache_dir = os.environ.get(CACHE_DIR_ENV_VAR)
+    if cache_dir:
+        return cache_dir
+    return os.path.join(os.path.expanduser('~'), '.cache', 'nutter')
+
+
+def get_run_history(scope):
+    path = os.path.join(get_cache_dir(), HISTORY_FILE_NAME)
+    return RunHistory(path, scope)
+
+
+def get_shard_history(path, scope):
+    """
+    Returns the history of the file shared by the agents of a sharded run.
+    Unlike the local history, the file must exist: an agent without it
+    would assign the notebooks to different shards than the others.
+    """
+    if not os.path.isfile(path):
+        raise ValueError('The shard history {} does not exist'.format(path))
+    return RunHistory(path, scope)
+
+
+class RunHistory(object):
+    """
+    Local history of test notebook durations, scoped by workspace host.
+    The expected duration is an exponential moving average of past runs.
+    When path is None the history is kept in memory only.
+    """
+
+    def __init__(self, path=None, scope=''):
+        self.path = path
+        self.scope = scope or ''
+        self._lock = threading.Lock()
+        self._all_entries = None
+
+    def expected_duration(self, notebook_path):
+        with self._lock:
+            entry = self._entries().get(notebook_path)
+        if entry is None:
+            return None
+        return entry['duration']
+
+    def record(self, notebook_path, duration):
+        if duration is None or duration < 0:
+            return
+        with self._lock:
+            entries = self._entries()
+            entry = entries.get(notebook_path)
+            if entry is None:
+                entries[notebook_path] = {'duration': duration, 'runs': 1}
+                return
+            entry['duration'] = SMOOTHING_FACTOR * duration + \
+                (1 - SMOOTHING_FACTOR) * entry['duration']
+            entry['runs'] += 1
+
+    def save(self):
+        if self.path is None:
+            return
+        with self._lock:
+            if self._all_entries is None:
+                return
+            try:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                temp_path = self.path + '.tmp'
+                with open(temp_path, 'w') as file:
+                    json.dump(self._all_entries, file)
+                os.replace(temp_path, self.path)
+            except OSError as ex:
+                logging.debug('Run history could not be saved. {}'.format(ex))
+
+    def _entries(self):
+        if self._all_entries is None:
+            self._all_entries = self._load()
+        return self._all_entries.setdefault(self.scope, {})
+
+    def _load(self):
+        if self.path is None or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path) as file:
+                return json.load(file)
+        except (OSError, ValueError) as ex:
+            logging.debug('Run history could not be loaded. {}'.format(ex))
+            return {}
@@ -5,59 +5,207 @@ Licensed under the MIT license.
 
 import threading
 import logging
+from concurrent.futures import Future, ThreadPoolExecutor
 from threading import Thread
-from queue import Queue
+from queue import Queue, Empty
+
+MAX_NUM_OF_WORKERS = 15
+MAX_NUM_IN_FLIGHT = 1000
+DEFAULT_NUM_OF_DISPATCHERS = 4
+
 
 def get_scheduler(num_of_workers):
     return Scheduler(num_of_workers)
 
 
+def get_event_scheduler(max_in_flight, num_of_workers=DEFAULT_NUM_OF_DISPATCHERS):
+    return EventScheduler(max_in_flight, num_of_workers)
+
+
 class Scheduler(object):
     def __init__(self, num_of_workers):
-        if num_of_workers < 1 or num_of_workers > 15:
+        if num_of_workers < 1 or num_of_workers > MAX_NUM_OF_WORKERS:
             raise ValueError(
-                'Number of workers is invalid. It must be a value bettwen 1 and 15')
+                'Number of workers is invalid. It must be a value bettwen 1 and {}'
+                .format(MAX_NUM_OF_WORKERS))
         self._num_of_workers = num_of_workers
         self._in_queue = Queue()
         self._out_queue = Queue()
+        self._num_of_functions = 0
+        self._stopped = threading.Event()
 
     def add_function(self, function, *args):
         function_exec = FunctionToExecute(function, *args)
         self._in_queue.put(function_exec)
+        self._num_of_functions += 1
 
     def run_and_wait(self):
         try:
-            logging.debug("Starting workers")
-            workers = []
-            w = 0
-            while w < self._num_of_workers:
-                worker = FunctionHandler(self._in_queue, self._out_queue)
-                worker.daemon = True
-                worker.start()
-                workers.append(worker)
-                w += 1
-
-            logging.debug("Workers started")
-            self._in_queue.join()
-            logging.debug("Stopping workers")
-            for worker in workers:
-                worker.signal_stop()
-            self._in_queue.join()
-
-            return self._process_results()
+            return list(self.run_iter())
+
+        except Exception as ex:
+            logging.critical(ex)
+            raise ex
+
+    def run_iter(self):
+        """
+        Yields the result of each function as it completes. When the
+        iteration stops early, the functions not started are discarded,
+        including the functions a worker has dequeued but not started.
+        """
+        logging.debug("Starting workers")
+        self._stopped.clear()
+        workers = []
+        w = 0
+        while w < self._num_of_workers:
+            worker = FunctionHandler(self._in_queue, self._out_queue, self._stopped)
+            worker.daemon = True
+            worker.start()
+            workers.append(worker)
+            w += 1
+
+        logging.debug("Workers started")
+        completed = 0
+        try:
+            while completed < self._num_of_functions:
+                result = self._out_queue.get()
+                completed += 1
+                yield result
+        finally:
+            self._stop_workers(workers)
+
+    def _stop_workers(self, workers):
+        logging.debug("Stopping workers")
+        self._stopped.set()
+        discarded = 0
+        while True:
+            try:
+                self._in_queue.get_nowait()
+            except Empty:
+                break
+            self._in_queue.task_done()
+            discarded += 1
+        if discarded > 0:
+            logging.debug('{} functions discarded'.format(discarded))
+        for worker in workers:
+            worker.signal_stop()
+
+
+class EventScheduler(object):
+    """
+    Scheduler that keeps up to max_in_flight functions in flight with a
+    small, fixed number of threads. A function that returns a Future holds
+    its slot until the future completes, without occupying a thread, e.g.
+    a notebook run submitted with execute_notebook_async. Other functions
+    complete when they return, as in the Scheduler.
+    The results are returned, or yielded, in the order of completion.
+    """
+
+    def __init__(self, max_in_flight, num_of_workers=DEFAULT_NUM_OF_DISPATCHERS):
+        self._validate_max_in_flight(max_in_flight)
+        if num_of_workers < 1 or num_of_workers > MAX_NUM_OF_WORKERS:
+            raise ValueError(
+                'Number of workers is invalid. It must be a value bettwen 1 and {}'
+                .format(MAX_NUM_OF_WORKERS))
+        self._max_in_flight = max_in_flight
+        self._num_of_workers = num_of_workers
+        self._pending = []
+        self._in_flight = 0
+        self._completed = Queue()
+        self._executor = None
+        self._stopped = False
+        self._condition = threading.Condition()
+
+    @property
+    def in_flight(self):
+        with self._condition:
+            return self._in_flight
+
+    def add_function(self, function, *args):
+        with self._condition:
+            self._pending.append(FunctionToExecute(function, *args))
+
+    def set_max_in_flight(self, max_in_flight):
+        """
+        Changes the number of functions in flight. The functions already in
+        flight are not interrupted when the value decreases.
+        """
+        self._validate_max_in_flight(max_in_flight)
+        with self._condition:
+            self._max_in_flight = max_in_flight
+            self._dispatch()
 
+    def run_and_wait(self):
+        try:
+            return list(self.run_iter())
         except Exception as ex:
             logging.critical(ex)
             raise ex
 
-    def _process_results(self):
-        results_handler = ResultsHandler(self._out_queue)
-        results_handler.daemon = True
-        results_handler.start()
-        self._out_queue.join()
-        results_handler.signal_stop()
-        self._out_queue.join()
-        return results_handler.func_results
+    def run_iter(self):
+        """
+        Yields the result of each function as it completes. When the
+        iteration stops early, the functions not started are discarded,
+        including the functions already dispatched to a thread, and the
+        iteration returns once the functions being executed have returned.
+        """
+        executor = ThreadPoolExecutor(max_workers=self._num_of_workers)
+        with self._condition:
+            self._executor = executor
+            self._stopped = False
+            expected = len(self._pending)
+            self._dispatch()
+        try:
+            for _ in range(expected):
+                yield self._completed.get()
+        finally:
+            with self._condition:
+                self._executor = None
+                self._stopped = True
+                self._pending = []
+            executor.shutdown(wait=True)
+
+    def _dispatch(self):
+        if self._executor is None:
+            return
+        while len(self._pending) > 0 and self._in_flight < self._max_in_flight:
+            function_exec = self._pending.pop(0)
+            self._in_flight += 1
+            self._executor.submit(self._execute, function_exec)
+
+    def _execute(self, function_exec):
+        with self._condition:
+            if self._stopped:
+                logging.debug('Event Scheduler: Discarded {}'.format(function_exec))
+                return
+        logging.debug('Event Scheduler: Execute for {}'.format(function_exec))
+        try:
+            result = function_exec.execute()
+        except Exception as ex:
+            self._complete(FunctionResult(None, ex))
+            return
+        if not isinstance(result, Future):
+            self._complete(FunctionResult(result, None))
+            return
+        result.add_done_callback(self._on_future_done)
+
+    def _on_future_done(self, future):
+        try:
+            self._complete(FunctionResult(future.result(), None))
+        except Exception as ex:
+            self._complete(FunctionResult(None, ex))
+
+    def _complete(self, function_result):
+        with self._condition:
+            self._in_flight -= 1
+            self._dispatch()
+        self._completed.put(function_result)
+
+    def _validate_max_in_flight(self, max_in_flight):
+        if max_in_flight < 1 or max_in_flight > MAX_NUM_IN_FLIGHT:
+            raise ValueError(
+                'Number of functions in flight is invalid. '
+                'It must be a value bettwen 1 and {}'.format(MAX_NUM_IN_FLIGHT))
 
 
 class Worker(Thread):
@@ -69,33 +217,12 @@ class Worker(Thread):
         self._done.set()
 
 
-class ResultsHandler(Worker):
-    def __init__(self, queue):
-        super().__init__()
-        self._queue = queue
-        self.func_results = []
-
-    def signal_stop(self):
-        self._queue.put(None)
-
-    def run(self):
-        while True:
-            try:
-                result = self._queue.get()
-                if result is None:
-                    break
-                self.func_results.append(result)
-            finally:
-                self._queue.task_done()
-        self.set_done()
-        logging.debug("Results handler is done")
-
-
 class FunctionHandler(Worker):
-    def __init__(self, in_queue, out_queue):
+    def __init__(self, in_queue, out_queue, stopped=None):
         super().__init__()
         self._in_queue = in_queue
         self._out_queue = out_queue
+        self._stopped = stopped or threading.Event()
 
     def signal_stop(self):
         self._in_queue.put(None)
@@ -108,6 +235,9 @@ class FunctionHandler(Worker):
                 if function_exe is None:
                     logging.debug("Function Handler Stopped")
                     break
+                if self._stopped.is_set():
+                    logging.debug('Function Handler: Discarded {}'.format(function_exe))
+                    continue
                 logging.debug('Function Handler: Execute for {}'.format(function_exe))
                 result = function_exe.execute()
                 logging.debug('Function Handler: Execute called.')
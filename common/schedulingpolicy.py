@@ -0,0 +1,108 @@
+"""
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import heapq
+import statistics
+
+LISTING_ORDER = 'listing'
+LONGEST_FIRST = 'longest_first'
+SCHEDULING_POLICIES = (LISTING_ORDER, LONGEST_FIRST)
+# Expected duration, in seconds, when no notebook has a history
+DEFAULT_EXPECTED_DURATION = 60
+
+
+def validate_scheduling_policy(name):
+    if name not in SCHEDULING_POLICIES:
+        raise ValueError('Invalid scheduling policy {}. Valid values are: {}'.format(
+            name, ', '.join(SCHEDULING_POLICIES)))
+
+
+def get_expected_durations(run_history, notebook_paths):
+    """
+    Returns the expected duration of each notebook and the notebooks without
+    history. Those get the median of the known durations or, when none is
+    known, the default duration.
+    """
+    known = {}
+    if run_history is not None:
+        for notebook_path in notebook_paths:
+            duration = run_history.expected_duration(notebook_path)
+            if duration is not None:
+                known[notebook_path] = duration
+
+    fallback = DEFAULT_EXPECTED_DURATION
+    if len(known) > 0:
+        fallback = statistics.median(known.values())
+
+    unknown = [notebook_path for notebook_path in notebook_paths
+               if notebook_path not in known]
+    durations = dict(known)
+    for notebook_path in unknown:
+        durations[notebook_path] = fallback
+    return durations, unknown
+
+
+def order_notebooks(notebook_paths, durations, policy=LISTING_ORDER):
+    """
+    Orders the notebooks for the scheduler queue. The longest first policy
+    puts the longest expected notebooks first: as the queue is consumed by
+    the first free slot, this is the LPT list scheduling. Notebooks with the
+    same expected duration keep the listing order.
+    """
+    validate_scheduling_policy(policy)
+    if policy == LISTING_ORDER:
+        return list(notebook_paths)
+    return sorted(notebook_paths, key=lambda path: durations[path], reverse=True)
+
+
+def to_batches(notebook_paths, batch_size):
+    return [notebook_paths[index:index + batch_size]
+            for index in range(0, len(notebook_paths), batch_size)]
+
+
+def plan(batches, durations, parallelism):
+    """
+    Predicts the schedule of the batches, in queue order, when each batch
+    starts on the first free slot. The notebooks of a batch run in parallel.
+    """
+    if parallelism < 1:
+        raise ValueError('The parallelism must be greater than 0')
+    slots = [(0, slot) for slot in range(parallelism)]
+    planned_runs = []
+    for batch in batches:
+        start, slot = heapq.heappop(slots)
+        duration = max(durations[notebook_path] for notebook_path in batch)
+        planned_runs.append(PlannedRun(batch, slot, start, duration))
+        heapq.heappush(slots, (start + duration, slot))
+    return SchedulePlan(planned_runs, parallelism)
+
+
+class PlannedRun(object):
+    def __init__(self, notebook_paths, slot, start, duration):
+        self.notebook_paths = notebook_paths
+        self.slot = slot
+        self.start = start
+        self.duration = duration
+
+    @property
+    def end(self):
+        return self.start + self.duration
+
+
+class SchedulePlan(object):
+    def __init__(self, planned_runs, parallelism, unknown=None):
+        self.planned_runs = planned_runs
+        self.parallelism = parallelism
+        self.unknown = unknown or []
+
+    @property
+    def makespan(self):
+        if len(self.planned_runs) == 0:
+            return 0
+        return max(planned_run.end for planned_run in self.planned_runs)
+
+    @property
+    def total_duration(self):
+        return sum(planned_run.duration for planned_run in self.planned_runs)
@@ -0,0 +1,75 @@
+"""
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import hashlib
+
+from . import schedulingpolicy
+
+BY_DURATION = 'duration'
+BY_HASH = 'hash'
+
+
+def parse_shard(shard):
+    """
+    Returns the index and the count of the shard i/n, e.g. 2/8. The index
+    starts at 1. A tuple (index, count) is also accepted.
+    """
+    if isinstance(shard, str):
+        index, separator, count = shard.partition('/')
+        if not separator:
+            raise ValueError('Invalid shard {}. Expected i/n, e.g. 1/4'.format(shard))
+        try:
+            shard = (int(index), int(count))
+        except ValueError:
+            raise ValueError('Invalid shard {}. Expected i/n, e.g. 1/4'.format(shard))
+    index, count = shard
+    if count < 1 or index < 1 or index > count:
+        raise ValueError(
+            'Invalid shard {}/{}. The index must be between 1 and {}'.format(
+                index, count, count))
+    return index, count
+
+
+def shard_notebooks(notebook_paths, index, count, shard_history=None):
+    """
+    Returns the notebooks of the shard index of count, in the given order,
+    and how the notebooks were balanced. By default, each notebook goes to
+    the shard of the hash of its path, so every agent that lists the same
+    notebooks gets the same assignment. With a shard_history, the longest
+    notebooks go first to the shard with the least expected duration and
+    notebooks without history are expected to take the median duration.
+    The same shard_history must then be used by every agent, otherwise a
+    notebook can be executed by several shards or by none.
+    """
+    durations, unknown = schedulingpolicy.get_expected_durations(
+        shard_history, notebook_paths)
+    if len(unknown) == len(notebook_paths):
+        assigned = {notebook_path: _hash_shard(notebook_path, count)
+                    for notebook_path in notebook_paths}
+        balance = BY_HASH
+    else:
+        assigned = _balance_by_duration(notebook_paths, durations, count)
+        balance = BY_DURATION
+    return [notebook_path for notebook_path in notebook_paths
+            if assigned[notebook_path] == index], balance
+
+
+def _balance_by_duration(notebook_paths, durations, count):
+    # Ties are broken by path and shard index so the assignment is the
+    # same on every agent
+    loads = [0] * count
+    assigned = {}
+    for notebook_path in sorted(notebook_paths,
+                                key=lambda path: (-durations[path], path)):
+        shard = min(range(count), key=lambda shard: (loads[shard], shard))
+        loads[shard] += durations[notebook_path]
+        assigned[notebook_path] = shard + 1
+    return assigned
+
+
+def _hash_shard(notebook_path, count):
+    # The built-in hash of a str is salted per process
+    digest = hashlib.sha1(notebook_path.encode('utf-8')).hexdigest()
+    return int(digest, 16) % count + 1
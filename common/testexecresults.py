@@ -23,8 +23,15 @@ class TestExecResults():
         view = self.runcommand_results_view.get_view()
         return view
 
-    def exit(self, dbutils):
-        dbutils.notebook.exit(self.test_results.serialize())
+    def exit(self, dbutils, compression=None):
+        """
+        Returns the results to the CLI. compression is zlib, zstd or True
+        for zlib, see TestResults.serialize.
+        """
+        if compression is None:
+            dbutils.notebook.exit(self.test_results.serialize())
+            return
+        dbutils.notebook.exit(self.test_results.serialize(compression))
 
     def get_ExecuteNotebookResult(self, notebook_path, test_results):
         notebook_result = NotebookOutputResult(
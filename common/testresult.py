@@ -4,17 +4,49 @@ Licensed under the MIT license.
 """
 
 import base64
+import builtins
+import json
+import logging
 import pickle
+import threading
+import zlib
 
 from py4j.protocol import Py4JJavaError
 
 from .pickleserializable import PickleSerializable
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Version of the schema of the serialized results
+RESULTS_FORMAT_VERSION = 1
+ZLIB = 'zlib'
+ZSTD = 'zstd'
+COMPRESSIONS = (ZLIB, ZSTD)
+# The first character of the serialized results identifies the format.
+# The compressed formats are followed by the base64 of the compressed JSON.
+# These characters are not used by JSON objects nor by base64.
+JSON_HEADER = '{'
+COMPRESSION_HEADERS = {ZLIB: '!', ZSTD: '~'}
+
 
 def get_test_results():
     return TestResults()
 
 class TestResults(PickleSerializable):
+    """
+    Results of the test cases of a notebook. The number of test cases, the
+    number of failures and the total execution time are kept up to date
+    when results are appended or merged.
+    """
+
     def __init__(self):
         self.results = []
         self.test_cases = 0
@@ -26,6 +58,22 @@ class TestResults(PickleSerializable):
             raise TypeError("Can only append TestResult to TestResults")
 
         self.results.append(testresult)
+        self._count(testresult)
+
+    def merge(self, test_results):
+        """
+        Appends the results of other TestResults, e.g. of another fixture.
+        """
+        if not isinstance(test_results, TestResults):
+            raise TypeError("Can only merge TestResults to TestResults")
+
+        self.results.extend(test_results.results)
+        self.test_cases = self.test_cases + test_results.test_cases
+        self.num_failures = self.num_failures + test_results.num_failures
+        self.total_execution_time = self.total_execution_time + \
+            test_results.total_execution_time
+
+    def _count(self, testresult):
         self.test_cases = self.test_cases + 1
         if (not testresult.passed):
             self.num_failures = self.num_failures + 1
@@ -33,43 +81,71 @@ class TestResults(PickleSerializable):
         total_execution_time = self.total_execution_time + testresult.execution_time
         self.total_execution_time = total_execution_time
 
-    def serialize(self):
+    def serialize(self, compression=None):
+        """
+        Returns the results as compact JSON. The exceptions are reduced to
+        their type name and message. The JSON is compressed with zlib or
+        zstd, when the zstandard package is installed, if compression is
+        set. True selects zlib.
+        """
         for i in self.results:
             if isinstance(i.exception, Py4JJavaError):
                 i.exception = Exception(str(i.exception))
-        bin_data = pickle.dumps(self)
-        return str(base64.encodebytes(bin_data), "utf-8")
+        payload = {'version': RESULTS_FORMAT_VERSION,
+                   'results': [result._to_list() for result in self.results]}
+        serialized = json.dumps(payload, separators=(',', ':'))
+        if not compression:
+            return serialized
+        return _compress(serialized, ZLIB if compression is True else compression)
 
-    def deserialize(self, pickle_string):
-        bin_str = pickle_string.encode("utf-8")
+    def deserialize(self, serialized):
+        """
+        Returns the results serialized as JSON, compressed or not, or as
+        base64 pickle by the previous versions of Nutter.
+        """
+        serialized = serialized.lstrip()
+        if serialized.startswith(JSON_HEADER):
+            return self._from_json(serialized)
+        for compression, header in COMPRESSION_HEADERS.items():
+            if serialized.startswith(header):
+                return self._from_json(_decompress(serialized, compression))
+        bin_str = serialized.encode("utf-8")
         decoded_bin_data = base64.decodebytes(bin_str)
         return pickle.loads(decoded_bin_data)
 
+    def _from_json(self, serialized):
+        if orjson is not None:
+            payload = orjson.loads(serialized)
+        else:
+            payload = json.loads(serialized)
+        version = payload.get('version')
+        if version != RESULTS_FORMAT_VERSION:
+            raise ValueError(
+                'Unsupported test results format version {}'.format(version))
+        test_results = TestResults()
+        for item in payload['results']:
+            test_results.append(TestResult._from_list(item))
+        return test_results
+
     def passed(self):
-        for item in self.results:
-            if not item.passed:
-                return False
-        return True
+        return self.num_failures == 0
 
     def __eq__(self, other):
         if not isinstance(self, other.__class__):
             return False
         if len(self.results) != len(other.results):
             return False
+        keys = set(item._key() for item in self.results)
         for item in other.results:
-            if not self.__item_in_list_equalto(item):
+            if item._key() not in keys:
                 return False
 
         return True
 
-    def __item_in_list_equalto(self, expected_item):
-        for item in self.results:
-            if (item == expected_item):
-                return True
-
-        return False
-
 class TestResult:
+    __slots__ = ('test_name', 'passed', 'execution_time', 'tags', 'exception',
+                 'stack_trace')
+
     def __init__(self, test_name, passed,
                  execution_time, tags, exception=None, stack_trace=""):
 
@@ -82,11 +158,113 @@ class TestResult:
         self.execution_time = execution_time
         self.tags = tags
 
+    def _to_list(self):
+        exception = None
+        if self.exception is not None:
+            exception = [self.exception.__class__.__name__, str(self.exception)]
+        return [self.test_name, self.passed, self.execution_time, self.tags,
+                exception, self.stack_trace]
+
+    @classmethod
+    def _from_list(cls, item):
+        test_name, passed, execution_time, tags, exception, stack_trace = item
+        if exception is not None:
+            exception = _to_exception(*exception)
+        return cls(test_name, passed, execution_time, tags, exception, stack_trace)
+
+    def _key(self):
+        # The fields compared by __eq__
+        return (self.test_name, self.passed, type(self.exception), str(self.exception))
+
     def __eq__(self, other):
         if isinstance(self, other.__class__):
-            return self.test_name == other.test_name \
-                and self.passed == other.passed \
-                and type(self.exception) == type(other.exception) \
-                and str(self.exception) == str(other.exception)
+            return self._key() == other._key()
 
         return False
+
+    def __setstate__(self, state):
+        # Results pickled by the previous versions have a __dict__ state
+        state = _get_state(state)
+        self.test_name = state.get('test_name')
+        self.passed = state.get('passed')
+        self.execution_time = state.get('execution_time', 0)
+        self.tags = state.get('tags', [])
+        self.exception = state.get('exception')
+        self.stack_trace = state.get('stack_trace', '')
+
+
+def _get_state(state):
+    # The pickled state of an object with slots is (__dict__, slots)
+    if isinstance(state, tuple):
+        dict_state, slots_state = state
+        state = dict(dict_state or {})
+        state.update(slots_state or {})
+    return state
+
+
+class SerializedTestException(Exception):
+    """
+    Exception of a test case whose type is not a built-in exception.
+    Its class has the name of the original type.
+    """
+
+
+_exception_types = {}
+_exception_types_lock = threading.Lock()
+
+
+def _to_exception(type_name, message):
+    exception_type = getattr(builtins, type_name, None)
+    if isinstance(exception_type, type) and issubclass(exception_type, BaseException):
+        try:
+            exception = exception_type(message)
+            # e.g. the message of a KeyError is the repr of its key
+            if str(exception) == message:
+                return exception
+        except Exception:
+            pass
+    return _get_exception_type(type_name)(message)
+
+
+def _get_exception_type(type_name):
+    # The same type for a name, so deserialized exceptions compare equal
+    with _exception_types_lock:
+        exception_type = _exception_types.get(type_name)
+        if exception_type is None:
+            exception_type = type(type_name, (SerializedTestException,), {})
+            _exception_types[type_name] = exception_type
+        return exception_type
+
+
+def _compress(serialized, compression):
+    if compression not in COMPRESSIONS:
+        raise ValueError('Invalid compression {}. Valid values are: {}'.format(
+            compression, ', '.join(COMPRESSIONS)))
+    if compression == ZSTD and zstandard is None:
+        logging.debug('zstandard is not installed. Compressing with zlib')
+        compression = ZLIB
+
+    data = serialized.encode('utf-8')
+    if compression == ZSTD:
+        compressed = zstandard.ZstdCompressor().compress(data)
+    else:
+        compressed = zlib.compress(data)
+    result = COMPRESSION_HEADERS[compression] + \
+        base64.b64encode(compressed).decode('ascii')
+    logging.debug('Test results compressed with {}: {} -> {} bytes ({:.1%})'.format(
+        compression, len(data), len(result), len(result) / max(len(data), 1)))
+    return result
+
+
+def _decompress(serialized, compression):
+    compressed = base64.b64decode(serialized[1:])
+    if compression == ZSTD:
+        if zstandard is None:
+            raise ValueError('The test results are compressed with zstd. '
+                             'Install the zstandard package to read them')
+        data = zstandard.ZstdDecompressor().decompress(compressed)
+    else:
+        data = zlib.decompress(compressed)
+    logging.debug('Test results decompressed with {}: {} -> {} bytes ({:.1%})'.format(
+        compression, len(serialized), len(data), len(serialized) / max(len(data), 1)))
+    return data.decode('utf-8')
@@ -50,7 +50,6 @@ class NutterFixtureParallelRunner(object):
 
         for funcres in results:
             if funcres.func_result is not None:
-                for testres in funcres.func_result.test_results.results:
-                    all_results.append(testres)
+                all_results.merge(funcres.func_result.test_results)
 
         return TestExecResults(all_results)
@@ -0,0 +1,74 @@
+"""
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import os
+import pytest
+from benchmarks import run
+from benchmarks.suite import Benchmark
+
+
+def test__compare__slower_beyond_threshold__regression():
+    regressions = run.compare({'a': 1.5}, {'a': 1.0}, 0.25)
+
+    assert regressions == ['a']
+
+
+def test__compare__slower_within_threshold__no_regression():
+    regressions = run.compare({'a': 1.2}, {'a': 1.0}, 0.25)
+
+    assert regressions == []
+
+
+def test__compare__slower_below_min_delta__no_regression():
+    regressions = run.compare({'a': 0.002}, {'a': 0.001}, 0.25, min_delta=0.01)
+
+    assert regressions == []
+
+
+def test__compare__not_in_baseline__no_regression():
+    regressions = run.compare({'a': 1.5}, {}, 0.25)
+
+    assert regressions == []
+
+
+def test__save_baseline__load_baseline__same_timings(tmpdir):
+    path = os.path.join(str(tmpdir), 'baseline.json')
+
+    run.save_baseline(path, {'a': 1.5})
+
+    assert run.load_baseline(path) == {'a': 1.5}
+
+
+def test__load_baseline__missing_file__empty(tmpdir):
+    assert run.load_baseline(os.path.join(str(tmpdir), 'baseline.json')) == {}
+
+
+def test__load_baseline__other_version__valueerror(tmpdir):
+    path = os.path.join(str(tmpdir), 'baseline.json')
+    with open(path, 'w') as file:
+        file.write('{"version": 0, "benchmarks": {}}')
+
+    with pytest.raises(ValueError):
+        run.load_baseline(path)
+
+
+def test__benchmark_run__setup_and_teardown__called_for_every_repeat():
+    calls = []
+    benchmark = Benchmark('a', lambda value: calls.append(('run', value)),
+                          lambda: len(calls), lambda value: calls.append(('teardown', value)),
+                          repeat=2)
+
+    timing = benchmark.run()
+
+    assert timing >= 0
+    assert calls == [('run', 0), ('teardown', 0), ('run', 2), ('teardown', 2)]
+
+
+def test__print_payload_sizes__sizes__bytes_saved_compared_to_first(capsys):
+    run.print_payload_sizes({'pickle': 1000, 'json+zlib': 250})
+
+    lines = capsys.readouterr().out.splitlines()
+    assert 'saved          0 bytes' in lines[0]
+    assert 'saved        750 bytes  75.0%' in lines[1]
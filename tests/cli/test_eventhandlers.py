@@ -3,11 +3,11 @@ Copyright (c) Microsoft Corporation.
 Licensed under the MIT license.
 """
 
-import pytest
 from queue import Queue
 from cli.eventhandlers import ConsoleEventHandler
-from common.api import NutterStatusEvents, ExecutionResultEventData
+from common.api import NutterStatusEvents, ExecutionResultEventData, ShardEventData
 from common.statuseventhandler import StatusEvent
+from common.apiclientresults import CancelRunsResult
 
 
 def test__handle__nutterstatusevents_testslisting__output_is_valid(mocker):
@@ -128,6 +128,81 @@ def test__handle__nutterstatusevents_testexecuted__output_is_valid(mocker):
     console_event_handler._print_output.assert_called_with(expected)
 
 
+def test__handle__nutterstatusevents_circuitbreakerstatechanged__output_is_valid(mocker):
+    console_event_handler = ConsoleEventHandler(False)
+    mocker.patch.object(console_event_handler, '_print_output')
+    events = [StatusEvent(NutterStatusEvents.CircuitBreakerStateChanged, 'OPEN')]
+    queue = _get_queue_with_events(events)
+
+    console_event_handler._get_and_handle(queue)
+
+    expected = _get_output_wrapper('Databricks API circuit breaker is OPEN')
+    console_event_handler._print_output.assert_called_with(expected)
+
+
+def test__handle__nutterstatusevents_runscancelled__output_is_valid(mocker):
+    console_event_handler = ConsoleEventHandler(False)
+    mocker.patch.object(console_event_handler, '_print_output')
+    events = [StatusEvent(NutterStatusEvents.RunsCancelled, CancelRunsResult([1, 2], [3]))]
+    queue = _get_queue_with_events(events)
+
+    console_event_handler._get_and_handle(queue)
+
+    expected = _get_output_wrapper(
+        '2 outstanding runs cancelled. Failed to cancel the runs: 3')
+    console_event_handler._print_output.assert_called_with(expected)
+
+
+def test__handle__nutterstatusevents_concurrencychanged__output_is_valid(mocker):
+    console_event_handler = ConsoleEventHandler(False)
+    mocker.patch.object(console_event_handler, '_print_output')
+    events = [StatusEvent(NutterStatusEvents.ConcurrencyChanged, '4 (throttled)')]
+    queue = _get_queue_with_events(events)
+
+    console_event_handler._get_and_handle(queue)
+
+    expected = _get_output_wrapper('Parallel tests limit: 4 (throttled)')
+    console_event_handler._print_output.assert_called_with(expected)
+
+
+def test__handle__nutterstatusevents_executionstopped__output_is_valid(mocker):
+    console_event_handler = ConsoleEventHandler(False)
+    mocker.patch.object(console_event_handler, '_print_output')
+    events = [StatusEvent(NutterStatusEvents.ExecutionStopped, 2)]
+    queue = _get_queue_with_events(events)
+
+    console_event_handler._get_and_handle(queue)
+
+    expected = _get_output_wrapper(
+        'Execution stopped after 2 failures. The remaining tests are not executed')
+    console_event_handler._print_output.assert_called_with(expected)
+
+
+def test__handle__nutterstatusevents_clusterremoved__output_is_valid(mocker):
+    console_event_handler = ConsoleEventHandler(False)
+    mocker.patch.object(console_event_handler, '_print_output')
+    events = [StatusEvent(NutterStatusEvents.ClusterRemoved, 'cluster_2 (TERMINATED)')]
+    queue = _get_queue_with_events(events)
+
+    console_event_handler._get_and_handle(queue)
+
+    expected = _get_output_wrapper('Cluster cluster_2 (TERMINATED) removed from the pool')
+    console_event_handler._print_output.assert_called_with(expected)
+
+
+def test__handle__nutterstatusevents_testssharded__output_is_valid(mocker):
+    console_event_handler = ConsoleEventHandler(False)
+    mocker.patch.object(console_event_handler, '_print_output')
+    events = [StatusEvent(NutterStatusEvents.TestsSharded,
+                          ShardEventData(2, 8, 12, 90, 'duration'))]
+    queue = _get_queue_with_events(events)
+
+    console_event_handler._get_and_handle(queue)
+
+    expected = _get_output_wrapper('12 of 90 tests in the shard 2/8, balanced by duration')
+    console_event_handler._print_output.assert_called_with(expected)
+
+
 def _get_output_wrapper(output):
     return '--> {}\n'.format(output)
 
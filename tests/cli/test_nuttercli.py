@@ -6,9 +6,14 @@ Licensed under the MIT license.
 import pytest
 import os
 import json
+import tracemalloc
 import cli.nuttercli as nuttercli
+import common.schedulingpolicy as schedulingpolicy
+import common.apiclient as apiclient
+from common.apiclient import DEFAULT_POLL_WAIT_TIME
 from cli.nuttercli import NutterCLI
-from common.apiclientresults import ExecuteNotebookResult
+from common.apiclientresults import ExecuteNotebookResult, NotebookOutputResult
+from common.runhistory import RunHistory
 import mock
 from common.testresult import TestResults, TestResult
 from cli.reportsman import ReportWriterManager, ReportWritersTypes, ReportWriters
@@ -60,35 +65,277 @@ def test__nutter_cli_ctor__handles__version_and_exits_0(mocker):
     assert mock_ex.type == SystemExit
     assert mock_ex.value.code == 0
 
-def test__run__pattern__display_results(mocker):
+def test__nutter_cli_ctor__circuit_breaker_flags__client_circuit_breaker_set(mocker):
+    mocker.patch.dict(os.environ, {'DATABRICKS_HOST': 'myhost'})
+    mocker.patch.dict(os.environ, {'DATABRICKS_TOKEN': 'mytoken'})
+
+    cli = NutterCLI(circuit_failure_rate=0.8, circuit_window_size=50,
+                    circuit_open_duration=10, circuit_park=True, circuit_park_timeout=60)
+
+    circuit_breaker = cli._nutter.dbclient.circuit_breaker
+    assert circuit_breaker.failure_rate == 0.8
+    assert circuit_breaker.open_duration == 10
+    assert circuit_breaker.park
+    assert circuit_breaker.park_timeout == 60
+
+
+def test__nutter_cli_ctor__invalid_circuit_failure_rate__exits_1(mocker):
+    mocker.patch.dict(os.environ, {'DATABRICKS_HOST': 'myhost'})
+    mocker.patch.dict(os.environ, {'DATABRICKS_TOKEN': 'mytoken'})
+
+    with pytest.raises(SystemExit) as mock_ex:
+        NutterCLI(circuit_failure_rate=2)
+
+    assert mock_ex.value.code == 1
+
+
+def test__run__pattern__each_result_displayed(mocker):
     test_results = TestResults().serialize()
     cli = _get_cli_for_tests(
         mocker, 'SUCCESS', 'TERMINATED', test_results)
 
-    mocker.patch.object(cli, '_display_test_results')
+    mocker.patch.object(cli, '_display_test_result')
+    cli.run('my*', 'cluster')
+    assert cli._display_test_result.call_count == 2
+
+
+def test__run__pattern_failed_result__remaining_results_reported_and_exits_1(mocker):
+    cli = _get_cli_for_tests(
+        mocker, 'FAILED', 'TERMINATED', TestResults().serialize())
+    mocker.patch.object(cli, '_display_test_result')
+    mocker.patch.object(cli, '_get_report_writer_manager')
+    mock_report_manager = ReportWriterManager(ReportWriters.JUNIT)
+    mocker.patch.object(mock_report_manager, 'write')
+    mocker.patch.object(mock_report_manager, 'add_results')
+    cli._get_report_writer_manager.return_value = mock_report_manager
+    mocker.patch.object(cli._nutter, 'cancel_runs')
+
+    with pytest.raises(SystemExit) as mock_ex:
+        cli.run('my*', 'cluster')
+
+    assert mock_ex.value.code == 1
+    assert cli._display_test_result.call_count == 2
+    assert mock_report_manager.add_results.call_count == 1
+    assert len(mock_report_manager.add_results.call_args[0][0]) == 2
+    assert mock_report_manager.write.call_count == 1
+
+
+def test__run__many_results__results_not_kept_in_memory(mocker, tmp_path, monkeypatch):
+    cli = _get_cli_for_tests(
+        mocker, 'SUCCESS', 'TERMINATED', TestResults().serialize())
+    mocker.patch('common.resultsview.print', create=True,
+                 new=lambda *args, **kwargs: None)
+    monkeypatch.chdir(str(tmp_path))
+    num_results, output_size = 200, 50000
+
+    def iter_results():
+        for index in range(num_results):
+            test_results = TestResults()
+            test_results.append(TestResult(
+                'case', False, 10, ['tag'], Exception('x' * output_size)))
+            yield ExecuteNotebookResult(
+                'TERMINATED', '/test_{}'.format(index),
+                NotebookOutputResult('SUCCESS', test_results.serialize()), '')
+
+    cli._nutter.iter_run_tests.return_value = iter_results()
+    tracemalloc.start()
+    try:
+        with pytest.raises(SystemExit):
+            cli.run('my*', 'cluster', junit_report=True, tags_report=True)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert len(os.listdir(str(tmp_path))) == 2
+    # A few results at a time are in memory, not all of them
+    assert peak < num_results * output_size / 2
+
+
+def test__run__dry_run__plan_displayed_and_tests_not_executed(mocker):
+    cli = _get_cli_for_tests(
+        mocker, 'SUCCESS', 'TERMINATED', TestResults().serialize())
+    mocker.patch.object(cli._nutter, 'plan_tests')
+    cli._nutter.plan_tests.return_value = schedulingpolicy.plan(
+        [['/test_mynotebook'], ['/test_mynotebook2']],
+        {'/test_mynotebook': 10, '/test_mynotebook2': 20}, 1)
+    mocker.patch.object(cli, '_display_schedule_plan')
+
+    cli.run('my*', 'cluster', max_parallel_tests=2, dry_run=True)
+
+    assert cli._display_schedule_plan.call_count == 1
+    assert cli._nutter.plan_tests.call_args[0][2] == 2
+    assert cli._nutter.iter_run_tests.call_count == 0
+
+
+@pytest.mark.parametrize('fail_fast, expected', [(False, None), (True, 1), (3, 3)])
+def test__run__fail_fast__number_of_failures_passed_to_nutter(mocker, fail_fast, expected):
+    cli = _get_cli_for_tests(
+        mocker, 'SUCCESS', 'TERMINATED', TestResults().serialize())
+    mocker.patch.object(cli, '_display_test_result')
+
+    cli.run('my*', 'cluster', fail_fast=fail_fast)
+
+    assert cli._nutter.iter_run_tests.call_args[0][11] == expected
+
+
+def test__run__poll_wait_time__fixed_poll_policy_passed_to_nutter(mocker):
+    cli = _get_cli_for_tests(
+        mocker, 'SUCCESS', 'TERMINATED', TestResults().serialize())
+    mocker.patch.object(cli, '_display_test_result')
+
+    cli.run('my*', 'cluster', poll_wait_time=10)
+
+    poll_policy = cli._nutter.iter_run_tests.call_args[0][7]
+    assert isinstance(poll_policy, apiclient.FixedPollPolicy)
+    assert poll_policy.pull_wait_time == 10
+
+
+def test__run__no_poll_wait_time__adaptive_poll_policy_passed_to_nutter(mocker):
+    cli = _get_cli_for_tests(
+        mocker, 'SUCCESS', 'TERMINATED', TestResults().serialize())
+    mocker.patch.object(cli, '_display_test_result')
+
     cli.run('my*', 'cluster')
-    assert cli._display_test_results.call_count == 1
 
+    poll_policy = cli._nutter.iter_run_tests.call_args[0][7]
+    assert isinstance(poll_policy, apiclient.AdaptivePollPolicy)
+    assert cli._nutter.iter_run_tests.call_args[0][5] == DEFAULT_POLL_WAIT_TIME
+
+
+def test__run__shard__shard_passed_to_nutter(mocker):
+    cli = _get_cli_for_tests(
+        mocker, 'SUCCESS', 'TERMINATED', TestResults().serialize())
+    mocker.patch.object(cli, '_display_test_result')
+
+    cli.run('my*', 'cluster', shard='2/8')
+
+    assert cli._nutter.iter_run_tests.call_args[0][12] == '2/8'
+
+
+def test__run__shard_history__history_passed_to_nutter(mocker, tmp_path):
+    cli = _get_cli_for_tests(
+        mocker, 'SUCCESS', 'TERMINATED', TestResults().serialize())
+    mocker.patch.object(cli, '_display_test_result')
+    shard_history = str(tmp_path / 'history.json')
+    history = RunHistory(shard_history, 'myhost')
+    history.record('/test_a', 10)
+    history.save()
+
+    cli.run('my*', 'cluster', shard='2/8', shard_history=shard_history)
+
+    history = cli._nutter.iter_run_tests.call_args[0][13]
+    assert history.expected_duration('/test_a') == 10
+
+
+def test__run__missing_shard_history__exits_1(mocker, tmp_path):
+    cli = _get_cli_for_tests(
+        mocker, 'SUCCESS', 'TERMINATED', TestResults().serialize())
+    mocker.patch.object(cli, '_display_test_result')
+    mocker.patch.object(cli, '_cancel_outstanding_runs')
+
+    with pytest.raises(SystemExit) as mock_ex:
+        cli.run('my*', 'cluster', shard='2/8',
+                shard_history=str(tmp_path / 'history.json'))
+
+    assert mock_ex.value.code == 1
+    assert cli._nutter.iter_run_tests.call_count == 0
+
+
+def test__merge_reports__shard_reports__merged_reports_written(mocker, tmp_path):
+    cli = _get_cli_for_tests(
+        mocker, 'SUCCESS', 'TERMINATED', TestResults().serialize())
+    report_files = []
+    for index in range(2):
+        test_results = TestResults()
+        test_results.append(TestResult('case{}'.format(index), True, 10, ['tag']))
+        report_man = ReportWriterManager(ReportWriters.JUNIT + ReportWriters.TAGS)
+        report_man.add_result('/test_shard{}'.format(index), test_results)
+        for key, writer in report_man._providers.items():
+            extension = 'xml' if key == ReportWritersTypes.JUNIT else 'txt'
+            report_file = str(tmp_path / 'shard{}.{}'.format(index, extension))
+            writer.to_file(report_file)
+            report_files.append(report_file)
+    mocker.patch.object(cli, '_write_reports')
+
+    cli.merge_reports(*report_files)
+
+    report_man = cli._write_reports.call_args[0][0]
+    junit_writer = report_man._providers[ReportWritersTypes.JUNIT]
+    tags_writer = report_man._providers[ReportWritersTypes.TAGS]
+    assert len(junit_writer.all_test_suites) == 2
+    assert [row.test_name for row in tags_writer._rows] == ['case0', 'case1']
+
+
+def test__merge_reports__no_files__exits_1(mocker):
+    cli = _get_cli_for_tests(
+        mocker, 'SUCCESS', 'TERMINATED', TestResults().serialize())
+
+    with pytest.raises(SystemExit) as mock_ex:
+        cli.merge_reports()
+
+    assert mock_ex.value.code == 1
+
+
+def test__run__execution_error_after_results__results_reported_and_exits_1(mocker):
+    cli = _get_cli_for_tests(
+        mocker, 'SUCCESS', 'TERMINATED', TestResults().serialize())
+    results = _get_run_tests_response(
+        'SUCCESS', 'TERMINATED', TestResults().serialize())
+
+    def iter_run_tests(*args):
+        yield results[0]
+        raise ValueError('submit failed')
+    cli._nutter.iter_run_tests.side_effect = iter_run_tests
+    mocker.patch.object(cli, '_display_test_result')
+    mocker.patch.object(cli, '_write_reports')
+    mocker.patch.object(cli._nutter, 'cancel_runs')
+
+    with pytest.raises(SystemExit) as mock_ex:
+        cli.run('my*', 'cluster')
+
+    assert mock_ex.value.code == 1
+    assert cli._display_test_result.call_count == 1
+    assert cli._write_reports.call_count == 1
 
-def test__nutter_cli_ctor__handles__configurationexception_and_exits_1(mocker):
+
+def test__run__handles__configurationexception_and_exits_1(mocker):
     mocker.patch.dict(os.environ, {'DATABRICKS_HOST': ''})
     mocker.patch.dict(os.environ, {'DATABRICKS_TOKEN': ''})
+    cli = NutterCLI()
 
     with pytest.raises(SystemExit) as mock_ex:
-        cli = NutterCLI()
+        cli.run('my*', 'cluster')
 
     assert mock_ex.type == SystemExit
     assert mock_ex.value.code == 1
 
 
+def test__merge_reports__no_configuration__reports_merged(mocker, tmp_path):
+    mocker.patch.dict(os.environ, {'DATABRICKS_HOST': ''})
+    mocker.patch.dict(os.environ, {'DATABRICKS_TOKEN': ''})
+    test_results = TestResults()
+    test_results.append(TestResult('case', True, 10, ['tag']))
+    report_man = ReportWriterManager(ReportWriters.JUNIT)
+    report_man.add_result('/test_shard', test_results)
+    report_file = str(tmp_path / 'shard.xml')
+    report_man._providers[ReportWritersTypes.JUNIT].to_file(report_file)
+    cli = NutterCLI()
+    mocker.patch.object(cli, '_write_reports')
+
+    cli.merge_reports(report_file)
+
+    assert cli._write_reports.call_count == 1
+    assert cli._nutter_client is None
+
+
 def test__run__one_test_fullpath__display_results(mocker):
     test_results = TestResults().serialize()
     cli = _get_cli_for_tests(
         mocker, 'SUCCESS', 'TERMINATED', test_results)
 
-    mocker.patch.object(cli, '_display_test_results')
+    mocker.patch.object(cli, '_display_test_result')
     cli.run('test_mynotebook2', 'cluster')
-    assert cli._display_test_results.call_count == 1
+    assert cli._display_test_result.call_count == 1
 
 def test__run_one_test_junit_writter__writer_writes(mocker):
     test_results = TestResults().serialize()
@@ -97,18 +344,40 @@ def test__run_one_test_junit_writter__writer_writes(mocker):
     mocker.patch.object(cli, '_get_report_writer_manager')
     mock_report_manager = ReportWriterManager(ReportWriters.JUNIT)
     mocker.patch.object(mock_report_manager, 'write')
-    mocker.patch.object(mock_report_manager, 'add_result')
+    mocker.patch.object(mock_report_manager, 'add_results')
 
     cli._get_report_writer_manager.return_value = mock_report_manager
 
     cli.run('test_mynotebook2', 'cluster')
 
-    assert mock_report_manager.add_result.call_count == 1
+    assert mock_report_manager.add_results.call_count == 1
+    assert len(mock_report_manager.add_results.call_args[0][0]) == 1
     assert mock_report_manager.write.call_count == 1
     assert not mock_report_manager._providers[ReportWritersTypes.JUNIT].has_data(
     )
 
 
+def test__run__execution_error__outstanding_runs_cancelled_and_exits_1(mocker):
+    cli = _get_cli_for_tests(
+        mocker, 'SUCCESS', 'TERMINATED', TestResults().serialize())
+    cli._nutter.iter_run_tests.side_effect = nuttercli.ExecutionAbortedException('aborted')
+    mocker.patch.object(cli._nutter, 'cancel_runs')
+
+    with pytest.raises(SystemExit) as mock_ex:
+        cli.run('my*', 'cluster')
+
+    assert mock_ex.value.code == 1
+    assert cli._nutter.cancel_runs.call_count == 1
+
+
+def test__run__abort_signal__executionabortedexception(mocker):
+    cli = _get_cli_for_tests(
+        mocker, 'SUCCESS', 'TERMINATED', TestResults().serialize())
+
+    with pytest.raises(nuttercli.ExecutionAbortedException):
+        cli._on_abort_signal(15, None)
+
+
 def test__list__none__display_result(mocker):
     cli = _get_cli_for_tests(
         mocker, 'SUCCESS', 'TERMINATED', 'IHAVERETURNED')
@@ -125,9 +394,9 @@ def _get_cli_for_tests(mocker, result_state, life_cycle_state, notebook_result):
     mocker.patch.object(cli._nutter, 'run_test')
     cli._nutter.run_test.return_value = _get_run_test_response(
         result_state, life_cycle_state, notebook_result)
-    mocker.patch.object(cli._nutter, 'run_tests')
-    cli._nutter.run_tests.return_value = _get_run_tests_response(
-        result_state, life_cycle_state, notebook_result)
+    mocker.patch.object(cli._nutter, 'iter_run_tests')
+    cli._nutter.iter_run_tests.return_value = iter(_get_run_tests_response(
+        result_state, life_cycle_state, notebook_result))
     mocker.patch.object(cli._nutter, 'list_tests')
     cli._nutter.list_tests.return_value = _get_list_tests_response()
 
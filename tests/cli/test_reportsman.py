@@ -9,6 +9,8 @@ from common.resultreports import JunitXMLReportWriter
 from common.resultreports import TagsReportWriter
 from cli.reportsman import ReportWriterManager, ReportWriters, ReportWritersTypes
 import common.api as nutter_api
+from common.apiclientresults import ExecuteNotebookResult, NotebookOutputResult
+from common.resultsstore import ResultsStore
 
 def test__reportwritermanager_ctor__junit_report__valid_manager():
     report_writer_man = ReportWriterManager(ReportWriters.JUNIT)
@@ -78,3 +80,45 @@ def test__write__two_providers__returns_two_names():
     results = report_writer_man.providers_names()
 
     assert len(results) == 2
+
+
+def test__add_results__results_store__valid_results_written(mocker, tmp_path):
+    report_writer_man = ReportWriterManager(ReportWriters.TAGS)
+    tags_writer = report_writer_man._providers[ReportWritersTypes.TAGS]
+    test_results = TestResults()
+    test_results.append(TestResult("mycase", True, 10, ['hello']))
+    report_file = str(tmp_path / 'tags.txt')
+
+    with ResultsStore() as store:
+        store.add(ExecuteNotebookResult(
+            'TERMINATED', '/test_1', NotebookOutputResult('SUCCESS', test_results.serialize()), ''))
+        store.add(ExecuteNotebookResult(
+            'TERMINATED', '/test_2', NotebookOutputResult('SUCCESS', 'invalid'), ''))
+
+        report_writer_man.add_results(store)
+        tags_writer.to_file(report_file)
+
+    assert tags_writer._rows == []
+    with open(report_file) as file:
+        assert file.read() == ' hello,/test_1,mycase,PASSED,10\n'
+
+
+def test__add_report_file__xml_and_txt__added_to_their_providers(mocker):
+    report_writer_man = ReportWriterManager(ReportWriters.TAGS + ReportWriters.JUNIT)
+    junit_writer = report_writer_man._providers[ReportWritersTypes.JUNIT]
+    tags_writer = report_writer_man._providers[ReportWritersTypes.TAGS]
+    mocker.patch.object(junit_writer, 'add_report_file')
+    mocker.patch.object(tags_writer, 'add_report_file')
+
+    report_writer_man.add_report_file('shard1/test-nutter-result.xml')
+    report_writer_man.add_report_file('shard1/test-nutter-tags.txt')
+
+    junit_writer.add_report_file.assert_called_once_with('shard1/test-nutter-result.xml')
+    tags_writer.add_report_file.assert_called_once_with('shard1/test-nutter-tags.txt')
+
+
+def test__add_report_file__no_provider__raises_valueerror():
+    report_writer_man = ReportWriterManager(ReportWriters.TAGS)
+
+    with pytest.raises(ValueError):
+        report_writer_man.add_report_file('test-nutter-result.xml')
@@ -6,6 +6,7 @@ Licensed under the MIT license.
 import pytest
 import common.testresult as testresult
 from common.apiclientresults import ExecuteNotebookResult
+from common.resultsstore import ResultsStore
 from cli.resultsvalidator import ExecutionResultsValidator, TestCaseFailureException, JobExecutionFailureException, NotebookExecutionFailureException, InvalidNotebookOutputException
 import json
 
@@ -112,6 +113,29 @@ def test__validate__results_have_invalid_output__throws_invalidnotebookoutputexc
         ExecutionResultsValidator().validate(exec_results)
 
 
+def test__validate__results_store_with_failed_testcase__throws_testcasefailurexception():
+    test_results = testresult.TestResults()
+    test_results.append(testresult.TestResult(
+        test_name="mytest_case", passed=False, execution_time=1, tags=[]))
+
+    with ResultsStore() as store:
+        store.add(__get_ExecuteNotebookResult(
+            'SUCCESS', 'TERMINATED', testresult.TestResults().serialize()))
+        store.add(__get_ExecuteNotebookResult(
+            'SUCCESS', 'TERMINATED', test_results.serialize()))
+
+        with pytest.raises(TestCaseFailureException):
+            ExecutionResultsValidator().validate(store)
+
+
+def test__validate__results_store_without_failures__no_ex():
+    with ResultsStore() as store:
+        store.add(__get_ExecuteNotebookResult(
+            'SUCCESS', 'TERMINATED', testresult.TestResults().serialize()))
+
+        ExecutionResultsValidator().validate(store)
+
+
 def test__validate__results_with_notebook_failure__throws_notebookexecutionfailureexception():
     test_results = testresult.TestResults()
     test_case = testresult.TestResult(
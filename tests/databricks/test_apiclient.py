@@ -8,6 +8,8 @@ from common import apiclient as client
 from common.apiclient import DatabricksAPIClient
 import os
 import json
+import requests
+import threading
 
 
 def test__databricks_client__token_host_notset__clientfails(mocker):
@@ -160,6 +162,84 @@ def test__execute_notebook__timeout_1_sec_lcs_isrunning__timeoutexception(mocker
         result = db.execute_notebook('/mynotebook', 'clusterid', timeout=1)
 
 
+def test__execute_notebook__timeout__run_is_cancelled(mocker):
+    output_data = __get_submit_run_response('', 'RUNNING', '')
+    db = __get_client_for_execute_notebook(mocker, output_data, {'run_id': 1})
+    db.min_timeout = 1
+
+    with pytest.raises(client.TimeOutException):
+        db.execute_notebook('/mynotebook', 'clusterid', timeout=1)
+
+    db._canceller.shutdown(wait=True)
+    db.inner_dbclient.jobs.cancel_run.assert_called_once_with(1)
+    assert db.outstanding_runs == []
+    assert db.cancelled_runs == [1]
+
+
+def test__execute_notebook__terminated__run_is_not_outstanding(mocker):
+    output_data = __get_submit_run_response('SUCCESS', 'TERMINATED', '')
+    db = __get_client_for_execute_notebook(mocker, output_data, {'run_id': 1})
+
+    db.execute_notebook('/mynotebook', 'clusterid')
+
+    assert db.outstanding_runs == []
+    assert db.inner_dbclient.jobs.cancel_run.call_count == 0
+
+
+def test__cancel_runs__two_outstanding_runs_one_fails__result_has_cancelled_and_failed(mocker):
+    db = __get_client(mocker)
+    mocker.patch.object(db.inner_dbclient.jobs, 'cancel_run')
+    db.inner_dbclient.jobs.cancel_run.side_effect = \
+        lambda run_id: _raise(ValueError('invalid run')) if run_id == 2 else {}
+    db._register_run(1)
+    db._register_run(2)
+
+    result = db.cancel_runs()
+
+    assert result.cancelled == [1]
+    assert result.failed == [2]
+    assert db.outstanding_runs == [2]
+    assert db.cancelled_runs == [1]
+
+
+def test__cancel_runs__no_outstanding_runs__nothing_cancelled(mocker):
+    db = __get_client(mocker)
+    mocker.patch.object(db.inner_dbclient.jobs, 'cancel_run')
+
+    result = db.cancel_runs()
+
+    assert result.total == 0
+    assert db.inner_dbclient.jobs.cancel_run.call_count == 0
+
+
+def test__register_run__submissions_stopped__run_cancelled(mocker):
+    db = __get_client(mocker)
+    mocker.patch.object(db.inner_dbclient.jobs, 'cancel_run')
+    db.stop_submissions()
+
+    db._register_run(1)
+    db._canceller.shutdown(wait=True)
+
+    db.inner_dbclient.jobs.cancel_run.assert_called_once_with(1)
+    assert db.cancelled_runs == [1]
+
+
+def test__register_run__submissions_resumed__run_not_cancelled(mocker):
+    db = __get_client(mocker)
+    mocker.patch.object(db.inner_dbclient.jobs, 'cancel_run')
+    db.stop_submissions()
+    db.resume_submissions()
+
+    db._register_run(1)
+
+    assert db.inner_dbclient.jobs.cancel_run.call_count == 0
+    assert db.outstanding_runs == [1]
+
+
+def _raise(ex):
+    raise ex
+
+
 def test__execute_notebook__timeout_greater_than_min__valueerror(mocker):
     output_data = __get_submit_run_response('', 'RUNNING', '')
     run_id = {}
@@ -208,9 +288,14 @@ def __get_client_for_execute_notebook(mocker, output_data, run_id):
     db = __get_client(mocker)
     mocker.patch.object(db.inner_dbclient.jobs, 'submit_run')
     db.inner_dbclient.jobs.submit_run.return_value = run_id
+    mocker.patch.object(db.inner_dbclient.jobs, 'get_run')
+    db.inner_dbclient.jobs.get_run.return_value = json.loads(
+        output_data)['metadata']
     mocker.patch.object(db.inner_dbclient.jobs, 'get_run_output')
     db.inner_dbclient.jobs.get_run_output.return_value = json.loads(
         output_data)
+    mocker.patch.object(db.inner_dbclient.jobs, 'cancel_run')
+    db.inner_dbclient.jobs.cancel_run.return_value = {}
 
     return db
 
@@ -220,3 +305,275 @@ def __get_client(mocker):
     mocker.patch.dict(os.environ, {'DATABRICKS_TOKEN': 'mytoken'})
 
     return DatabricksAPIClient()
+
+
+def test__run_status_poller__two_runs_terminated__futures_have_outputs():
+    outputs = {1: _get_states_sequence(['PENDING', 'TERMINATED']),
+               2: _get_states_sequence(['RUNNING', 'RUNNING', 'TERMINATED'])}
+    poller = client.RunStatusPoller(lambda run_id: outputs[run_id].pop(0))
+
+    future_1 = poller.track(1, 10, _FastPollPolicy()).future
+    future_2 = poller.track(2, 10, _FastPollPolicy()).future
+
+    assert future_1.result(5)['state']['life_cycle_state'] == 'TERMINATED'
+    assert future_2.result(5)['state']['life_cycle_state'] == 'TERMINATED'
+    assert poller.active_runs == 0
+
+
+def test__run_status_poller__not_terminal_before_timeout__timeoutexception():
+    poller = client.RunStatusPoller(
+        lambda run_id: json.loads(__get_submit_run_response('', 'RUNNING', ''))['metadata'])
+
+    future = poller.track(1, 0.1, _FastPollPolicy()).future
+
+    with pytest.raises(client.TimeOutException):
+        future.result(5)
+
+
+def test__run_status_poller__poll_raises__future_has_exception():
+    def raise_error(run_id):
+        raise ValueError()
+    poller = client.RunStatusPoller(raise_error)
+
+    future = poller.track(1, 10, _FastPollPolicy()).future
+
+    with pytest.raises(ValueError):
+        future.result(5)
+
+
+def test__execute_notebook_async__terminatestate__future_result_is_executeresult(mocker):
+    output_data = __get_submit_run_response('SUCCESS', 'TERMINATED', '')
+    run_id = {}
+    run_id['run_id'] = 1
+    db = __get_client_for_execute_notebook(mocker, output_data, run_id)
+
+    future = db.execute_notebook_async('/mynotebook', 'clusterid')
+
+    assert future.result(5).task_result_state == 'TERMINATED'
+
+
+def _get_states_sequence(states):
+    return [{'state': {'life_cycle_state': state}} for state in states]
+
+
+def test__execute_notebook__terminated_after_two_polls__poll_calls_is_2(mocker):
+    output_data = __get_submit_run_response('SUCCESS', 'TERMINATED', '')
+    running_data = __get_submit_run_response('', 'RUNNING', '')
+    db = __get_client_for_execute_notebook(mocker, output_data, {'run_id': 1})
+    db.inner_dbclient.jobs.get_run.side_effect = [
+        json.loads(running_data)['metadata'], json.loads(output_data)['metadata']]
+
+    result = db.execute_notebook('/mynotebook', 'clusterid',
+                                 poll_policy=_FastPollPolicy())
+
+    assert result.poll_calls == 2
+    assert result.duration is not None
+
+
+def test__get_poll_policy__fixed__fixedpollpolicy_with_wait_time():
+    policy = client.get_poll_policy('fixed', 3)
+
+    assert isinstance(policy, client.FixedPollPolicy)
+    assert policy.pull_wait_time == 3
+
+
+def test__get_poll_policy__adaptive__adaptivepollpolicy():
+    policy = client.get_poll_policy('adaptive')
+
+    assert isinstance(policy, client.AdaptivePollPolicy)
+
+
+def test__get_poll_policy__no_name__adaptivepollpolicy():
+    policy = client.get_poll_policy()
+
+    assert isinstance(policy, client.AdaptivePollPolicy)
+
+
+def test__get_poll_policy__no_name_with_wait_time__fixedpollpolicy_with_wait_time():
+    policy = client.get_poll_policy(pull_wait_time=10)
+
+    assert isinstance(policy, client.FixedPollPolicy)
+    assert policy.pull_wait_time == 10
+
+
+def test__get_poll_policy__invalid__valueerror():
+    with pytest.raises(ValueError):
+        client.get_poll_policy('invalid')
+
+
+def test__fixed_poll_policy__wait_time_less_than_1__default_wait_time():
+    policy = client.FixedPollPolicy(0)
+
+    assert policy.pull_wait_time == client.DEFAULT_POLL_WAIT_TIME
+
+
+def test__adaptive_poll_policy__state_unchanged__backs_off_up_to_max():
+    policy = client.AdaptivePollPolicy(min_wait=1, max_wait=8, jitter=0)
+    tracked_run = client.TrackedRun(1, 100, policy)
+    tracked_run.set_last_run({}, 'RUNNING')
+
+    waits = [tracked_run.schedule_next_poll() for i in range(0, 5)]
+
+    assert waits == [1, 2, 4, 8, 8]
+
+
+def test__adaptive_poll_policy__state_changed__wait_is_reset():
+    policy = client.AdaptivePollPolicy(min_wait=1, max_wait=8, jitter=0)
+    tracked_run = client.TrackedRun(1, 100, policy)
+    tracked_run.set_last_run({}, 'PENDING')
+    tracked_run.schedule_next_poll()
+    tracked_run.schedule_next_poll()
+
+    tracked_run.set_last_run({}, 'RUNNING')
+
+    assert tracked_run.schedule_next_poll() == 1
+
+
+def test__adaptive_poll_policy__expected_duration__waits_until_before_expected_finish():
+    policy = client.AdaptivePollPolicy(min_wait=1, max_wait=8, jitter=0, lead_time=0.1)
+    tracked_run = client.TrackedRun(1, 1000, policy, expected_duration=100)
+    tracked_run.set_last_run({}, 'RUNNING')
+
+    wait = policy.next_wait(tracked_run)
+
+    assert 89 < wait <= 90
+
+
+def test__adaptive_poll_policy__expected_duration_pending__min_wait():
+    policy = client.AdaptivePollPolicy(min_wait=1, max_wait=8, jitter=0)
+    tracked_run = client.TrackedRun(1, 1000, policy, expected_duration=100)
+    tracked_run.set_last_run({}, 'PENDING')
+
+    assert policy.next_wait(tracked_run) == 1
+
+
+class _FastPollPolicy(client.PollPolicy):
+    def next_wait(self, tracked_run):
+        return 0.01
+
+
+def test__execute_notebook__running_then_terminated__output_is_fetched_once(mocker):
+    output_data = __get_submit_run_response('SUCCESS', 'TERMINATED', '')
+    running_data = __get_submit_run_response('', 'RUNNING', '')
+    db = __get_client_for_execute_notebook(mocker, output_data, {'run_id': 1})
+    db.inner_dbclient.jobs.get_run.side_effect = [
+        json.loads(running_data)['metadata'], json.loads(running_data)['metadata'],
+        json.loads(output_data)['metadata']]
+
+    result = db.execute_notebook('/mynotebook', 'clusterid',
+                                 poll_policy=_FastPollPolicy())
+
+    assert db.inner_dbclient.jobs.get_run.call_count == 3
+    assert db.inner_dbclient.jobs.get_run_output.call_count == 1
+    assert result.task_result_state == 'TERMINATED'
+
+
+def test__execute_notebook_async__slow_output__other_runs_not_blocked(mocker):
+    output_data = __get_submit_run_response('SUCCESS', 'TERMINATED', '')
+    db = __get_client_for_execute_notebook(mocker, output_data, {'run_id': 1})
+    db.inner_dbclient.jobs.submit_run.side_effect = [{'run_id': 1}, {'run_id': 2}]
+    release = threading.Event()
+    output_threads = []
+
+    def get_run_output(run_id):
+        output_threads.append(threading.current_thread().name)
+        if run_id == 1:
+            release.wait(5)
+        return json.loads(output_data)
+
+    db.inner_dbclient.jobs.get_run_output.side_effect = get_run_output
+
+    slow = db.execute_notebook_async('/test_1', 'clusterid', poll_policy=_FastPollPolicy())
+    fast = db.execute_notebook_async('/test_2', 'clusterid', poll_policy=_FastPollPolicy())
+
+    assert fast.result(2).task_result_state == 'TERMINATED'
+    assert not slow.done()
+    release.set()
+    assert slow.result(5).task_result_state == 'TERMINATED'
+    assert all(name.startswith('RunOutput') for name in output_threads)
+
+
+def test__execute_notebook__http_responses__bytes_received_is_tracked(mocker):
+    output_data = __get_submit_run_response('SUCCESS', 'TERMINATED', 'IHaveReturned')
+    db = __get_client(mocker)
+    mock_request = mocker.patch.object(db.inner_dbclient.session, 'request')
+    submit_response = _get_http_response(b'{"run_id": 1}')
+    run_response = _get_http_response(
+        json.dumps(json.loads(output_data)['metadata']).encode('utf-8'))
+    output_response = _get_http_response(output_data.encode('utf-8'))
+    mock_request.side_effect = [submit_response, run_response, output_response]
+
+    result = db.execute_notebook('/mynotebook', 'clusterid')
+
+    assert result.bytes_received == len(run_response.content) + len(output_response.content)
+
+
+def test__execute_notebooks__two_notebooks__one_multi_task_run_and_results_in_order(mocker):
+    output_data = json.loads(__get_submit_run_response('SUCCESS', 'TERMINATED', 'IHaveReturned'))
+    db = __get_client(mocker)
+    mocker.patch.object(db.inner_dbclient.jobs, 'submit_multi_task_run')
+    db.inner_dbclient.jobs.submit_multi_task_run.return_value = {'run_id': 1}
+    mocker.patch.object(db.inner_dbclient.jobs, 'get_multi_task_run')
+    db.inner_dbclient.jobs.get_multi_task_run.return_value = {
+        'run_id': 1,
+        'state': {'life_cycle_state': 'TERMINATED', 'result_state': 'SUCCESS'},
+        'tasks': [{'task_key': 'nutter_1', 'run_id': 12, 'start_time': 1000, 'end_time': 4000},
+                  {'task_key': 'nutter_0', 'run_id': 11, 'start_time': 1000, 'end_time': 2000}]}
+    mocker.patch.object(db.inner_dbclient.jobs, 'get_run_output')
+    db.inner_dbclient.jobs.get_run_output.return_value = output_data
+
+    results = db.execute_notebooks(['/test_1', '/test_2'], 'clusterid',
+                                   poll_policy=_FastPollPolicy())
+
+    assert db.inner_dbclient.jobs.submit_multi_task_run.call_count == 1
+    tasks = db.inner_dbclient.jobs.submit_multi_task_run.call_args[1]['tasks']
+    assert [task['notebook_task']['notebook_path'] for task in tasks] == ['/test_1', '/test_2']
+    assert all(task['existing_cluster_id'] == 'clusterid' for task in tasks)
+    assert [result.notebook_path for result in results] == ['/test_1', '/test_2']
+    assert [result.duration for result in results] == [1, 3]
+    db.inner_dbclient.jobs.get_run_output.assert_any_call(11)
+    db.inner_dbclient.jobs.get_run_output.assert_any_call(12)
+    assert results[0].task_result_state == 'TERMINATED'
+
+
+def test__execute_notebooks__two_tasks__outputs_downloaded_concurrently(mocker):
+    output_data = json.loads(
+        __get_submit_run_response('SUCCESS', 'TERMINATED', 'IHaveReturned'))
+    db = __get_client(mocker)
+    mocker.patch.object(db.inner_dbclient.jobs, 'submit_multi_task_run')
+    db.inner_dbclient.jobs.submit_multi_task_run.return_value = {'run_id': 1}
+    mocker.patch.object(db.inner_dbclient.jobs, 'get_multi_task_run')
+    db.inner_dbclient.jobs.get_multi_task_run.return_value = {
+        'run_id': 1,
+        'state': {'life_cycle_state': 'TERMINATED', 'result_state': 'SUCCESS'},
+        'tasks': [{'task_key': 'nutter_0', 'run_id': 11},
+                  {'task_key': 'nutter_1', 'run_id': 12}]}
+    # Each download waits for the other one
+    barrier = threading.Barrier(2, timeout=5)
+
+    def get_run_output(run_id):
+        barrier.wait()
+        return output_data
+
+    mocker.patch.object(db.inner_dbclient.jobs, 'get_run_output')
+    db.inner_dbclient.jobs.get_run_output.side_effect = get_run_output
+
+    results = db.execute_notebooks(['/test_1', '/test_2'], 'clusterid',
+                                   poll_policy=_FastPollPolicy())
+
+    assert [result.notebook_path for result in results] == ['/test_1', '/test_2']
+    assert all(result.task_result_state == 'TERMINATED' for result in results)
+
+
+def test__execute_notebooks__emptypath__valueerrror(mocker):
+    db = __get_client(mocker)
+
+    with pytest.raises(ValueError):
+        db.execute_notebooks(['/test_1', ''], 'clusterid')
+
+
+def _get_http_response(body):
+    response = requests.models.Response()
+    response.status_code = 200
+    response._content = body
+    return response
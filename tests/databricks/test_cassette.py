@@ -0,0 +1,123 @@
+"""
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import json
+import os
+import time
+import pytest
+import common.cassette as cassette
+from common.cassette import CassettePlayer, CassetteException
+from common.fakeworkspace import FakeWorkspace, FakeWorkspaceServer
+from common.apiclient import DatabricksAPIClient, AdaptivePollPolicy
+from common.httpretrier import TokenBucket
+
+api_url = 'https://myhost/api'
+
+
+def test__record_and_replay__execute_notebook__same_result(mocker, tmpdir):
+    path = os.path.join(str(tmpdir), 'cassette.json')
+    workspace = FakeWorkspace(['/test_1'], pending_duration=0.1, run_duration=0.1,
+                              test_cases=2)
+    with FakeWorkspaceServer(workspace) as server:
+        db = _get_client(mocker, server.url)
+        recorder = cassette.record(db.inner_dbclient)
+        recorded = db.execute_notebook('/test_1', 'cluster', poll_policy=_get_fast_policy())
+        recorder.save(path)
+
+    db = _get_client(mocker, server.url)
+    player = cassette.replay(db.inner_dbclient, path, speed=2)
+    replayed = db.execute_notebook('/test_1', 'cluster', poll_policy=_get_fast_policy())
+
+    assert replayed.task_result_state == recorded.task_result_state
+    assert replayed.test_results == recorded.test_results
+    assert player.requests > 0
+
+
+def test__request__run_get__state_follows_time_since_submit():
+    interactions = [
+        _get_interaction(0, 'POST', '2.0/jobs/runs/submit', {'run_id': 1},
+                         body={'notebook_task': {'notebook_path': '/test_1'}}),
+        _get_run_get(0.01, 'PENDING'),
+        _get_run_get(0.2, 'RUNNING'),
+        _get_run_get(0.4, 'TERMINATED')]
+    player = CassettePlayer(interactions, api_url)
+
+    player.request('POST', api_url + '/2.0/jobs/runs/submit',
+                   data=json.dumps({'notebook_task': {'notebook_path': '/test_1'}}))
+    states = [_get_state(player)]
+    time.sleep(0.25)
+    states.append(_get_state(player))
+    states.append(_get_state(player))
+    time.sleep(0.2)
+    states.append(_get_state(player))
+
+    assert states == ['PENDING', 'RUNNING', 'RUNNING', 'TERMINATED']
+
+
+def test__request__recorded_throttle__429_replayed_once():
+    interactions = [
+        _get_interaction(0, 'GET', '2.0/workspace/list', {'objects': []},
+                         params={'path': '/'}),
+        _get_interaction(0, 'GET', '2.0/workspace/list', {}, params={'path': '/'},
+                         status=429, headers={'Retry-After': '1'})]
+    player = CassettePlayer(interactions, api_url)
+
+    first = player.request('GET', api_url + '/2.0/workspace/list', params={'path': '/'})
+    second = player.request('GET', api_url + '/2.0/workspace/list', params={'path': '/'})
+
+    assert first.status_code == 429
+    assert first.headers['Retry-After'] == '1'
+    assert second.status_code == 200
+
+
+def test__request__submit_not_recorded__cassetteexception():
+    player = CassettePlayer([], api_url)
+
+    with pytest.raises(CassetteException):
+        player.request('POST', api_url + '/2.0/jobs/runs/submit',
+                       data=json.dumps({'notebook_task': {'notebook_path': '/test_1'}}))
+
+
+def test__ctor__speed_0__valueerror():
+    with pytest.raises(ValueError):
+        CassettePlayer([], api_url, speed=0)
+
+
+def test__load_cassette__other_version__cassetteexception(tmpdir):
+    path = os.path.join(str(tmpdir), 'cassette.json')
+    with open(path, 'w') as file:
+        file.write('{"version": 0, "interactions": []}')
+
+    with pytest.raises(CassetteException):
+        cassette.load_cassette(path)
+
+
+def _get_state(player):
+    response = player.request('GET', api_url + '/2.0/jobs/runs/get', params={'run_id': 1})
+    return response.json()['state']['life_cycle_state']
+
+
+def _get_run_get(time, life_cycle_state):
+    return _get_interaction(time, 'GET', '2.0/jobs/runs/get',
+                            {'run_id': 1, 'state': {'life_cycle_state': life_cycle_state}},
+                            params={'run_id': '1'})
+
+
+def _get_interaction(time, method, path, response, params=None, body=None,
+                     status=200, headers=None):
+    return {'time': time, 'latency': 0, 'method': method, 'path': path,
+            'params': params or {}, 'body': body or {}, 'status': status,
+            'headers': headers or {}, 'response': json.dumps(response)}
+
+
+def _get_client(mocker, url):
+    mocker.patch.dict(os.environ, {'DATABRICKS_HOST': url, 'DATABRICKS_TOKEN': 'token'})
+    db = DatabricksAPIClient()
+    db.rate_limiter = TokenBucket(1000)
+    return db
+
+
+def _get_fast_policy():
+    return AdaptivePollPolicy(min_wait=0.01, max_wait=0.05)
@@ -0,0 +1,148 @@
+"""
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import pytest
+import threading
+import time
+from common.circuitbreaker import CircuitBreaker, CircuitState, CircuitOpenException
+
+
+def test__ctor__invalid_failure_rate__valueerror():
+    with pytest.raises(ValueError):
+        CircuitBreaker(failure_rate=0)
+
+
+def test__ctor__invalid_window_size__valueerror():
+    with pytest.raises(ValueError):
+        CircuitBreaker(window_size=0)
+
+
+def test__record_failure__below_min_calls__closed():
+    breaker = CircuitBreaker(min_calls=5)
+
+    for i in range(0, 4):
+        breaker.record_failure()
+
+    assert breaker.state == CircuitState.CLOSED
+
+
+def test__record_failure__failure_rate_exceeded__open():
+    breaker = CircuitBreaker(failure_rate=0.5, window_size=4, min_calls=4)
+
+    breaker.record_success()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+
+    assert breaker.state == CircuitState.OPEN
+
+
+def test__before_call__open__circuitopenexception():
+    breaker = _get_open_breaker()
+
+    with pytest.raises(CircuitOpenException):
+        breaker.before_call()
+
+
+def test__before_call__open_duration_elapsed__half_open_probe_allowed():
+    breaker = _get_open_breaker(open_duration=0)
+
+    breaker.before_call()
+
+    assert breaker.state == CircuitState.HALF_OPEN
+
+
+def test__before_call__probe_in_flight__circuitopenexception():
+    breaker = _get_open_breaker(open_duration=0)
+    breaker.before_call()
+
+    with pytest.raises(CircuitOpenException):
+        breaker.before_call()
+
+
+def test__record_success__half_open__closed():
+    breaker = _get_open_breaker(open_duration=0)
+    breaker.before_call()
+
+    breaker.record_success()
+
+    assert breaker.state == CircuitState.CLOSED
+
+
+def test__record_failure__half_open__open():
+    breaker = _get_open_breaker(open_duration=0)
+    breaker.before_call()
+
+    breaker.record_failure()
+
+    assert breaker.state == CircuitState.OPEN
+
+
+def test__before_call__park_probe_succeeds__parked_call_proceeds():
+    breaker = _get_open_breaker(open_duration=0.1, park=True)
+    states = []
+
+    def parked_call():
+        breaker.before_call()
+        states.append(breaker.state)
+
+    # The first caller becomes the probe
+    time.sleep(0.1)
+    breaker.before_call()
+    parked = threading.Thread(target=parked_call)
+    parked.start()
+    breaker.record_success()
+    parked.join(5)
+
+    assert states == [CircuitState.CLOSED]
+
+
+def test__before_call__park_timeout__circuitopenexception():
+    breaker = _get_open_breaker(open_duration=10, park=True, park_timeout=0.1)
+
+    with pytest.raises(CircuitOpenException):
+        breaker.before_call()
+
+
+def test__add_listener__transitions__listener_called_with_states():
+    breaker = CircuitBreaker(window_size=1, min_calls=1, open_duration=0)
+    states = []
+    breaker.add_listener(states.append)
+
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.record_success()
+
+    assert states == [CircuitState.OPEN, CircuitState.HALF_OPEN, CircuitState.CLOSED]
+
+
+def test__add_listener__transition__listener_called_without_the_lock():
+    breaker = CircuitBreaker(window_size=1, min_calls=1)
+    locked = []
+
+    def try_lock():
+        acquired = breaker._condition.acquire(blocking=False)
+        if acquired:
+            breaker._condition.release()
+        locked.append(not acquired)
+
+    def listener(state):
+        # Another thread can use the breaker while the listener runs
+        thread = threading.Thread(target=try_lock)
+        thread.start()
+        thread.join()
+
+    breaker.add_listener(listener)
+
+    breaker.record_failure()
+
+    assert locked == [False]
+
+
+def _get_open_breaker(open_duration=30, park=False, park_timeout=600):
+    breaker = CircuitBreaker(window_size=1, min_calls=1, open_duration=open_duration,
+                             park=park, park_timeout=park_timeout)
+    breaker.record_failure()
+    return breaker
@@ -0,0 +1,303 @@
+"""
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import os
+import threading
+import time
+from common.fakeworkspace import FakeWorkspace, FakeWorkspaceServer
+from common.apiclient import DatabricksAPIClient, AdaptivePollPolicy
+from common.api import Nutter, NutterStatusEvents
+from common.statuseventhandler import EventHandler
+from common.httpretrier import TokenBucket
+from common.scheduler import MAX_NUM_OF_WORKERS
+from common.testresult import TestResults
+
+
+def test__list__nested_notebooks__direct_children_listed():
+    workspace = FakeWorkspace(['/tests/test_1', '/tests/a/test_2', '/other'])
+
+    status, _, response = workspace.handle('GET', '/api/2.0/workspace/list',
+                                           {'path': '/tests'}, {})
+
+    assert status == 200
+    assert [obj['path'] for obj in response['objects']] == ['/tests/a', '/tests/test_1']
+    assert response['objects'][0]['object_type'] == 'DIRECTORY'
+
+
+def test__submit__same_idempotency_token__same_run_id():
+    workspace = FakeWorkspace(['/test_1'])
+    body = {'notebook_task': {'notebook_path': '/test_1'}, 'idempotency_token': 'a'}
+
+    _, _, first = workspace.handle('POST', '/api/2.0/jobs/runs/submit', {}, body)
+    _, _, second = workspace.handle('POST', '/api/2.0/jobs/runs/submit', {}, body)
+
+    assert first['run_id'] == second['run_id']
+    assert len(workspace.runs) == 1
+
+
+def test__get_run__pending_then_running_then_terminated():
+    workspace = FakeWorkspace(['/test_1'], pending_duration=0.1, run_duration=0.1)
+    _, _, submitted = workspace.handle(
+        'POST', '/api/2.0/jobs/runs/submit', {},
+        {'notebook_task': {'notebook_path': '/test_1'}})
+    run_id = str(submitted['run_id'])
+
+    states = []
+    for _ in range(0, 3):
+        _, _, run = workspace.handle('GET', '/api/2.0/jobs/runs/get', {'run_id': run_id}, {})
+        states.append(run['state']['life_cycle_state'])
+        time.sleep(0.11)
+
+    assert states == ['PENDING', 'RUNNING', 'TERMINATED']
+
+
+def test__get_run_output__terminated__pickled_testresults():
+    workspace = FakeWorkspace(['/test_1'], test_cases=3, failure_rate=1)
+    _, _, submitted = workspace.handle(
+        'POST', '/api/2.0/jobs/runs/submit', {},
+        {'notebook_task': {'notebook_path': '/test_1'}})
+
+    _, _, output = workspace.handle('GET', '/api/2.0/jobs/runs/get-output',
+                                    {'run_id': str(submitted['run_id'])}, {})
+
+    test_results = TestResults().deserialize(output['notebook_output']['result'])
+    assert test_results.test_cases == 3
+    assert test_results.num_failures == 1
+
+
+def test__handle__throttle_rate_1__429_with_retry_after():
+    workspace = FakeWorkspace(['/test_1'], throttle_rate=1, retry_after=2)
+
+    status, headers, _ = workspace.handle('GET', '/api/2.0/workspace/list', {'path': '/'}, {})
+
+    assert status == 429
+    assert headers['Retry-After'] == '2'
+    assert workspace.throttled == 1
+
+
+def test__handle__error_rate_1__503():
+    workspace = FakeWorkspace(['/test_1'], error_rate=1)
+
+    status, _, _ = workspace.handle('GET', '/api/2.0/workspace/list', {'path': '/'}, {})
+
+    assert status == 503
+    assert workspace.errors == 1
+
+
+def test__cancel__running_run__terminated_and_canceled():
+    workspace = FakeWorkspace(['/test_1'], run_duration=60)
+    _, _, submitted = workspace.handle(
+        'POST', '/api/2.0/jobs/runs/submit', {},
+        {'notebook_task': {'notebook_path': '/test_1'}})
+
+    workspace.handle('POST', '/api/2.0/jobs/runs/cancel', {},
+                     {'run_id': submitted['run_id']})
+
+    run = workspace.runs[submitted['run_id']].to_run()
+    assert run['state']['life_cycle_state'] == 'TERMINATED'
+    assert run['state']['result_state'] == 'CANCELED'
+
+
+def test__terminate_cluster__running_run__internal_error_and_cluster_terminated():
+    workspace = FakeWorkspace(['/test_1'], run_duration=60)
+    _, _, submitted = workspace.handle(
+        'POST', '/api/2.0/jobs/runs/submit', {},
+        {'existing_cluster_id': 'cluster_1', 'notebook_task': {'notebook_path': '/test_1'}})
+
+    workspace.terminate_cluster('cluster_1')
+
+    run = workspace.runs[submitted['run_id']].to_run()
+    assert run['state']['life_cycle_state'] == 'INTERNAL_ERROR'
+    assert run['cluster_instance']['cluster_id'] == 'cluster_1'
+    _, _, cluster = workspace.handle(
+        'GET', '/api/2.0/clusters/get', {'cluster_id': 'cluster_1'}, None)
+    assert cluster['state'] == 'TERMINATED'
+
+
+def test__server__execute_notebook__result_has_testresults(mocker):
+    workspace = FakeWorkspace(['/test_1'], run_duration=0.05, test_cases=2)
+    with FakeWorkspaceServer(workspace) as server:
+        db = _get_client(mocker, server)
+
+        result = db.execute_notebook('/test_1', 'cluster', poll_policy=_get_fast_policy())
+
+    assert result.task_result_state == 'TERMINATED'
+    assert result.notebook_result.nutter_test_results.test_cases == 2
+
+
+def test__server__run_tests_recursively__all_tests_executed(mocker):
+    workspace = FakeWorkspace.with_test_notebooks(
+        20, folders=4, run_duration=0.05, pending_duration=0.05, failure_rate=0.5,
+        seed=1)
+    with FakeWorkspaceServer(workspace) as server:
+        mocker.patch.dict(os.environ, {'DATABRICKS_HOST': server.url,
+                                       'DATABRICKS_TOKEN': 'token'})
+        nutter = Nutter()
+
+        results = nutter.run_tests('/tests/*', 'cluster', 120, 8, True,
+                                   poll_policy=_get_fast_policy())
+
+    assert len(results) == 20
+    assert all(result.task_result_state == 'TERMINATED' for result in results)
+    assert any(result.is_any_error for result in results)
+    assert workspace.active_runs == 0
+
+
+def test__server__run_tests_in_batches__all_tests_executed(mocker):
+    workspace = FakeWorkspace.with_test_notebooks(6, run_duration=0.05)
+    with FakeWorkspaceServer(workspace) as server:
+        mocker.patch.dict(os.environ, {'DATABRICKS_HOST': server.url,
+                                       'DATABRICKS_TOKEN': 'token'})
+        nutter = Nutter()
+
+        results = nutter.run_tests('/tests/folder_0/*', 'cluster', 120, 2,
+                                   poll_policy=_get_fast_policy(), batch_size=3)
+
+    assert sorted(result.notebook_path for result in results) == \
+        sorted(workspace.notebooks)
+    assert not any(result.is_any_error for result in results)
+
+
+def test__server__run_tests_auto_parallelism__limit_bounded_by_cluster_cores(mocker):
+    workspace = FakeWorkspace.with_test_notebooks(30, run_duration=0.05, cluster_cores=4)
+    event_handler = _EventCollector()
+    with FakeWorkspaceServer(workspace) as server:
+        mocker.patch.dict(os.environ, {'DATABRICKS_HOST': server.url,
+                                       'DATABRICKS_TOKEN': 'token'})
+        nutter = Nutter(event_handler)
+
+        results = nutter.run_tests('/tests/folder_0/*', 'cluster', 120, 'auto',
+                                   poll_policy=_get_fast_policy())
+        nutter.events_processor_wait()
+
+    assert len(results) == 30
+    limits = [int(event.data.split(' ')[0]) for event in event_handler.events
+              if event.event == NutterStatusEvents.ConcurrencyChanged]
+    assert limits[0] == 2
+    assert max(limits) <= 4
+
+
+def test__server__run_tests_more_parallel_tests_than_workers__runs_in_flight_exceed_workers(mocker):
+    workspace = FakeWorkspace.with_test_notebooks(40, run_duration=0.5)
+    with FakeWorkspaceServer(workspace) as server:
+        mocker.patch.dict(os.environ, {'DATABRICKS_HOST': server.url,
+                                       'DATABRICKS_TOKEN': 'token'})
+        nutter = Nutter()
+        nutter.dbclient.rate_limiter = TokenBucket(1000)
+
+        results = nutter.run_tests('/tests/folder_0/*', 'cluster', 120, 40,
+                                   poll_policy=_get_fast_policy())
+
+    assert len(results) == 40
+    assert not any(result.is_any_error for result in results)
+    runs = list(workspace.runs.values())
+    in_flight = max(len([run for run in runs
+                         if run.submitted_at <= submitted.submitted_at < run.finishes_at])
+                    for submitted in runs)
+    assert in_flight > MAX_NUM_OF_WORKERS
+
+
+def test__server__run_tests_fail_fast__queued_tests_skipped_and_running_cancelled(mocker):
+    workspace = FakeWorkspace.with_test_notebooks(
+        10, run_duration=lambda path: 0.05 if path.endswith('_0') else 5, failure_rate=1)
+    with FakeWorkspaceServer(workspace) as server:
+        mocker.patch.dict(os.environ, {'DATABRICKS_HOST': server.url,
+                                       'DATABRICKS_TOKEN': 'token'})
+        nutter = Nutter()
+
+        start = time.time()
+        results = nutter.run_tests('/tests/folder_0/*', 'cluster', 120, 2,
+                                   poll_policy=_get_fast_policy(), fail_fast=1)
+
+    assert len(results) == 1
+    assert time.time() - start < 5
+    assert len(workspace.runs) < 10
+    assert any(run.cancelled_at is not None for run in workspace.runs.values())
+
+
+def test__server__run_tests_fail_fast_many_in_flight__no_submit_after_return(mocker):
+    workspace = FakeWorkspace.with_test_notebooks(
+        200, run_duration=lambda path: 0.05 if path.endswith('_0') else 30,
+        failure_rate=1)
+    with FakeWorkspaceServer(workspace) as server:
+        mocker.patch.dict(os.environ, {'DATABRICKS_HOST': server.url,
+                                       'DATABRICKS_TOKEN': 'token'})
+        nutter = Nutter()
+
+        nutter.run_tests('/tests/folder_0/*', 'cluster', 120, 100,
+                         poll_policy=_get_fast_policy(), fail_fast=1)
+        submitted = len(workspace.runs)
+        time.sleep(1)
+
+        assert len(workspace.runs) == submitted
+        assert submitted < 200
+        assert workspace.active_runs == 0
+
+
+def test__server__run_tests_cluster_pool__tests_spread_across_clusters(mocker):
+    workspace = FakeWorkspace.with_test_notebooks(8, run_duration=0.2)
+    with FakeWorkspaceServer(workspace) as server:
+        mocker.patch.dict(os.environ, {'DATABRICKS_HOST': server.url,
+                                       'DATABRICKS_TOKEN': 'token'})
+        nutter = Nutter()
+
+        results = nutter.run_tests('/tests/folder_0/*', 'cluster_1,cluster_2', 120, 4,
+                                   poll_policy=_get_fast_policy())
+
+    assert len(results) == 8
+    assert not any(result.is_any_error for result in results)
+    assert set(result.cluster_id for result in results) == {'cluster_1', 'cluster_2'}
+    # The runs do not finish at the same time, so the number of runs of each
+    # cluster varies, but the tests in flight are spread evenly
+    runs = list(workspace.runs.values())
+    for run in runs:
+        running = [other for other in runs if other.cluster_id == run.cluster_id
+                   and other.submitted_at <= run.submitted_at < other.finishes_at]
+        assert len(running) <= 2
+
+
+def test__server__run_tests_cluster_pool_cluster_terminated__tests_run_on_remaining_cluster(mocker):
+    workspace = FakeWorkspace.with_test_notebooks(8, run_duration=0.5)
+    event_handler = _EventCollector()
+    with FakeWorkspaceServer(workspace) as server:
+        mocker.patch.dict(os.environ, {'DATABRICKS_HOST': server.url,
+                                       'DATABRICKS_TOKEN': 'token'})
+        nutter = Nutter(event_handler)
+        timer = threading.Timer(0.2, workspace.terminate_cluster, ['cluster_2'])
+        timer.start()
+
+        results = nutter.run_tests('/tests/folder_0/*', 'cluster_1,cluster_2', 120, 20,
+                                   poll_policy=_get_fast_policy())
+        timer.join()
+        nutter.events_processor_wait()
+
+    assert len(results) == 8
+    assert not any(result.is_any_error for result in results)
+    assert all(result.cluster_id == 'cluster_1' for result in results)
+    removed = [event.data for event in event_handler.events
+               if event.event == NutterStatusEvents.ClusterRemoved]
+    assert removed == ['cluster_2 (TERMINATED)']
+
+
+class _EventCollector(EventHandler):
+    def __init__(self):
+        self.events = []
+        super().__init__()
+
+    def handle(self, queue):
+        while True:
+            item = queue.get()
+            self.events.append(item)
+            queue.task_done()
+
+
+def _get_client(mocker, server):
+    mocker.patch.dict(os.environ, {'DATABRICKS_HOST': server.url,
+                                   'DATABRICKS_TOKEN': 'token'})
+    return DatabricksAPIClient()
+
+
+def _get_fast_policy():
+    return AdaptivePollPolicy(min_wait=0.01, max_wait=0.05)
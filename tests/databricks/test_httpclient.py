@@ -0,0 +1,105 @@
+"""
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import pytest
+import requests
+import json
+from requests.exceptions import HTTPError
+from common.httpclient import DatabricksHttpClient
+import common.httpclient as httpclient
+
+
+def test__ctor__host_without_scheme__https_url():
+    client = DatabricksHttpClient('myhost', 'token')
+
+    assert client.url == 'https://myhost/api'
+
+
+def test__ctor__local_http_host__http_url():
+    client = DatabricksHttpClient('http://127.0.0.1:8080/', 'token')
+
+    assert client.url == 'http://127.0.0.1:8080/api'
+
+
+def test__ctor__empty_host__valueerror():
+    with pytest.raises(ValueError):
+        client = DatabricksHttpClient('', 'token')
+
+
+def test__ctor__token__bearer_header():
+    client = DatabricksHttpClient('myhost', 'mytoken')
+
+    assert client.session.headers['Authorization'] == 'Bearer mytoken'
+
+
+def test__set_pool_size__bigger__adapter_is_resized():
+    client = DatabricksHttpClient('myhost', 'token', 2)
+
+    client.set_pool_size(20)
+
+    assert client.pool_size == 20
+    assert client.session.get_adapter('https://myhost')._pool_maxsize == 20
+
+
+def test__set_pool_size__smaller__pool_size_is_kept():
+    client = DatabricksHttpClient('myhost', 'token', 20)
+
+    client.set_pool_size(2)
+
+    assert client.pool_size == 20
+
+
+def test__workspace_list__path__get_with_path_param(mocker):
+    client = DatabricksHttpClient('myhost', 'token')
+    mock_request = _mock_request(mocker, client, 200, {'objects': []})
+
+    objects = client.workspace.list('/folder')
+
+    assert objects == {'objects': []}
+    mock_request.assert_called_with(
+        'GET', 'https://myhost/api/2.0/workspace/list', params={'path': '/folder'})
+
+
+def test__submit_run__notebook_task__post_with_json_body(mocker):
+    client = DatabricksHttpClient('myhost', 'token')
+    mock_request = _mock_request(mocker, client, 200, {'run_id': 1})
+
+    run_id = client.jobs.submit_run(run_name='name', existing_cluster_id='cluster',
+                                    notebook_task={'notebook_path': '/test_a'})
+
+    assert run_id == {'run_id': 1}
+    args, kwargs = mock_request.call_args
+    assert args == ('POST', 'https://myhost/api/2.0/jobs/runs/submit')
+    assert json.loads(kwargs['data']) == {'run_name': 'name',
+                                          'existing_cluster_id': 'cluster',
+                                          'notebook_task': {'notebook_path': '/test_a'}}
+
+
+def test__cancel_run__empty_response__empty_dict(mocker):
+    client = DatabricksHttpClient('myhost', 'token')
+    _mock_request(mocker, client, 200, None)
+
+    assert client.jobs.cancel_run(1) == {}
+
+
+def test__get_run_output__500__httperror(mocker):
+    client = DatabricksHttpClient('myhost', 'token')
+    _mock_request(mocker, client, 500, None)
+
+    with pytest.raises(HTTPError):
+        client.jobs.get_run_output(1)
+
+
+def test__loads__no_content__empty_dict():
+    assert httpclient.loads(b'') == {}
+
+
+def _mock_request(mocker, client, status_code, body):
+    mock_request = mocker.patch.object(client.session, 'request')
+    mock_resp = requests.models.Response()
+    mock_resp.status_code = status_code
+    mock_resp._content = b'' if body is None else json.dumps(body).encode('utf-8')
+    mock_request.return_value = mock_resp
+    return mock_request
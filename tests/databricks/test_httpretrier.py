@@ -4,11 +4,13 @@ Licensed under the MIT license.
 """
 
 import pytest
-from common.httpretrier import HTTPRetrier
+from common.httpretrier import HTTPRetrier, RetryPolicy, TokenBucket
+from common.circuitbreaker import CircuitBreaker, CircuitOpenException, CircuitState
+import common.httpretrier as httpretrier
 import requests
 import io
 from requests.exceptions import HTTPError
-from databricks_api import DatabricksAPI
+from common.httpclient import DatabricksHttpClient
 
 def test__execute__no_exception__returns_value():
     retrier =  HTTPRetrier()
@@ -56,21 +58,21 @@ def test__execute__raises_non_http_exception__exception_arises(mocker):
 def test__execute__raises_500_http_exception__retries_twice_and_raises(mocker):
     retrier =  HTTPRetrier(2,1)
 
-    db = DatabricksAPI(host='HOST',token='TOKEN')
-    mock_request = mocker.patch.object(db.client.session, 'request')
+    db = DatabricksHttpClient(host='HOST',token='TOKEN')
+    mock_request = mocker.patch.object(db.session, 'request')
     mock_resp = requests.models.Response()
     mock_resp.status_code = 500
     mock_request.return_value = mock_resp
 
     with pytest.raises(HTTPError):
         return_value = retrier.execute(db.jobs.get_run_output, 1)
-    assert retrier._tries == 2
+    assert mock_request.call_count == 3
 
 def test__execute__raises_invalid_state_http_exception__retries_twice_and_raises(mocker):
     retrier =  HTTPRetrier(2,1)
 
-    db = DatabricksAPI(host='HOST',token='TOKEN')
-    mock_request = mocker.patch.object(db.client.session, 'request')
+    db = DatabricksHttpClient(host='HOST',token='TOKEN')
+    mock_request = mocker.patch.object(db.session, 'request')
     response_body = " { 'error_code': 'INVALID_STATE', 'message': 'Run result is empty. " + \
                     " There may have been issues while saving or reading results.'} "
 
@@ -81,20 +83,175 @@ def test__execute__raises_invalid_state_http_exception__retries_twice_and_raises
 
     with pytest.raises(HTTPError):
         return_value = retrier.execute(db.jobs.get_run_output, 1)
-    assert retrier._tries == 2
+    assert mock_request.call_count == 3
 
 def test__execute__raises_403_http_exception__no_retries_and_raises(mocker):
     retrier =  HTTPRetrier(2,1)
 
-    db = DatabricksAPI(host='HOST',token='TOKEN')
-    mock_request = mocker.patch.object(db.client.session, 'request')
+    db = DatabricksHttpClient(host='HOST',token='TOKEN')
+    mock_request = mocker.patch.object(db.session, 'request')
     mock_resp = requests.models.Response()
     mock_resp.status_code = 403
     mock_request.return_value = mock_resp
 
     with pytest.raises(HTTPError):
         return_value = retrier.execute(db.jobs.get_run_output, 1)
-    assert retrier._tries == 0
+    assert mock_request.call_count == 1
+
+def test__execute__raises_429_with_retry_after__waits_retry_after_and_returns(mocker):
+    retrier =  HTTPRetrier(2, 0.01, rate_limiter=mocker.Mock())
+    mock_sleep = mocker.patch.object(httpretrier, 'sleep')
+    db = DatabricksHttpClient(host='HOST',token='TOKEN')
+    mock_request = mocker.patch.object(db.session, 'request')
+    mock_request.side_effect = [_get_response(429, {'Retry-After': '7'}),
+                                _get_response(200, body=b'{"run_id": 1}')]
+
+    return_value = retrier.execute(db.jobs.get_run_output, 1)
+
+    assert return_value == {'run_id': 1}
+    assert mock_request.call_count == 2
+    assert mock_sleep.call_args[0][0] >= 7
+    retrier.rate_limiter.on_throttle.assert_called_with(7)
+
+
+def test__execute__raises_429__rate_limiter_is_throttled(mocker):
+    rate_limiter = TokenBucket(10)
+    retrier =  HTTPRetrier(1, 0.01, rate_limiter=rate_limiter)
+    mocker.patch.object(httpretrier, 'sleep')
+    db = DatabricksHttpClient(host='HOST',token='TOKEN')
+    mock_request = mocker.patch.object(db.session, 'request')
+    mock_request.return_value = _get_response(429)
+
+    with pytest.raises(HTTPError):
+        retrier.execute(db.jobs.get_run_output, 1)
+
+    assert rate_limiter.rate == 2.5
+
+
+def test__execute__429_then_500_then_200__listener_notified_of_each_attempt(mocker):
+    retrier =  HTTPRetrier(2, 0.01, rate_limiter=mocker.Mock())
+    mocker.patch.object(httpretrier, 'sleep')
+    db = DatabricksHttpClient(host='HOST',token='TOKEN')
+    mock_request = mocker.patch.object(db.session, 'request')
+    mock_request.side_effect = [_get_response(429), _get_response(500),
+                                _get_response(200, body=b'{}')]
+    calls = []
+    retrier.add_listener(lambda name, latency, throttled, failed:
+                         calls.append((name, throttled, failed)))
+
+    retrier.execute(db.jobs.get_run_output, 1)
+
+    assert calls == [('get_run_output', True, False),
+                     ('get_run_output', False, True),
+                     ('get_run_output', False, False)]
+
+
+def test__execute__policy_override_for_function__override_is_used(mocker):
+    retrier =  HTTPRetrier(5, 0.01, policies={'get_run_output': RetryPolicy(1, 0.01)})
+    mocker.patch.object(httpretrier, 'sleep')
+    db = DatabricksHttpClient(host='HOST',token='TOKEN')
+    mock_request = mocker.patch.object(db.session, 'request')
+    mock_request.return_value = _get_response(500)
+
+    with pytest.raises(HTTPError):
+        retrier.execute(db.jobs.get_run_output, 1)
+
+    assert mock_request.call_count == 2
+
+
+def test__execute__connection_error__retries_and_returns():
+    retrier =  HTTPRetrier(2, 0.01)
+    raiser = ExceptionRaiser(0, requests.exceptions.ConnectionError)
+    calls = []
+
+    def fail_once():
+        calls.append(1)
+        if len(calls) == 1:
+            raiser.execute()
+        return 'ok'
+
+    assert retrier.execute(fail_once) == 'ok'
+
+
+def test__execute__circuit_opens_while_retrying__fails_fast(mocker):
+    breaker = CircuitBreaker(window_size=2, min_calls=2)
+    retrier =  HTTPRetrier(20, 0.01, circuit_breaker=breaker)
+    mocker.patch.object(httpretrier, 'sleep')
+    db = DatabricksHttpClient(host='HOST',token='TOKEN')
+    mock_request = mocker.patch.object(db.session, 'request')
+    mock_request.return_value = _get_response(500)
+
+    with pytest.raises(CircuitOpenException):
+        retrier.execute(db.jobs.get_run_output, 1)
+
+    assert mock_request.call_count == 2
+
+
+def test__execute__403_with_circuit_breaker__call_recorded_as_success(mocker):
+    breaker = CircuitBreaker(window_size=1, min_calls=1)
+    retrier =  HTTPRetrier(2, 0.01, circuit_breaker=breaker)
+    db = DatabricksHttpClient(host='HOST',token='TOKEN')
+    mock_request = mocker.patch.object(db.session, 'request')
+    mock_request.return_value = _get_response(403)
+
+    with pytest.raises(HTTPError):
+        retrier.execute(db.jobs.get_run_output, 1)
+
+    breaker.before_call()
+
+
+@pytest.mark.parametrize('status_code, body', [(429, b''), (400, b'INVALID_STATE')])
+def test__execute__throttled_with_circuit_breaker__circuit_stays_closed(
+        mocker, status_code, body):
+    breaker = CircuitBreaker(window_size=2, min_calls=2)
+    retrier =  HTTPRetrier(10, 0.01, rate_limiter=mocker.Mock(), circuit_breaker=breaker)
+    mocker.patch.object(httpretrier, 'sleep')
+    db = DatabricksHttpClient(host='HOST',token='TOKEN')
+    mock_request = mocker.patch.object(db.session, 'request')
+    mock_request.return_value = _get_response(status_code, body=body)
+
+    with pytest.raises(HTTPError):
+        retrier.execute(db.jobs.submit_run)
+
+    assert mock_request.call_count == 11
+    assert breaker.state == CircuitState.CLOSED
+
+
+def test__backoff__full_jitter__between_zero_and_cap():
+    policy = RetryPolicy(10, 1, 8)
+
+    for attempt in range(0, 10):
+        wait = policy.backoff(attempt)
+        assert 0 <= wait <= min(8, 2 ** attempt)
+
+
+def test__get_retry_after__http_date__seconds_until_date():
+    retrier = HTTPRetrier()
+    response = _get_response(429, {'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'})
+
+    assert retrier._get_retry_after(response) == 0
+
+
+def test__token_bucket__success_after_throttle__rate_recovers():
+    rate_limiter = TokenBucket(10)
+    rate_limiter.on_throttle()
+
+    rate_limiter.on_success()
+
+    assert rate_limiter.rate == pytest.approx(5.1)
+
+
+def test__token_bucket__invalid_rate__valueerror():
+    with pytest.raises(ValueError):
+        TokenBucket(0)
+
+
+def _get_response(status_code, headers=None, body=b''):
+    response = requests.models.Response()
+    response.status_code = status_code
+    response.headers.update(headers or {})
+    response._content = body
+    return response
 
 def _get_value(return_value):
     return return_value
@@ -6,6 +6,9 @@ Licensed under the MIT license.
 import pytest
 import os
 import json
+import time
+import threading
+from concurrent.futures import Future
 from common.api import Nutter, TestNotebook, NutterStatusEvents
 import common.api as nutter_api
 from common.testresult import TestResults, TestResult
@@ -13,7 +16,11 @@ from common.api import TestNamePatternMatcher
 from common.resultreports import JunitXMLReportWriter
 from common.resultreports import TagsReportWriter
 from common.apiclient import WorkspacePath, DatabricksAPIClient
-from common.statuseventhandler import StatusEventsHandler, EventHandler, StatusEvent
+from common.statuseventhandler import EventHandler, StatusEvent
+from common.runhistory import RunHistory
+from common.listingcache import ListingCache
+from common.apiclientresults import ExecuteNotebookResult
+from common.resultsstore import ResultsStore
 
 def test__workspacepath__empty_object_response__instance_is_created():
     objects = {}
@@ -192,6 +199,101 @@ def test__list_tests_recursively__1test1test1dir1dir__2_test(mocker):
     assert expected == tests
     assert nutter.dbclient.list_objects.call_count == 3
 
+def test__list_tests_recursively__listings_return_out_of_order__depth_first_order(mocker):
+    nutter = _get_nutter(mocker)
+    workspace = {
+        '/': [('NOTEBOOK', '/test_1'), ('DIRECTORY', '/a'), ('DIRECTORY', '/b'),
+              ('NOTEBOOK', '/test_2')],
+        '/a': [('DIRECTORY', '/a/c'), ('NOTEBOOK', '/a/test_3')],
+        '/a/c': [('NOTEBOOK', '/a/c/test_4')],
+        '/b': [('NOTEBOOK', '/b/test_5')]}
+    delays = {'/a': 0.05, '/a/c': 0.05}
+
+    def list_objects(path, modified_at=None):
+        time.sleep(delays.get(path, 0))
+        return _get_workspacepathobject(workspace[path])
+
+    mocker.patch.object(nutter.dbclient, 'list_objects')
+    nutter.dbclient.list_objects.side_effect = list_objects
+
+    tests = nutter.list_tests('/', True, listing_concurrency=4)
+
+    assert [test.path for test in tests] == \
+        ['/test_1', '/test_2', '/a/test_3', '/a/c/test_4', '/b/test_5']
+    assert nutter.dbclient.list_objects.call_count == 4
+
+
+def test__iter_tests_recursively__listings_return_out_of_order__yields_as_listed(mocker):
+    nutter = _get_nutter(mocker)
+    workspace = {
+        '/': [('DIRECTORY', '/a'), ('DIRECTORY', '/b')],
+        '/a': [('NOTEBOOK', '/a/test_1')],
+        '/b': [('NOTEBOOK', '/b/test_2')]}
+
+    def list_objects(path, modified_at=None):
+        time.sleep(0.1 if path == '/a' else 0)
+        return _get_workspacepathobject(workspace[path])
+
+    mocker.patch.object(nutter.dbclient, 'list_objects')
+    nutter.dbclient.list_objects.side_effect = list_objects
+
+    tests = list(nutter.iter_tests('/', True, listing_concurrency=2))
+
+    assert [test.path for test in tests] == ['/b/test_2', '/a/test_1']
+
+
+def test__list_tests_recursively__unchanged_directory__listed_from_cache(mocker):
+    listing_cache = ListingCache()
+    nutter = _get_nutter(mocker, listing_cache=listing_cache)
+    workspace = {
+        '/': {'objects': [
+            {'object_type': 'DIRECTORY', 'path': '/a', 'modified_at': 100},
+            {'object_type': 'DIRECTORY', 'path': '/b', 'modified_at': 100}]},
+        '/a': {'objects': [{'object_type': 'NOTEBOOK', 'path': '/a/test_1'}]},
+        '/b': {'objects': [{'object_type': 'NOTEBOOK', 'path': '/b/test_2'}]}}
+    mocker.patch.object(nutter.dbclient.inner_dbclient.workspace, 'list')
+    nutter.dbclient.inner_dbclient.workspace.list.side_effect = lambda path: workspace[path]
+
+    nutter.list_tests('/', True)
+    workspace['/']['objects'][1]['modified_at'] = 200
+    tests = nutter.list_tests('/', True)
+
+    assert [test.path for test in tests] == ['/a/test_1', '/b/test_2']
+    listed_paths = [call[0][0] for call in
+                    nutter.dbclient.inner_dbclient.workspace.list.call_args_list]
+    assert sorted(listed_paths) == ['/', '/', '/a', '/b', '/b']
+    assert listing_cache.hits == 1
+
+
+def test__list_tests_recursively__notebook_added_in_grandchild__notebook_listed(mocker):
+    listing_cache = ListingCache()
+    nutter = _get_nutter(mocker, listing_cache=listing_cache)
+    workspace = {
+        '/': {'objects': [{'object_type': 'DIRECTORY', 'path': '/a', 'modified_at': 100}]},
+        '/a': {'objects': [{'object_type': 'DIRECTORY', 'path': '/a/b', 'modified_at': 100}]},
+        '/a/b': {'objects': [{'object_type': 'DIRECTORY', 'path': '/a/b/c',
+                              'modified_at': 100}]},
+        '/a/b/c': {'objects': [{'object_type': 'NOTEBOOK', 'path': '/a/b/c/test_1'}]}}
+    mocker.patch.object(nutter.dbclient.inner_dbclient.workspace, 'list')
+    nutter.dbclient.inner_dbclient.workspace.list.side_effect = lambda path: workspace[path]
+
+    nutter.list_tests('/', True)
+    # Only the modification time of the changed directory and its parent change
+    workspace['/a/b']['objects'][0]['modified_at'] = 200
+    workspace['/a/b/c']['objects'].append(
+        {'object_type': 'NOTEBOOK', 'path': '/a/b/c/test_2'})
+    tests = nutter.list_tests('/', True)
+
+    assert [test.path for test in tests] == ['/a/b/c/test_1', '/a/b/c/test_2']
+
+
+def test__list_tests__listing_concurrency_0__valueerror(mocker):
+    nutter = _get_nutter(mocker)
+
+    with pytest.raises(ValueError):
+        nutter.list_tests('/', True, listing_concurrency=0)
+
+
 def test__list_tests__notest__empty_list(mocker):
     nutter = _get_nutter(mocker)
     dbapi_client = _get_client(mocker)
@@ -242,17 +344,21 @@ def test__run_tests__twomatch_three_tests___nutterstatusevents_testlisting_sched
     assert status_event.event == NutterStatusEvents.TestScheduling
     assert status_event.data == '/my_test'
 
-    status_event = event_handler.get_item()
-    assert status_event.event == NutterStatusEvents.TestExecuted
-    assert status_event.data.success
-
-    status_event = event_handler.get_item()
-    assert status_event.event == NutterStatusEvents.TestExecuted
-    assert status_event.data.success
-
-    status_event = event_handler.get_item()
-    assert status_event.event == NutterStatusEvents.TestExecutionResult
-    assert status_event.data #True if success
+    # The result of each test is processed as soon as it completes
+    executed = 0
+    processed = 0
+    for _ in range(4):
+        status_event = event_handler.get_item()
+        if status_event.event == NutterStatusEvents.TestExecuted:
+            assert status_event.data.success
+            executed += 1
+            continue
+        assert status_event.event == NutterStatusEvents.TestExecutionResult
+        assert status_event.data #True if success
+        processed += 1
+        assert processed <= executed
+    assert executed == 2
+    assert processed == 2
 
 def test__run_tests__twomatch__okay(mocker):
     nutter = _get_nutter(mocker)
@@ -275,6 +381,83 @@ def test__run_tests__twomatch__okay(mocker):
     result = results[1]
     assert result.task_result_state == 'TERMINATED'
 
+def test__run_tests__on_result__called_for_each_result(mocker):
+    nutter = _get_nutter(mocker)
+    submit_response = _get_submit_run_response('SUCCESS', 'TERMINATED', '')
+    dbapi_client = _get_client_for_execute_notebook(mocker, submit_response)
+
+    nutter.dbclient = dbapi_client
+    _mock_dbclient_list_objects(mocker, dbapi_client, [
+        ('NOTEBOOK', '/test_my'),
+        ('NOTEBOOK', '/my_test')])
+    on_result_results = []
+
+    results = nutter.run_tests("/my*", "cluster", on_result=on_result_results.append)
+
+    assert on_result_results == results
+    assert len(results) == 2
+
+
+def test__run_tests__results_store__results_added_to_the_store(mocker):
+    nutter = _get_nutter(mocker)
+    submit_response = _get_submit_run_response('SUCCESS', 'TERMINATED', '')
+    dbapi_client = _get_client_for_execute_notebook(mocker, submit_response)
+
+    nutter.dbclient = dbapi_client
+    _mock_dbclient_list_objects(mocker, dbapi_client, [
+        ('NOTEBOOK', '/test_my'),
+        ('NOTEBOOK', '/my_test')])
+
+    with ResultsStore() as store:
+        results = nutter.run_tests("/my*", "cluster", results_store=store)
+
+        assert results is store
+        assert len(store) == 2
+        assert all(result.task_result_state == 'TERMINATED' for result in store)
+
+
+def test__iter_run_tests__twomatch__results_yielded(mocker):
+    nutter = _get_nutter(mocker)
+    submit_response = _get_submit_run_response('SUCCESS', 'TERMINATED', '')
+    dbapi_client = _get_client_for_execute_notebook(mocker, submit_response)
+
+    nutter.dbclient = dbapi_client
+    _mock_dbclient_list_objects(mocker, dbapi_client, [
+        ('NOTEBOOK', '/test_my'),
+        ('NOTEBOOK', '/my_test')])
+
+    results = nutter.iter_run_tests("/my*", "cluster")
+
+    assert not isinstance(results, list)
+    assert all(result.task_result_state == 'TERMINATED' for result in results)
+
+
+def test__iter_run_tests__one_submit_fails__other_results_yielded_then_exception(mocker):
+    nutter = _get_nutter(mocker)
+    submit_response = _get_submit_run_response('SUCCESS', 'TERMINATED', '')
+    dbapi_client = _get_client_for_execute_notebook(mocker, submit_response)
+    mocker.patch.object(dbapi_client, 'execute_notebook')
+    result = _get_execute_notebook_result(submit_response, '/test_my')
+
+    def execute_notebook(path, *args):
+        if path == '/my_test':
+            raise ValueError(path)
+        return result
+    dbapi_client.execute_notebook.side_effect = execute_notebook
+
+    nutter.dbclient = dbapi_client
+    _mock_dbclient_list_objects(mocker, dbapi_client, [
+        ('NOTEBOOK', '/test_my'),
+        ('NOTEBOOK', '/my_test')])
+    results = []
+
+    with pytest.raises(ValueError):
+        for result in nutter.iter_run_tests("/my*", "cluster"):
+            results.append(result)
+
+    assert len(results) == 1
+
+
 def test__run_tests_recursively__2test1dir3test__5_tests(mocker):
     nutter = _get_nutter(mocker)
     submit_response = _get_submit_run_response('SUCCESS', 'TERMINATED', '')
@@ -383,6 +566,308 @@ def test__run_tests__nomatches__okay(mocker):
 
     assert len(results) == 0
 
+def test__run_tests__with_run_history__durations_are_recorded(mocker):
+    run_history = RunHistory()
+    nutter = _get_nutter(mocker, run_history=run_history)
+    submit_response = _get_submit_run_response('SUCCESS', 'TERMINATED', '')
+    dbapi_client = _get_client_for_execute_notebook(mocker, submit_response)
+    nutter.dbclient = dbapi_client
+    _mock_dbclient_list_objects(mocker, dbapi_client, [
+        ('NOTEBOOK', '/test_my'), ('NOTEBOOK', '/my_test')])
+
+    nutter.run_tests("/my*", "cluster")
+
+    assert run_history.expected_duration('/test_my') is not None
+    assert run_history.expected_duration('/my_test') is not None
+
+
+def test__run_tests__longest_first__longest_expected_scheduled_first(mocker):
+    event_handler = TestEventHandler()
+    run_history = RunHistory()
+    run_history.record('/test_short', 10)
+    run_history.record('/test_long', 600)
+    nutter = _get_nutter(mocker, event_handler, run_history=run_history)
+    submit_response = _get_submit_run_response('SUCCESS', 'TERMINATED', '')
+    dbapi_client = _get_client_for_execute_notebook(mocker, submit_response)
+    nutter.dbclient = dbapi_client
+    _mock_dbclient_list_objects(mocker, dbapi_client, [
+        ('NOTEBOOK', '/test_short'), ('NOTEBOOK', '/test_long')])
+
+    nutter.run_tests("/*", "cluster", scheduling_policy='longest_first')
+
+    scheduled = []
+    for _ in range(8):
+        status_event = event_handler.get_item()
+        if status_event.event == NutterStatusEvents.TestScheduling:
+            scheduled.append(status_event.data)
+    assert scheduled == ['/test_long', '/test_short']
+
+
+def test__plan_tests__longest_first_2_parallel__predicted_makespan(mocker):
+    run_history = RunHistory()
+    run_history.record('/test_a', 10)
+    run_history.record('/test_b', 10)
+    run_history.record('/test_c', 60)
+    nutter = _get_nutter(mocker, run_history=run_history)
+    dbapi_client = _get_client(mocker)
+    nutter.dbclient = dbapi_client
+    _mock_dbclient_list_objects(mocker, dbapi_client, [
+        ('NOTEBOOK', '/test_a'), ('NOTEBOOK', '/test_b'), ('NOTEBOOK', '/test_c'),
+        ('NOTEBOOK', '/test_d')])
+    mocker.patch.object(dbapi_client, 'execute_notebook')
+
+    schedule_plan = nutter.plan_tests("/*", "cluster", 2, scheduling_policy='longest_first')
+
+    assert schedule_plan.planned_runs[0].notebook_paths == ['/test_c']
+    assert schedule_plan.makespan == 60
+    assert schedule_plan.unknown == ['/test_d']
+    assert dbapi_client.execute_notebook.call_count == 0
+
+
+def test__run_tests__invalid_scheduling_policy__valueerror(mocker):
+    nutter = _get_nutter(mocker)
+
+    with pytest.raises(ValueError):
+        nutter.run_tests("/my*", "cluster", scheduling_policy='shortest')
+
+
+def test__run_tests__fail_fast_1_first_test_fails__stopped_and_runs_cancelled(mocker):
+    event_handler = TestEventHandler()
+    nutter = _get_nutter(mocker, event_handler)
+    submit_response = _get_submit_run_response('FAILED', 'TERMINATED', '')
+    dbapi_client = _get_client_for_execute_notebook(mocker, submit_response)
+    nutter.dbclient = dbapi_client
+    _mock_dbclient_list_objects(mocker, dbapi_client, [
+        ('NOTEBOOK', '/test_a'), ('NOTEBOOK', '/test_b'), ('NOTEBOOK', '/test_c'),
+        ('NOTEBOOK', '/test_d')])
+    mocker.patch.object(nutter, 'cancel_runs')
+
+    results = nutter.run_tests("/*", "cluster", fail_fast=1)
+
+    assert len(results) == 1
+    assert nutter.cancel_runs.call_count == 1
+    assert dbapi_client.inner_dbclient.jobs.submit_run.call_count < 4
+    status_event = event_handler.get_item()
+    while status_event.event != NutterStatusEvents.ExecutionStopped:
+        status_event = event_handler.get_item()
+    assert status_event.data == 1
+
+
+def test__run_tests__fail_fast_3_two_failures__all_tests_executed(mocker):
+    nutter = _get_nutter(mocker)
+    submit_response = _get_submit_run_response('FAILED', 'TERMINATED', '')
+    dbapi_client = _get_client_for_execute_notebook(mocker, submit_response)
+    nutter.dbclient = dbapi_client
+    _mock_dbclient_list_objects(mocker, dbapi_client, [
+        ('NOTEBOOK', '/test_a'), ('NOTEBOOK', '/test_b')])
+    mocker.patch.object(nutter, 'cancel_runs')
+
+    results = nutter.run_tests("/*", "cluster", fail_fast=3)
+
+    assert len(results) == 2
+    assert nutter.cancel_runs.call_count == 0
+
+
+def test__run_tests__shard_2_of_2__shard_notebooks_executed(mocker):
+    event_handler = TestEventHandler()
+    shard_history = RunHistory()
+    for notebook_path, duration in [('/test_a', 40), ('/test_b', 30), ('/test_c', 20),
+                                    ('/test_d', 10)]:
+        shard_history.record(notebook_path, duration)
+    nutter = _get_nutter(mocker, event_handler)
+    submit_response = _get_submit_run_response('SUCCESS', 'TERMINATED', '')
+    dbapi_client = _get_client_for_execute_notebook(mocker, submit_response)
+    nutter.dbclient = dbapi_client
+    _mock_dbclient_list_objects(mocker, dbapi_client, [
+        ('NOTEBOOK', '/test_a'), ('NOTEBOOK', '/test_b'), ('NOTEBOOK', '/test_c'),
+        ('NOTEBOOK', '/test_d')])
+
+    results = nutter.run_tests("/*", "cluster", shard='2/2', shard_history=shard_history)
+
+    assert len(results) == 2
+    notebook_paths = [call[1]['notebook_task']['notebook_path'] for call
+                      in dbapi_client.inner_dbclient.jobs.submit_run.call_args_list]
+    assert notebook_paths == ['/test_b', '/test_c']
+    status_event = event_handler.get_item()
+    while status_event.event != NutterStatusEvents.TestsSharded:
+        status_event = event_handler.get_item()
+    assert status_event.data.num_of_tests == 2
+    assert status_event.data.total_tests == 4
+
+
+def test__run_tests__shards_with_different_run_histories__notebooks_executed_once(mocker):
+    notebook_paths = ['/test_{}'.format(index) for index in range(12)]
+    executed = []
+    for index, durations in [(1, range(12)), (2, [])]:
+        # The local history of each agent differs, the second agent has none
+        run_history = RunHistory()
+        for notebook_path, duration in zip(notebook_paths, durations):
+            run_history.record(notebook_path, duration)
+        nutter = _get_nutter(mocker, run_history=run_history)
+        submit_response = _get_submit_run_response('SUCCESS', 'TERMINATED', '')
+        dbapi_client = _get_client_for_execute_notebook(mocker, submit_response)
+        nutter.dbclient = dbapi_client
+        _mock_dbclient_list_objects(mocker, dbapi_client, [
+            ('NOTEBOOK', notebook_path) for notebook_path in notebook_paths])
+
+        nutter.run_tests("/*", "cluster", shard=(index, 2))
+
+        executed += [call[1]['notebook_task']['notebook_path'] for call
+                     in dbapi_client.inner_dbclient.jobs.submit_run.call_args_list]
+
+    assert sorted(executed) == sorted(notebook_paths)
+
+
+def test__run_tests__invalid_shard__valueerror(mocker):
+    nutter = _get_nutter(mocker)
+
+    with pytest.raises(ValueError):
+        nutter.run_tests("/my*", "cluster", shard='3/2')
+
+
+def test__run_tests__fail_fast_0__valueerror(mocker):
+    nutter = _get_nutter(mocker)
+
+    with pytest.raises(ValueError):
+        nutter.run_tests("/my*", "cluster", fail_fast=0)
+
+
+def test__run_tests__cluster_pool_cluster_down__tests_executed_on_other_cluster(mocker):
+    event_handler = TestEventHandler()
+    nutter = _get_nutter(mocker, event_handler)
+    dbapi_client = _get_client_for_cluster_pool(mocker, {'cluster_1': 'TERMINATED'})
+    nutter.dbclient = dbapi_client
+    _mock_dbclient_list_objects(mocker, dbapi_client, [
+        ('NOTEBOOK', '/test_my1'), ('NOTEBOOK', '/test_my2')])
+
+    results = nutter.run_tests("/my*", "cluster_1,cluster_2")
+
+    assert not any(result.is_error for result in results)
+    cluster_ids = [call[0][1] for call in dbapi_client.execute_notebook.call_args_list]
+    assert cluster_ids == ['cluster_1', 'cluster_2', 'cluster_2']
+    status_event = event_handler.get_item()
+    while status_event.event != NutterStatusEvents.ClusterRemoved:
+        status_event = event_handler.get_item()
+    assert status_event.data == 'cluster_1 (TERMINATED)'
+
+
+def test__run_tests__async_cluster_pool_cluster_down__failover_out_of_the_poller(mocker):
+    nutter = _get_nutter(mocker)
+    dbapi_client = _get_client_for_cluster_pool(mocker, {'cluster_1': 'TERMINATED'})
+    state_threads = []
+    get_cluster_state = dbapi_client.get_cluster_state.side_effect
+
+    def get_cluster_state_on_thread(cluster_id):
+        state_threads.append(threading.current_thread().name)
+        return get_cluster_state(cluster_id)
+
+    dbapi_client.get_cluster_state.side_effect = get_cluster_state_on_thread
+
+    def execute_notebook_async(path, cluster_id, *args):
+        # The futures complete on the poller
+        future = Future()
+        result = dbapi_client.execute_notebook(path, cluster_id, *args)
+        poller = threading.Timer(0.01, future.set_result, [result])
+        poller.name = 'RunStatusPoller'
+        poller.start()
+        return future
+
+    mocker.patch.object(dbapi_client, 'execute_notebook_async')
+    dbapi_client.execute_notebook_async.side_effect = execute_notebook_async
+    nutter.dbclient = dbapi_client
+    _mock_dbclient_list_objects(mocker, dbapi_client, [
+        ('NOTEBOOK', '/test_my1'), ('NOTEBOOK', '/test_my2')])
+
+    results = nutter.run_tests("/my*", "cluster_1,cluster_2", max_parallel_tests=20)
+
+    assert len(results) == 2
+    assert not any(result.is_error for result in results)
+    assert len(state_threads) > 0
+    assert all(name.startswith('ClusterFailover') for name in state_threads)
+
+
+def test__run_tests__cluster_pool_cluster_running__error_result_not_executed_again(mocker):
+    nutter = _get_nutter(mocker)
+    dbapi_client = _get_client_for_cluster_pool(mocker, {'cluster_1': 'RUNNING'})
+    nutter.dbclient = dbapi_client
+    _mock_dbclient_list_objects(mocker, dbapi_client, [('NOTEBOOK', '/test_my1')])
+
+    results = nutter.run_tests("/my*", "cluster_1,cluster_2")
+
+    assert results[0].is_error
+    assert dbapi_client.execute_notebook.call_count == 1
+
+
+def test__run_tests__single_cluster_error_result__cluster_state_not_retrieved(mocker):
+    nutter = _get_nutter(mocker)
+    dbapi_client = _get_client_for_cluster_pool(mocker, {'cluster_1': 'TERMINATED'})
+    nutter.dbclient = dbapi_client
+    _mock_dbclient_list_objects(mocker, dbapi_client, [('NOTEBOOK', '/test_my1')])
+
+    results = nutter.run_tests("/my*", "cluster_1")
+
+    assert results[0].is_error
+    assert dbapi_client.get_cluster_state.call_count == 0
+
+
+def test__run_tests__batch_size_2_three_tests__two_batches_submitted(mocker):
+    event_handler = TestEventHandler()
+    nutter = _get_nutter(mocker, event_handler)
+    dbapi_client = _get_client(mocker)
+    nutter.dbclient = dbapi_client
+    _mock_dbclient_list_objects(mocker, dbapi_client, [
+        ('NOTEBOOK', '/test_my1'), ('NOTEBOOK', '/test_my2'), ('NOTEBOOK', '/test_my3')])
+    submit_response = _get_submit_run_response('SUCCESS', 'TERMINATED', '')
+    mocker.patch.object(dbapi_client, 'execute_notebooks')
+    dbapi_client.execute_notebooks.side_effect = lambda paths, *args: [
+        _get_execute_notebook_result(submit_response, path) for path in paths]
+
+    results = nutter.run_tests("/my*", "cluster", batch_size=2)
+
+    assert dbapi_client.execute_notebooks.call_count == 2
+    batches = sorted(call[0][0] for call in dbapi_client.execute_notebooks.call_args_list)
+    assert batches == [['/test_my1', '/test_my2'], ['/test_my3']]
+    assert sorted(result.notebook_path for result in results) == \
+        ['/test_my1', '/test_my2', '/test_my3']
+    events = [event_handler.get_item().event for _ in range(0, 13)]
+    assert events.count(NutterStatusEvents.TestExecuted) == 3
+    assert events.count(NutterStatusEvents.TestExecutionResult) == 3
+
+
+def test__run_tests__batch_size_0__valueerror(mocker):
+    nutter = _get_nutter(mocker)
+
+    with pytest.raises(ValueError):
+        nutter.run_tests("/my*", "cluster", batch_size=0)
+
+
+def test__cancel_runs__outstanding_run__nutterstatusevents_runscancelled_is_fired(mocker):
+    event_handler = TestEventHandler()
+    nutter = _get_nutter(mocker, event_handler)
+    mocker.patch.object(nutter.dbclient.inner_dbclient.jobs, 'cancel_run')
+    nutter.dbclient._register_run(1)
+
+    result = nutter.cancel_runs()
+
+    assert result.cancelled == [1]
+    assert nutter.cancelled_runs == [1]
+    status_event = event_handler.get_item()
+    assert status_event.event == NutterStatusEvents.RunsCancelled
+    assert status_event.data == result
+
+
+def test__ctor__circuit_breaker_opens__nutterstatusevents_circuitbreakerstatechanged_is_fired(mocker):
+    event_handler = TestEventHandler()
+    nutter = _get_nutter(mocker, event_handler)
+
+    for i in range(0, nutter.dbclient.circuit_breaker.min_calls):
+        nutter.dbclient.circuit_breaker.record_failure()
+
+    status_event = event_handler.get_item()
+    assert status_event.event == NutterStatusEvents.CircuitBreakerStateChanged
+    assert status_event.data == 'OPEN'
+
+
 def test__to_testresults__none_output__none(mocker):
     output = None
     result = nutter_api.to_testresults(output)
@@ -513,13 +998,39 @@ def _get_client_for_execute_notebook(mocker, output_data):
     db = _get_client(mocker)
     mocker.patch.object(db.inner_dbclient.jobs, 'submit_run')
     db.inner_dbclient.jobs.submit_run.return_value = run_id
+    mocker.patch.object(db.inner_dbclient.jobs, 'get_run')
+    db.inner_dbclient.jobs.get_run.return_value = json.loads(
+        output_data)['metadata']
     mocker.patch.object(db.inner_dbclient.jobs, 'get_run_output')
     db.inner_dbclient.jobs.get_run_output.return_value = json.loads(
         output_data)
+    mocker.patch.object(db.inner_dbclient.jobs, 'cancel_run')
+    db.inner_dbclient.jobs.cancel_run.return_value = {}
 
     return db
 
 
+def _get_client_for_cluster_pool(mocker, cluster_states):
+    # The runs fail with an internal error on the clusters with a state
+    db = _get_client(mocker)
+    success_response = _get_submit_run_response('SUCCESS', 'TERMINATED', '')
+    error_response = _get_submit_run_response('FAILED', 'INTERNAL_ERROR', '')
+    mocker.patch.object(db, 'execute_notebook')
+    db.execute_notebook.side_effect = lambda path, cluster_id, *args: \
+        _get_execute_notebook_result(
+            error_response if cluster_id in cluster_states else success_response, path)
+    mocker.patch.object(db, 'get_cluster_state')
+    db.get_cluster_state.side_effect = lambda cluster_id: cluster_states.get(
+        cluster_id, 'RUNNING')
+    return db
+
+
+def _get_execute_notebook_result(output_data, notebook_path):
+    result = ExecuteNotebookResult.from_job_output(json.loads(output_data))
+    result.notebook_path = notebook_path
+    return result
+
+
 def _get_client(mocker):
     mocker.patch.dict(os.environ, {'DATABRICKS_HOST': 'myhost'})
     mocker.patch.dict(os.environ, {'DATABRICKS_TOKEN': 'mytoken'})
@@ -527,11 +1038,11 @@ def _get_client(mocker):
     return DatabricksAPIClient()
 
 
-def _get_nutter(mocker, event_handler = None):
+def _get_nutter(mocker, event_handler = None, run_history = None, listing_cache = None):
     mocker.patch.dict(os.environ, {'DATABRICKS_HOST': 'myhost'})
     mocker.patch.dict(os.environ, {'DATABRICKS_TOKEN': 'mytoken'})
 
-    return Nutter(event_handler)
+    return Nutter(event_handler, run_history, listing_cache)
 
 
 def _mock_dbclient_list_objects(mocker, dbclient, objects):
@@ -46,6 +46,79 @@ def test__is_any_error__terminated_success_valid_results_with_no_failure__false(
 
 
 
+def test__failures__not_terminated__1():
+    exec_result = _get_run_test_response('', 'SKIPPED','')
+
+    assert exec_result.failures == 1
+
+
+def test__failures__terminated_success_2_failed_test_cases__2():
+    test_results = TestResults()
+    test_results.append(TestResult('case',False, 10,[]))
+    test_results.append(TestResult('case2',False, 10,[]))
+    test_results.append(TestResult('case3',True, 10,[]))
+    exec_result = _get_run_test_response('SUCCESS', 'TERMINATED',test_results.serialize())
+
+    assert exec_result.failures == 2
+
+
+def test__failures__terminated_success_no_failed_test_cases__0():
+    test_results = TestResults()
+    test_results.append(TestResult('case',True, 10,[]))
+    exec_result = _get_run_test_response('SUCCESS', 'TERMINATED',test_results.serialize())
+
+    assert exec_result.failures == 0
+
+
+def test__from_job_output__cluster_instance__cluster_id_of_the_instance():
+    exec_result = _get_run_test_response('SUCCESS', 'TERMINATED', '')
+
+    assert exec_result.cluster_id == '0925-141d1222-narcs242'
+
+
+def test__from_job_output__compressed_results__results_decompressed():
+    test_results = TestResults()
+    test_results.append(TestResult('case', False, 10, [], AssertionError('failed')))
+    exec_result = _get_run_test_response(
+        'SUCCESS', 'TERMINATED', test_results.serialize('zlib'))
+
+    assert exec_result.notebook_result.nutter_test_results == test_results
+    assert exec_result.failures == 1
+
+
+def test__test_results__accessed_many_times__exit_output_parsed_once(mocker):
+    test_results = TestResults()
+    test_results.append(TestResult('case', True, 10, []))
+    exec_result = _get_run_test_response(
+        'SUCCESS', 'TERMINATED', test_results.serialize())
+    deserialize = mocker.spy(TestResults, 'deserialize')
+
+    assert not exec_result.is_any_error
+    assert exec_result.failures == 0
+    assert exec_result.test_results is exec_result.notebook_result.nutter_test_results
+
+    assert deserialize.call_count == 1
+
+
+def test__test_results__valid_output__exit_output_released():
+    test_results = TestResults()
+    test_results.append(TestResult('case', True, 10, []))
+    exec_result = _get_run_test_response(
+        'SUCCESS', 'TERMINATED', test_results.serialize())
+
+    assert exec_result.notebook_result.exit_output is not None
+    assert exec_result.test_results == test_results
+    assert exec_result.notebook_result.exit_output is None
+
+
+def test__test_results__invalid_output__none_exit_output_kept():
+    exec_result = _get_run_test_response('SUCCESS', 'TERMINATED', 'IHaveReturned')
+
+    assert exec_result.test_results is None
+    assert exec_result.notebook_result.exit_output == 'IHaveReturned'
+    assert exec_result.notebook_result.parse_error is not None
+
+
 def test__is_any_error__terminated_success_2_valid_results_with_no_failure__false():
     test_results = TestResults()
     test_results.append(TestResult('case',True, 10,[]))
@@ -0,0 +1,119 @@
+"""
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import pytest
+from common.clusterpool import get_cluster_pool, is_available_state, ClusterPool
+
+
+def test__get_cluster_pool__cluster_id__pool_of_1():
+    cluster_pool = get_cluster_pool('cluster_1')
+
+    assert cluster_pool.cluster_ids == ['cluster_1']
+
+
+def test__get_cluster_pool__comma_separated__pool_in_order():
+    cluster_pool = get_cluster_pool('cluster_1, cluster_2,cluster_3')
+
+    assert cluster_pool.cluster_ids == ['cluster_1', 'cluster_2', 'cluster_3']
+
+
+def test__get_cluster_pool__list__pool_in_order():
+    cluster_pool = get_cluster_pool(['cluster_1', 'cluster_2'])
+
+    assert cluster_pool.cluster_ids == ['cluster_1', 'cluster_2']
+
+
+def test__get_cluster_pool__empty_ids__ignored():
+    cluster_pool = get_cluster_pool('cluster_1,,')
+
+    assert cluster_pool.cluster_ids == ['cluster_1']
+
+
+def test__get_cluster_pool__empty__pool_with_empty_cluster():
+    cluster_pool = get_cluster_pool('')
+
+    assert cluster_pool.cluster_ids == ['']
+
+
+def test__get_cluster_pool__pool__same_pool():
+    cluster_pool = ClusterPool([('cluster_1', 1)])
+
+    assert get_cluster_pool(cluster_pool) is cluster_pool
+
+
+def test__get_cluster_pool__invalid_weight__valueerror():
+    with pytest.raises(ValueError):
+        get_cluster_pool('cluster_1:abc')
+
+
+def test__get_cluster_pool__weight_0__valueerror():
+    with pytest.raises(ValueError):
+        get_cluster_pool('cluster_1:0,cluster_2')
+
+
+def test__acquire__same_weights__round_robin():
+    cluster_pool = get_cluster_pool('cluster_1,cluster_2')
+
+    cluster_ids = [cluster_pool.acquire() for _ in range(4)]
+
+    assert cluster_ids == ['cluster_1', 'cluster_2', 'cluster_1', 'cluster_2']
+
+
+def test__acquire__weights__in_flight_proportional_to_weights():
+    cluster_pool = get_cluster_pool({'cluster_1': 3, 'cluster_2': 1})
+
+    for _ in range(8):
+        cluster_pool.acquire()
+
+    assert cluster_pool.in_flight('cluster_1') == 6
+    assert cluster_pool.in_flight('cluster_2') == 2
+
+
+def test__acquire__released__least_loaded_cluster():
+    cluster_pool = get_cluster_pool('cluster_1,cluster_2')
+    cluster_pool.acquire()
+    cluster_pool.acquire()
+    cluster_pool.acquire()
+
+    cluster_pool.release('cluster_2')
+
+    assert cluster_pool.acquire() == 'cluster_2'
+
+
+def test__remove__cluster__not_acquired():
+    cluster_pool = get_cluster_pool('cluster_1,cluster_2')
+
+    removed = cluster_pool.remove('cluster_1')
+
+    assert removed
+    assert 'cluster_1' not in cluster_pool
+    assert [cluster_pool.acquire() for _ in range(2)] == ['cluster_2', 'cluster_2']
+
+
+def test__remove__last_cluster__not_removed():
+    cluster_pool = get_cluster_pool('cluster_1,cluster_2')
+    cluster_pool.remove('cluster_1')
+
+    removed = cluster_pool.remove('cluster_2')
+
+    assert not removed
+    assert len(cluster_pool) == 1
+
+
+def test__remove__removed_cluster__false():
+    cluster_pool = get_cluster_pool('cluster_1,cluster_2,cluster_3')
+    cluster_pool.remove('cluster_1')
+
+    assert not cluster_pool.remove('cluster_1')
+    assert len(cluster_pool) == 2
+
+
+def test__is_available_state__running__true():
+    assert is_available_state('RUNNING')
+
+
+def test__is_available_state__terminated_or_unknown__false():
+    assert not is_available_state('TERMINATED')
+    assert not is_available_state(None)
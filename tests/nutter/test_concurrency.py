@@ -0,0 +1,128 @@
+"""
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import pytest
+import threading
+import time
+from common.concurrency import ConcurrencyController, run_with_slot
+
+
+def test__ctor__max_limit_less_than_min__valueerror():
+    with pytest.raises(ValueError):
+        ConcurrencyController(min_limit=4, max_limit=2)
+
+
+def test__on_call__limit_healthy_calls__limit_increases_by_one():
+    controller = ConcurrencyController(initial_limit=2)
+
+    controller.on_call(0.1)
+    controller.on_call(0.1)
+
+    assert controller.limit == 3
+
+
+def test__on_call__many_healthy_calls__limit_not_above_max():
+    controller = ConcurrencyController(initial_limit=2, max_limit=4)
+
+    for _ in range(0, 100):
+        controller.on_call(0.1)
+
+    assert controller.limit == 4
+
+
+def test__on_call__throttled__limit_halved():
+    controller = ConcurrencyController(initial_limit=8)
+
+    controller.on_call(0.1, throttled=True)
+
+    assert controller.limit == 4
+
+
+def test__on_api_call__run_call_throttled__limit_halved():
+    controller = ConcurrencyController(initial_limit=8)
+
+    controller.on_api_call('submit_run', 0.1, throttled=True)
+
+    assert controller.limit == 4
+
+
+def test__on_api_call__slow_output_download__limit_not_changed():
+    controller = ConcurrencyController(initial_limit=8)
+    controller.on_api_call('get_run', 0.1)
+
+    for _ in range(5):
+        controller.on_api_call('get_run_output', 10)
+
+    assert controller.limit == 8
+
+
+def test__on_call__throttled_twice_before_in_flight_calls_complete__halved_once():
+    controller = ConcurrencyController(initial_limit=8)
+    controller.acquire()
+    controller.acquire()
+
+    controller.on_call(0.1, throttled=True)
+    controller.on_call(0.1, throttled=True)
+
+    assert controller.limit == 4
+
+
+def test__on_call__failed__limit_not_below_min():
+    controller = ConcurrencyController(min_limit=1, initial_limit=1)
+
+    controller.on_call(0.1, failed=True)
+
+    assert controller.limit == 1
+
+
+def test__on_call__latency_degraded__limit_decreases():
+    controller = ConcurrencyController(initial_limit=8, latency_tolerance=2)
+    controller.on_call(0.1)
+
+    for _ in range(0, 10):
+        controller.on_call(1)
+
+    assert controller.limit < 8
+
+
+def test__set_max_limit__below_limit__limit_reduced_and_listener_called():
+    controller = ConcurrencyController(initial_limit=8)
+    changes = []
+    controller.add_listener(lambda limit, reason: changes.append((limit, reason)))
+
+    controller.set_max_limit(4, 'cluster cores')
+
+    assert controller.limit == 4
+    assert changes == [(4, 'cluster cores')]
+
+
+def test__acquire__limit_reached__waits_for_release():
+    controller = ConcurrencyController(initial_limit=1, max_limit=1)
+    controller.acquire()
+    acquired = threading.Event()
+
+    def acquire():
+        controller.acquire()
+        acquired.set()
+
+    threading.Thread(target=acquire, daemon=True).start()
+    time.sleep(0.05)
+    assert not acquired.is_set()
+
+    controller.release()
+
+    assert acquired.wait(1)
+
+
+def test__run_with_slot__function_raises__slot_released():
+    controller = ConcurrencyController(initial_limit=1)
+
+    def fail():
+        raise ValueError()
+
+    with pytest.raises(ValueError):
+        run_with_slot(controller, fail)
+
+    assert controller.in_flight == 0
@@ -0,0 +1,87 @@
+"""
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import os
+import common.listingcache as listingcache
+from common.listingcache import ListingCache
+
+objects = {'objects': [{'object_type': 'NOTEBOOK', 'path': '/a/test_1'}]}
+
+
+def test__get__empty_cache__none_and_miss():
+    cache = ListingCache()
+
+    assert cache.get('/a', 100) is None
+    assert cache.misses == 1
+
+
+def test__get__saved_same_modified_at__objects_and_hit():
+    cache = ListingCache()
+    cache.put('/a', 100, objects)
+    cache.save()
+
+    assert cache.get('/a', 100) == objects
+    assert cache.hits == 1
+
+
+def test__get__saved_different_modified_at__none():
+    cache = ListingCache()
+    cache.put('/a', 100, objects)
+    cache.save()
+
+    assert cache.get('/a', 200) is None
+
+
+def test__get__none_modified_at__none_and_not_counted():
+    cache = ListingCache()
+    cache.put('/a', None, objects)
+    cache.save()
+
+    assert cache.get('/a', None) is None
+    assert cache.misses == 0
+
+
+def test__get__not_saved__none():
+    cache = ListingCache()
+    cache.put('/a', 100, objects)
+
+    assert cache.get('/a', 100) is None
+
+
+def test__get__saved_to_file_new_instance__objects(tmpdir):
+    path = os.path.join(str(tmpdir), 'listing.sqlite')
+    cache = ListingCache(path, 'host')
+    cache.put('/a', 100, objects)
+    cache.save()
+
+    assert ListingCache(path, 'host').get('/a', 100) == objects
+
+
+def test__get__saved_for_other_scope__none(tmpdir):
+    path = os.path.join(str(tmpdir), 'listing.sqlite')
+    cache = ListingCache(path, 'host1')
+    cache.put('/a', 100, objects)
+    cache.save()
+
+    assert ListingCache(path, 'host2').get('/a', 100) is None
+
+
+def test__get__invalid_file__none(tmpdir):
+    path = os.path.join(str(tmpdir), 'listing.sqlite')
+    with open(path, 'w') as file:
+        file.write('not a database')
+
+    cache = ListingCache(path)
+
+    assert cache.get('/a', 100) is None
+
+
+def test__get_listing_cache__cache_dir_env_var__path_in_cache_dir(mocker, tmpdir):
+    mocker.patch.dict(os.environ, {'NUTTER_CACHE_DIR': str(tmpdir)})
+
+    cache = listingcache.get_listing_cache('host')
+
+    assert cache.path == os.path.join(str(tmpdir), listingcache.LISTING_CACHE_FILE_NAME)
+    assert cache.scope == 'host'
@@ -4,6 +4,9 @@ Licensed under the MIT license.
 """
 
 import pytest
+from junit_xml import TestSuite
+from common.apiclientresults import ExecuteNotebookResult, NotebookOutputResult
+from common.resultsstore import ResultsStore
 from common.testresult import TestResults, TestResult
 from common.resultreports import JunitXMLReportWriter
 from common.resultreports import TagsReportWriter
@@ -42,3 +45,69 @@ def test_tagsreportwriter_add_result__1_test_result__1_valid_row():
     assert row.passed_str == 'PASSED'
     assert row.duration == duration
     assert row.tags == row._to_tag_string(tags)
+
+
+def test_junitxmlreportwriter_add_report_file__two_shards__same_as_all_results(tmp_path):
+    test_results = _get_test_results()
+    expected_writer = JunitXMLReportWriter()
+    writer = JunitXMLReportWriter()
+    for index in range(2):
+        shard_writer = JunitXMLReportWriter()
+        shard_writer.add_result('/test_shard{}'.format(index), test_results)
+        shard_writer.to_file(str(tmp_path / 'shard{}.xml'.format(index)))
+        expected_writer.add_result('/test_shard{}'.format(index), test_results)
+
+    for index in range(2):
+        writer.add_report_file(str(tmp_path / 'shard{}.xml'.format(index)))
+    writer.to_file(str(tmp_path / 'merged.xml'))
+    expected_writer.to_file(str(tmp_path / 'expected.xml'))
+
+    assert (tmp_path / 'merged.xml').read_text() == (tmp_path / 'expected.xml').read_text()
+
+
+def test_tagsreportwriter_add_report_file__two_shards__same_as_all_results(tmp_path):
+    test_results = _get_test_results()
+    expected_writer = TagsReportWriter()
+    writer = TagsReportWriter()
+    for index in range(2):
+        shard_writer = TagsReportWriter()
+        shard_writer.add_result('/test,shard{}'.format(index), test_results)
+        shard_writer.to_file(str(tmp_path / 'shard{}.txt'.format(index)))
+        expected_writer.add_result('/test,shard{}'.format(index), test_results)
+
+    for index in range(2):
+        writer.add_report_file(str(tmp_path / 'shard{}.txt'.format(index)))
+    writer.to_file(str(tmp_path / 'merged.txt'))
+    expected_writer.to_file(str(tmp_path / 'expected.txt'))
+
+    assert (tmp_path / 'merged.txt').read_text() == (tmp_path / 'expected.txt').read_text()
+    assert writer._rows[1].notebook_name == '/test,shard0'
+    assert writer._rows[1].passed_str == 'FAILED'
+
+
+def _get_test_results():
+    test_results = TestResults()
+    test_results.append(TestResult('case1', True, 1.5, ['hello', 'world']))
+    test_results.append(TestResult('case2', False, 2, [], AssertionError('failed')))
+    return test_results
+
+
+def test_junitxmlreportwriter_to_file__results_store__same_xml_as_junit_xml(tmp_path):
+    writer = JunitXMLReportWriter()
+    expected_suites = []
+    with ResultsStore() as store:
+        for index in range(3):
+            test_results = TestResults()
+            test_results.append(TestResult('case{}'.format(index), index != 1, 10,
+                                           ['tag'], Exception('error <&>')))
+            store.add(ExecuteNotebookResult(
+                'TERMINATED', '/test_{}'.format(index),
+                NotebookOutputResult('SUCCESS', test_results.serialize()), ''))
+            expected_suites.append(
+                writer._to_junitxml('/test_{}'.format(index), test_results))
+        writer.add_results(store)
+        writer.to_file(str(tmp_path / 'report.xml'))
+
+    assert writer.all_test_suites == []
+    with open(str(tmp_path / 'report.xml')) as file:
+        assert file.read() == TestSuite.to_xml_string(expected_suites)
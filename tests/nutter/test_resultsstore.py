@@ -0,0 +1,100 @@
+"""
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import os
+import pytest
+from common.apiclientresults import ExecuteNotebookResult, NotebookOutputResult
+from common.resultsstore import ResultsStore
+from common.testresult import TestResults, TestResult
+
+
+def test__add__two_results__index_has_the_summary_of_each():
+    with ResultsStore() as store:
+        store.add(_get_result('/test_1', passed=2, failed=0))
+        store.add(_get_result('/test_2', passed=1, failed=2))
+
+        assert len(store) == 2
+        assert [entry.notebook_path for entry in store.index] == ['/test_1', '/test_2']
+        assert [entry.success for entry in store.index] == [True, False]
+        assert [entry.passed for entry in store.index] == [2, 1]
+        assert [entry.failed for entry in store.index] == [0, 2]
+        assert store.failures == 2
+
+
+def test__iter__results_added__results_read_back_in_order():
+    results = [_get_result('/test_1', passed=2, failed=0),
+               _get_result('/test_2', passed=1, failed=1)]
+    with ResultsStore() as store:
+        for result in results:
+            store.add(result)
+
+        stored = list(store)
+
+    assert [result.notebook_path for result in stored] == ['/test_1', '/test_2']
+    assert [result.test_results for result in stored] == \
+        [result.test_results for result in results]
+    assert stored[1].duration == 10
+    assert stored[1].cluster_id == 'cluster'
+    assert stored[1].is_any_error
+
+
+def test__iter__invalid_output__raw_output_kept():
+    result = ExecuteNotebookResult(
+        'TERMINATED', '/test_1', NotebookOutputResult('SUCCESS', 'IHaveReturned'), 'url')
+    with ResultsStore() as store:
+        store.add(result)
+
+        stored = list(store)[0]
+
+    assert stored.test_results is None
+    assert stored.notebook_result.exit_output == 'IHaveReturned'
+
+
+def test__iter_failed__one_failed_result__only_failed_result_read():
+    with ResultsStore() as store:
+        store.add(_get_result('/test_1', passed=2, failed=0))
+        store.add(_get_result('/test_2', passed=0, failed=1))
+        store.add(_get_result('/test_3', passed=1, failed=0))
+
+        failed = list(store.iter_failed())
+
+    assert [result.notebook_path for result in failed] == ['/test_2']
+
+
+def test__close__temporary_file__file_deleted():
+    store = ResultsStore()
+    store.add(_get_result('/test_1', passed=1, failed=0))
+
+    store.close()
+
+    assert not os.path.exists(store.path)
+
+
+def test__close__path__file_kept(tmpdir):
+    path = os.path.join(str(tmpdir), 'results.jsonl')
+    store = ResultsStore(path)
+    store.add(_get_result('/test_1', passed=1, failed=0))
+
+    store.close()
+
+    assert os.path.getsize(path) > 0
+
+
+def test__add__not_an_execution_result__valueerror():
+    with ResultsStore() as store:
+        with pytest.raises(ValueError):
+            store.add('result')
+
+
+def _get_result(notebook_path, passed, failed):
+    test_results = TestResults()
+    for index in range(passed):
+        test_results.append(TestResult('passed_{}'.format(index), True, 1, ['tag']))
+    for index in range(failed):
+        test_results.append(TestResult('failed_{}'.format(index), False, 1, [],
+                                       AssertionError('failed'), 'trace'))
+    notebook_result = NotebookOutputResult('SUCCESS', test_results.serialize())
+    return ExecuteNotebookResult('TERMINATED', notebook_path, notebook_result, 'url',
+                                 duration=10, cluster_id='cluster')
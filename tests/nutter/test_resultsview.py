@@ -5,7 +5,10 @@ Licensed under the MIT license.
 
 import json
 import pytest
-from common.resultsview import RunCommandResultsView, TestCaseResultView, ListCommandResultView, ListCommandResultsView
+import common.schedulingpolicy as schedulingpolicy
+from common.resultsview import SchedulePlanView, get_run_results_views
+from common.resultsstore import ResultsStore
+from common.resultsview import RunCommandResultView, RunCommandResultsView, TestCaseResultView, ListCommandResultView, ListCommandResultsView
 from common.apiclientresults import ExecuteNotebookResult
 from common.testresult import TestResults, TestResult
 from common.api import TestNotebook
@@ -22,6 +25,22 @@ def test__add_exec_result__vaid_instance__isadded(mocker):
     assert run_results_view.total == 1
 
 
+def test__get_run_results_views__results_store__view_of_each_result(mocker):
+    test_results = TestResults()
+    test_results.append(TestResult('case', True, 10, []))
+
+    with ResultsStore() as store:
+        store.add(__get_ExecuteNotebookResult('SUCCESS', 'TERMINATED', test_results.serialize()))
+        store.add(__get_ExecuteNotebookResult('SUCCESS', 'TERMINATED', 'NO PICKLE'))
+
+        run_results_view = get_run_results_views(store)
+        view = run_results_view.get_view()
+
+    assert run_results_view.total == 2
+    assert 'PASSING TESTS' in view
+    assert 'Notebook output: NO PICKLE' in view
+
+
 def test__add_exec_result__vaid_instance_invalid_output__isadded(mocker):
 
     test_results = "NO PICKLE"
@@ -50,6 +69,26 @@ def test__add_exec_result__vaid_instance_invalid_output__no_test_case_view(mocke
     assert run_results_view.total == 1
 
 
+def test__get_view__for_run_command_result_invalid_output__shows_raw_output(mocker):
+    notebook_results = __get_ExecuteNotebookResult(
+        'SUCCESS', 'TERMINATED', 'NO PICKLE')
+
+    view = RunCommandResultView(notebook_results).get_view()
+
+    assert 'Notebook output: NO PICKLE' in view
+
+
+def test__get_view__for_run_command_result_no_test_cases__shows_output_released(mocker):
+    notebook_results = __get_ExecuteNotebookResult(
+        'SUCCESS', 'TERMINATED', TestResults().serialize())
+
+    view = RunCommandResultView(notebook_results).get_view()
+
+    assert 'No test cases were returned.' in view
+    assert 'Notebook output: released after parsing the test results' in view
+    assert 'None' not in view
+
+
 def test__add_exec_result__vaid_instance__test_case_view(mocker):
 
     test_results = TestResults()
@@ -282,3 +321,32 @@ def __get_ExecuteNotebookResult(result_state, life_cycle_state, notebook_result)
     data_dict['metadata']['state']['life_cycle_state'] = life_cycle_state
 
     return ExecuteNotebookResult.from_job_output(data_dict)
+
+
+def test__schedule_plan_view__2_runs__makespan_and_paths_in_view():
+    schedule_plan = schedulingpolicy.plan(
+        [['/test_long'], ['/test_short']], {'/test_long': 60, '/test_short': 10}, 1)
+    schedule_plan.unknown = ['/test_short']
+
+    plan_view = SchedulePlanView(schedule_plan)
+    view = plan_view.get_view()
+
+    assert plan_view.total == 2
+    assert 'Path:\t/test_long' in view
+    assert 'Predicted makespan: 70.0s' in view
+    assert 'Notebooks without run history: 1' in view
+
+
+def test__print__results_store_view__same_output_as_get_view(capsys):
+    test_results = TestResults()
+    test_results.append(TestResult('case', True, 10, []))
+
+    with ResultsStore() as store:
+        store.add(__get_ExecuteNotebookResult('SUCCESS', 'TERMINATED', test_results.serialize()))
+        store.add(__get_ExecuteNotebookResult('SUCCESS', 'TERMINATED', 'NO PICKLE'))
+        run_results_view = get_run_results_views(store)
+        expected = run_results_view.get_view()
+
+        run_results_view.print()
+
+    assert capsys.readouterr().out == expected + '\n'
@@ -0,0 +1,96 @@
+"""
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import os
+import pytest
+import common.runhistory as runhistory
+from common.runhistory import RunHistory
+
+
+def test__expected_duration__unknown_notebook__none():
+    history = RunHistory()
+
+    assert history.expected_duration('/test_a') is None
+
+
+def test__record__first_run__expected_duration_is_duration():
+    history = RunHistory()
+
+    history.record('/test_a', 10)
+
+    assert history.expected_duration('/test_a') == 10
+
+
+def test__record__two_runs__expected_duration_is_moving_average():
+    history = RunHistory()
+
+    history.record('/test_a', 10)
+    history.record('/test_a', 20)
+
+    assert history.expected_duration('/test_a') == 15
+
+
+def test__record__none_duration__not_recorded():
+    history = RunHistory()
+
+    history.record('/test_a', None)
+
+    assert history.expected_duration('/test_a') is None
+
+
+def test__save__reload__durations_are_loaded(tmpdir):
+    path = os.path.join(str(tmpdir), 'cache', 'history.json')
+    history = RunHistory(path, 'host')
+    history.record('/test_a', 10)
+
+    history.save()
+
+    assert RunHistory(path, 'host').expected_duration('/test_a') == 10
+
+
+def test__save__reload_other_scope__durations_are_not_shared(tmpdir):
+    path = os.path.join(str(tmpdir), 'history.json')
+    history = RunHistory(path, 'host1')
+    history.record('/test_a', 10)
+
+    history.save()
+
+    assert RunHistory(path, 'host2').expected_duration('/test_a') is None
+
+
+def test__load__invalid_file__empty_history(tmpdir):
+    path = os.path.join(str(tmpdir), 'history.json')
+    with open(path, 'w') as file:
+        file.write('not json')
+
+    history = RunHistory(path, 'host')
+
+    assert history.expected_duration('/test_a') is None
+
+
+def test__get_run_history__cache_dir_env_var__path_in_cache_dir(mocker, tmpdir):
+    mocker.patch.dict(os.environ, {runhistory.CACHE_DIR_ENV_VAR: str(tmpdir)})
+
+    history = runhistory.get_run_history('host')
+
+    assert history.path == os.path.join(str(tmpdir), runhistory.HISTORY_FILE_NAME)
+
+
+def test__get_shard_history__existing_file__durations_are_loaded(tmpdir):
+    path = os.path.join(str(tmpdir), 'history.json')
+    history = RunHistory(path, 'host')
+    history.record('/test_a', 10)
+    history.save()
+
+    shard_history = runhistory.get_shard_history(path, 'host')
+
+    assert shard_history.expected_duration('/test_a') == 10
+
+
+def test__get_shard_history__missing_file__valueerror(tmpdir):
+    path = os.path.join(str(tmpdir), 'history.json')
+
+    with pytest.raises(ValueError):
+        runhistory.get_shard_history(path, 'host')
@@ -6,7 +6,8 @@ Licensed under the MIT license.
 import pytest
 import common.scheduler as scheduler
 import time
-import datetime
+import threading
+from concurrent.futures import Future
 
 
 def test__run_and_wait__1_function_1_worker_exception__result_is_none_and_exception():
@@ -80,6 +81,133 @@ def test__run_and_wait__3_functions_3_worker_500ms_delay__less_than_sequential_d
     assert delay < 3 * wait_time
 
 
+def test__event_scheduler__max_in_flight_above_worker_limit__no_exception():
+    func_scheduler = scheduler.get_event_scheduler(scheduler.MAX_NUM_OF_WORKERS + 1)
+    func_scheduler.add_function(__get_back, 'this')
+    results = func_scheduler.run_and_wait()
+    assert len(results) == 1
+    assert results[0].func_result == 'this'
+
+
+@pytest.mark.parametrize('max_in_flight', [0, scheduler.MAX_NUM_IN_FLIGHT + 1])
+def test__event_scheduler__invalid_max_in_flight__value_error(max_in_flight):
+    with pytest.raises(ValueError):
+        scheduler.get_event_scheduler(max_in_flight)
+
+
+def test__event_scheduler__1_function_exception__result_is_none_and_exception():
+    func_scheduler = scheduler.get_event_scheduler(1)
+    func_scheduler.add_function(__raise_it, Exception)
+    results = func_scheduler.run_and_wait()
+    assert len(results) == 1
+    assert results[0].func_result is None
+    assert isinstance(results[0].exception, Exception)
+
+
+def test__event_scheduler__100_futures_2_workers__all_in_flight_at_once():
+    func_scheduler = scheduler.get_event_scheduler(100, num_of_workers=2)
+    for i in range(0, 100):
+        func_scheduler.add_function(__get_back_later, i, .500)
+    start = time.time()
+    results = func_scheduler.run_and_wait()
+    end = time.time()
+    assert sorted(result.func_result for result in results) == list(range(0, 100))
+    assert end - start < 5 * .500
+
+
+def test__event_scheduler__failed_future__result_is_none_and_exception():
+    func_scheduler = scheduler.get_event_scheduler(2)
+    func_scheduler.add_function(__get_failed_future, ValueError)
+    results = func_scheduler.run_and_wait()
+    assert len(results) == 1
+    assert results[0].func_result is None
+    assert isinstance(results[0].exception, ValueError)
+
+
+def test__event_scheduler__3_functions_1_in_flight__in_sequence():
+    func_scheduler = scheduler.get_event_scheduler(1)
+    func_scheduler.add_function(__get_back_later, 'this1', .100)
+    func_scheduler.add_function(__get_back_later, 'this2', .010)
+    func_scheduler.add_function(__get_back_later, 'this3', .001)
+    results = func_scheduler.run_and_wait()
+    assert [result.func_result for result in results] == ['this1', 'this2', 'this3']
+
+
+def test__event_scheduler__set_max_in_flight__pending_functions_dispatched():
+    func_scheduler = scheduler.get_event_scheduler(1)
+    for i in range(0, 4):
+        func_scheduler.add_function(__get_back_later, i, .200)
+    threading.Timer(.050, func_scheduler.set_max_in_flight, [4]).start()
+    start = time.time()
+    results = func_scheduler.run_and_wait()
+    end = time.time()
+    assert len(results) == 4
+    assert end - start < 4 * .200
+
+
+@pytest.mark.parametrize('get_scheduler', [scheduler.get_scheduler, scheduler.get_event_scheduler])
+def test__run_iter__2_functions__results_yielded_as_completed(get_scheduler):
+    func_scheduler = get_scheduler(2)
+    func_scheduler.add_function(__wait_and_get_back, 'slow', .300)
+    func_scheduler.add_function(__wait_and_get_back, 'fast', .010)
+    results = func_scheduler.run_iter()
+    assert next(results).func_result == 'fast'
+    assert next(results).func_result == 'slow'
+    with pytest.raises(StopIteration):
+        next(results)
+
+
+@pytest.mark.parametrize('get_scheduler', [scheduler.get_scheduler, scheduler.get_event_scheduler])
+def test__run_iter__closed_early__pending_functions_not_executed(get_scheduler):
+    func_scheduler = get_scheduler(1)
+    executed = []
+    for i in range(0, 3):
+        func_scheduler.add_function(__wait_and_append, executed, i, .100)
+    results = func_scheduler.run_iter()
+    next(results)
+    results.close()
+    time.sleep(.300)
+    # The second function may be discarded before it starts
+    assert executed[0] == 0
+    assert 2 not in executed
+
+
+def test__event_scheduler__closed_early__dispatched_functions_not_executed():
+    func_scheduler = scheduler.get_event_scheduler(50, 2)
+    executed = []
+    for i in range(0, 50):
+        func_scheduler.add_function(__wait_and_append, executed, i, .020)
+    results = func_scheduler.run_iter()
+    next(results)
+    results.close()
+    executed_at_close = len(executed)
+    time.sleep(.300)
+    assert len(executed) == executed_at_close
+    assert executed_at_close < 50
+
+
+def __wait_and_append(values, value, time_to_wait):
+    time.sleep(time_to_wait)
+    values.append(value)
+
+
+def __wait_and_get_back(this, time_to_wait):
+    time.sleep(time_to_wait)
+    return this
+
+
+def __get_back_later(this, delay):
+    future = Future()
+    threading.Timer(delay, future.set_result, [this]).start()
+    return future
+
+
+def __get_failed_future(exception):
+    future = Future()
+    future.set_exception(exception())
+    return future
+
+
 def __get_back(this):
     return this
 
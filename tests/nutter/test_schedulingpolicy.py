@@ -0,0 +1,103 @@
+"""
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import pytest
+import common.schedulingpolicy as schedulingpolicy
+from common.runhistory import RunHistory
+
+
+def test__get_expected_durations__no_history__default_duration():
+    durations, unknown = schedulingpolicy.get_expected_durations(None, ['/test_a'])
+
+    assert durations == {'/test_a': schedulingpolicy.DEFAULT_EXPECTED_DURATION}
+    assert unknown == ['/test_a']
+
+
+def test__get_expected_durations__unknown_notebook__median_of_known():
+    history = RunHistory()
+    history.record('/test_a', 10)
+    history.record('/test_b', 20)
+    history.record('/test_c', 90)
+
+    durations, unknown = schedulingpolicy.get_expected_durations(
+        history, ['/test_a', '/test_b', '/test_c', '/test_d'])
+
+    assert durations['/test_a'] == 10
+    assert durations['/test_d'] == 20
+    assert unknown == ['/test_d']
+
+
+def test__order_notebooks__longest_first__descending_durations():
+    durations = {'/test_a': 10, '/test_b': 30, '/test_c': 20}
+
+    ordered = schedulingpolicy.order_notebooks(
+        ['/test_a', '/test_b', '/test_c'], durations, schedulingpolicy.LONGEST_FIRST)
+
+    assert ordered == ['/test_b', '/test_c', '/test_a']
+
+
+def test__order_notebooks__longest_first_same_durations__listing_order():
+    durations = {'/test_a': 10, '/test_b': 10, '/test_c': 10}
+
+    ordered = schedulingpolicy.order_notebooks(
+        ['/test_c', '/test_a', '/test_b'], durations, schedulingpolicy.LONGEST_FIRST)
+
+    assert ordered == ['/test_c', '/test_a', '/test_b']
+
+
+def test__order_notebooks__listing__unchanged():
+    durations = {'/test_a': 10, '/test_b': 30}
+
+    ordered = schedulingpolicy.order_notebooks(['/test_a', '/test_b'], durations)
+
+    assert ordered == ['/test_a', '/test_b']
+
+
+def test__order_notebooks__invalid_policy__valueerror():
+    with pytest.raises(ValueError):
+        schedulingpolicy.order_notebooks(['/test_a'], {'/test_a': 10}, 'shortest')
+
+
+def test__plan__long_notebook_last__makespan_determined_by_long_notebook():
+    durations = {'/test_a': 10, '/test_b': 10, '/test_c': 60}
+
+    schedule_plan = schedulingpolicy.plan(
+        [['/test_a'], ['/test_b'], ['/test_c']], durations, 2)
+
+    assert schedule_plan.makespan == 70
+    assert schedule_plan.total_duration == 80
+
+
+def test__plan__longest_first__lower_makespan():
+    durations = {'/test_a': 10, '/test_b': 10, '/test_c': 60}
+    ordered = schedulingpolicy.order_notebooks(
+        ['/test_a', '/test_b', '/test_c'], durations, schedulingpolicy.LONGEST_FIRST)
+
+    schedule_plan = schedulingpolicy.plan([[path] for path in ordered], durations, 2)
+
+    assert schedule_plan.makespan == 60
+    assert [planned_run.slot for planned_run in schedule_plan.planned_runs] == [0, 1, 1]
+    assert [planned_run.start for planned_run in schedule_plan.planned_runs] == [0, 0, 10]
+
+
+def test__plan__batches__batch_duration_is_longest_notebook():
+    durations = {'/test_a': 10, '/test_b': 30, '/test_c': 20}
+
+    schedule_plan = schedulingpolicy.plan(
+        schedulingpolicy.to_batches(['/test_a', '/test_b', '/test_c'], 2), durations, 1)
+
+    assert [planned_run.duration for planned_run in schedule_plan.planned_runs] == [30, 20]
+    assert schedule_plan.makespan == 50
+
+
+def test__plan__no_batches__makespan_0():
+    schedule_plan = schedulingpolicy.plan([], {}, 2)
+
+    assert schedule_plan.makespan == 0
+
+
+def test__plan__parallelism_0__valueerror():
+    with pytest.raises(ValueError):
+        schedulingpolicy.plan([['/test_a']], {'/test_a': 10}, 0)
@@ -0,0 +1,77 @@
+"""
+Copyright (c) Microsoft Corporation.
+Licensed under the MIT license.
+"""
+
+import pytest
+import common.sharding as sharding
+from common.runhistory import RunHistory
+
+
+@pytest.mark.parametrize('shard, expected', [('1/4', (1, 4)), ('4/4', (4, 4)),
+                                             ((2, 3), (2, 3))])
+def test__parse_shard__valid__index_and_count(shard, expected):
+    assert sharding.parse_shard(shard) == expected
+
+
+@pytest.mark.parametrize('shard', ['0/4', '5/4', '1/0', '1', 'a/4', '1/4/2'])
+def test__parse_shard__invalid__valueerror(shard):
+    with pytest.raises(ValueError):
+        sharding.parse_shard(shard)
+
+
+def test__shard_notebooks__no_history__shards_partition_by_hash():
+    notebook_paths = ['/tests/test_{}'.format(index) for index in range(50)]
+
+    shards = [sharding.shard_notebooks(notebook_paths, index, 4)
+              for index in range(1, 5)]
+
+    assert all(balance == sharding.BY_HASH for _, balance in shards)
+    assert sorted(path for paths, _ in shards for path in paths) == sorted(notebook_paths)
+    assert all(len(paths) > 0 for paths, _ in shards)
+
+
+def test__shard_notebooks__no_history__same_shard_when_notebooks_added():
+    notebook_paths = ['/tests/test_{}'.format(index) for index in range(20)]
+
+    shard, _ = sharding.shard_notebooks(notebook_paths, 2, 3)
+    new_shard, _ = sharding.shard_notebooks(notebook_paths + ['/tests/test_new'], 2, 3)
+
+    assert set(shard) <= set(new_shard)
+
+
+def test__shard_notebooks__history__balanced_by_duration():
+    history = RunHistory()
+    for notebook_path, duration in [('/test_a', 100), ('/test_b', 60), ('/test_c', 50),
+                                    ('/test_d', 40), ('/test_e', 10)]:
+        history.record(notebook_path, duration)
+    notebook_paths = ['/test_a', '/test_b', '/test_c', '/test_d', '/test_e']
+
+    first, balance = sharding.shard_notebooks(notebook_paths, 1, 2, history)
+    second, _ = sharding.shard_notebooks(notebook_paths, 2, 2, history)
+
+    assert balance == sharding.BY_DURATION
+    assert first == ['/test_a', '/test_d']
+    assert second == ['/test_b', '/test_c', '/test_e']
+
+
+def test__shard_notebooks__partial_history__unknown_notebooks_take_median():
+    history = RunHistory()
+    history.record('/test_a', 30)
+    history.record('/test_b', 10)
+    history.record('/test_c', 20)
+    notebook_paths = ['/test_a', '/test_b', '/test_c', '/test_d']
+
+    first, _ = sharding.shard_notebooks(notebook_paths, 1, 2, history)
+    second, _ = sharding.shard_notebooks(notebook_paths, 2, 2, history)
+
+    assert first == ['/test_a', '/test_b']
+    assert second == ['/test_c', '/test_d']
+
+
+def test__shard_notebooks__one_shard__all_notebooks_in_order():
+    notebook_paths = ['/test_b', '/test_a']
+
+    shard, _ = sharding.shard_notebooks(notebook_paths, 1, 1)
+
+    assert shard == notebook_paths
@@ -74,6 +74,17 @@ def test__exit__valid_test_results__serializes_test_results_and_passes_to_dbutil
     assert True == dbutils_stub.notebook.exit_called
     assert serialized_data == dbutils_stub.notebook.data_passed
 
+def test__exit__compression_zlib__compressed_results_passed_to_dbutils_exit():
+    test_results = TestResults()
+    test_results.append(TestResult("test1", True, 10, []))
+    test_exec_result = TestExecResults(test_results)
+    dbutils_stub = DbUtilsStub()
+
+    test_exec_result.exit(dbutils_stub, compression='zlib')
+
+    assert dbutils_stub.notebook.data_passed.startswith('!')
+    assert TestResults().deserialize(dbutils_stub.notebook.data_passed) == test_results
+
 class DbUtilsStub:
     def __init__(self):
         self.notebook = NotebookStub()
@@ -9,7 +9,7 @@ import pickle
 
 import mock
 import pytest
-from common.testresult import TestResult, TestResults
+from common.testresult import TestResult, TestResults, SerializedTestException
 from py4j.protocol import Py4JError, Py4JJavaError
 
 
@@ -143,12 +143,43 @@ def test__total_execution_time__5_test_cases__is_sum_of_execution_times():
     # Act / Assert
     assert 32.990534 == test_results.total_execution_time
 
-def test__serialize__result_data__is_base64_str():
+def test__serialize__result_data__is_versioned_json():
     test_results = TestResults()
+    test_results.append(TestResult("Test Name", False, 1.5, ['tag'], ValueError("Error"), 'trace'))
+
     serialized_data = test_results.serialize()
-    serialized_bin_data = base64.encodebytes(pickle.dumps(test_results))
-    
-    assert serialized_data == str(serialized_bin_data, "utf-8")
+
+    assert json.loads(serialized_data) == {
+        'version': 1,
+        'results': [['Test Name', False, 1.5, ['tag'], ['ValueError', 'Error'], 'trace']]}
+
+
+def test__deserialize__custom_exception__type_name_and_message_kept():
+    test_results = TestResults()
+    test_results.append(TestResult("Test Name", False, 1, [], CustomTestError("Error")))
+
+    deserialized_data = TestResults().deserialize(test_results.serialize())
+    exception = deserialized_data.results[0].exception
+
+    assert isinstance(exception, SerializedTestException)
+    assert exception.__class__.__name__ == 'CustomTestError'
+    assert str(exception) == 'Error'
+    assert deserialized_data == TestResults().deserialize(test_results.serialize())
+
+
+def test__deserialize__key_error__message_kept():
+    test_results = TestResults()
+    test_results.append(TestResult("Test Name", False, 1, [], KeyError('key')))
+
+    deserialized_data = TestResults().deserialize(test_results.serialize())
+
+    assert str(deserialized_data.results[0].exception) == "'key'"
+    assert deserialized_data.results[0].exception.__class__.__name__ == 'KeyError'
+
+
+def test__deserialize__unsupported_version__throws_valueerror():
+    with pytest.raises(ValueError):
+        TestResults().deserialize('{"version":99,"results":[]}')
 
 
 def test__deserialize__data_is_base64_str__can_deserialize():
@@ -160,6 +191,145 @@ def test__deserialize__data_is_base64_str__can_deserialize():
     assert test_results == test_results_from_data
 
 
+def test__deserialize__pickle_of_previous_versions__can_deserialize(mocker):
+    class PreviousTestResult(object):
+        def __init__(self, test_name, passed, execution_time, tags):
+            self.passed = passed
+            self.exception = None
+            self.stack_trace = ''
+            self.test_name = test_name
+            self.execution_time = execution_time
+            self.tags = tags
+
+    test_results = TestResults()
+    test_results.results.append(PreviousTestResult('case', True, 10, ['tag']))
+    # The previous TestResult had a __dict__
+    mocker.patch('common.testresult.TestResult', PreviousTestResult)
+    PreviousTestResult.__module__ = 'common.testresult'
+    PreviousTestResult.__qualname__ = 'TestResult'
+    serialized_bin_data = pickle.dumps(test_results)
+    mocker.stopall()
+    serialized_str = str(base64.encodebytes(serialized_bin_data), "utf-8")
+
+    test_results_from_data = TestResults().deserialize(serialized_str)
+
+    test_result = test_results_from_data.results[0]
+    assert isinstance(test_result, TestResult)
+    assert test_result == TestResult('case', True, 10, ['tag'])
+    assert test_result.tags == ['tag']
+
+
+def test__testresult__slots__no_dict():
+    test_result = TestResult('case', True, 10, [])
+
+    assert not hasattr(test_result, '__dict__')
+
+
+def test__eq__same_results_in_other_order__are_equal():
+    test_results = TestResults()
+    test_results.append(TestResult("case1", True, 10, []))
+    test_results.append(TestResult("case2", False, 10, [], AssertionError('failed')))
+    other = TestResults()
+    other.append(TestResult("case2", False, 10, [], AssertionError('failed')))
+    other.append(TestResult("case1", True, 10, []))
+
+    assert test_results == other
+
+
+def test__eq__same_names_other_exception_message__are_not_equal():
+    test_results = TestResults()
+    test_results.append(TestResult("case1", False, 10, [], AssertionError('failed')))
+    other = TestResults()
+    other.append(TestResult("case1", False, 10, [], AssertionError('other')))
+
+    assert test_results != other
+
+
+def test__merge__two_test_results__results_and_counters_merged():
+    test_results = TestResults()
+    test_results.append(TestResult("case1", True, 10, []))
+    other = TestResults()
+    other.append(TestResult("case2", False, 5, []))
+    other.append(TestResult("case3", True, 1, []))
+
+    test_results.merge(other)
+
+    assert [result.test_name for result in test_results.results] == \
+        ['case1', 'case2', 'case3']
+    assert test_results.test_cases == 3
+    assert test_results.num_failures == 1
+    assert test_results.total_execution_time == 16
+    assert not test_results.passed()
+
+
+def test__merge__not_testresults__throws_error():
+    with pytest.raises(TypeError):
+        TestResults().merge([TestResult("case1", True, 10, [])])
+
+
+def test__passed__no_failures__true():
+    test_results = TestResults()
+    test_results.append(TestResult("case1", True, 10, []))
+
+    assert test_results.passed()
+
+
+class CustomTestError(Exception):
+    pass
+
+
+@pytest.mark.parametrize('compression', ['zlib', True])
+def test__serialize__compression_zlib__smaller_and_deserializable(compression):
+    test_results = _get_test_results_with_stack_traces(100)
+
+    serialized_data = test_results.serialize(compression)
+
+    assert serialized_data.startswith('!')
+    assert len(serialized_data) < len(test_results.serialize()) / 2
+    assert TestResults().deserialize(serialized_data) == test_results
+
+
+def test__serialize__compression_zstd__deserializable():
+    pytest.importorskip('zstandard')
+    test_results = _get_test_results_with_stack_traces(100)
+
+    serialized_data = test_results.serialize('zstd')
+
+    assert serialized_data.startswith('~')
+    assert TestResults().deserialize(serialized_data) == test_results
+
+
+def test__serialize__compression_zstd_not_installed__zlib(mocker):
+    mocker.patch('common.testresult.zstandard', None)
+    test_results = _get_test_results_with_stack_traces(1)
+
+    serialized_data = test_results.serialize('zstd')
+
+    assert serialized_data.startswith('!')
+
+
+def test__serialize__invalid_compression__throws_valueerror():
+    with pytest.raises(ValueError):
+        TestResults().serialize('lzma')
+
+
+def test__deserialize__zstd_not_installed__throws_valueerror(mocker):
+    mocker.patch('common.testresult.zstandard', None)
+
+    with pytest.raises(ValueError):
+        TestResults().deserialize('~KLUv/QBYAQAA')
+
+
+def _get_test_results_with_stack_traces(test_cases):
+    test_results = TestResults()
+    stack_trace = '\n'.join('  File "/databricks/python/lib/module_{}.py", line {}, in test'
+                             .format(line, line * 10) for line in range(20))
+    for index in range(0, test_cases):
+        test_results.append(TestResult('test_case_{}'.format(index), False, 0.01, ['tag'],
+                                       AssertionError('Expected failure'), stack_trace))
+    return test_results
+
+
 def get_mock_gateway_client():
     mock_client = mock.Mock()
     mock_client.send_command.return_value = "0"